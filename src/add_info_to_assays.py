@@ -72,7 +72,8 @@ if globals().get('out_file', None) is None:
     out_file += '.assay.pickle'
     
 # %%
-from util import load_pickle, save_pickle
+from util import save_pickle
+from assay import load_assays
 import pandas as pd
 import re
 
@@ -108,7 +109,7 @@ assays = []
 for assay_file in assay_files:
     logging.info('loading assays: ' + assay_file)  
     
-    assay_data = load_pickle(assay_file)
+    assay_data = load_assays(assay_file)
     assays.extend(assay_data)
     
     logging.info('assays loaded: {0}, {1} spectra' \
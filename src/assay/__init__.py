@@ -1,2 +1,3 @@
 from .assay import AssayBuilder
 from .glycoassay import GlycoAssayBuilder
+from .collection import Assay, AssayCollection, load_assays
@@ -1,9 +1,12 @@
+import numpy as np
+
 from assay import AssayBuilder
+from pepmass.cache import LRUCache, cache_key
 
 class SpectrumAnnotator():
     def __init__(self, assay_builder=None,
                  tolerance=20, tolerance_unit='ppm', 
-                 criteria='mostintense'):
+                 criteria='mostintense', cache_size=1024):
         if assay_builder is None:
             assay_builder = AssayBuilder()
         self.assay_builder = assay_builder
@@ -12,20 +15,71 @@ class SpectrumAnnotator():
         self.tolerance_unit = tolerance_unit
         self.criteria = criteria
 
+        if cache_size is not None and cache_size > 0:
+            self.cache = LRUCache(maxsize=cache_size)
+        else:
+            self.cache = None
+
+
+    def cache_info(self):
+        if self.cache is None:
+            return None
+        return self.cache.info()
+
+
+    def clear_cache(self, reset_stats=False):
+        if self.cache is not None:
+            self.cache.clear(reset_stats=reset_stats)
+
+
+    def theoretical_fragments(self, sequence, modification=None, **kwargs):
+        # the theoretical fragments and their tolerance windows depend only
+        # on the peptide, glycan and fragment settings, so they are shared 
+        # by all the spectra of the same precursor; cached values must not
+        # be modified
+        key = None
+        if self.cache is not None:
+            try:
+                key = cache_key((sequence, modification, kwargs))
+            except TypeError:
+                pass
+        if key is not None:
+            result = self.cache.get(key, None, name='theoretical_fragments')
+            if result is not None:
+                return result
+
+        theoretical = self.assay_builder.theoretical_fragments(
+            sequence=sequence, 
+            modification=modification,
+            **kwargs
+        )
+        mz = theoretical['fragments']['fragmentMZ']
+        lower, upper = mz_tolerance_range(
+            mz, self.tolerance, self.tolerance_unit
+        )
+        lower.flags.writeable = False
+        upper.flags.writeable = False
+        result = theoretical, mz, lower, upper
+
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+
+
     def annotate(self, spectrum, sequence, modification=None, 
                  **kwargs):
-        theoretical = self.assay_builder.theoretical_fragments(
+        theoretical, mz, lower, upper = self.theoretical_fragments(
             sequence=sequence, 
             modification=modification,
             **kwargs
         )
-        index = match_fragments(
-            theoretical, spectrum, 
+        index = PeakMatcher(
+            spectrum,
             tolerance=self.tolerance,
             tolerance_unit=self.tolerance_unit,
             criteria=self.criteria,
-            all1=False, all2=True
-        )
+            ms_level=2
+        ).match_ranges(mz, lower, upper, all1=False, all2=True)
         
         spectrum['fragments'] = spectrum['fragments'].copy()
         for k, v in theoretical['fragments'].items():
@@ -45,77 +99,173 @@ class SpectrumAnnotator():
             
         
         
-def match_peaks(spectrum1, spectrum2, 
-                tolerance, tolerance_unit='ppm', 
-                criteria='mostintense',
-                all1=False, all2=False,
-                ms_level=1):    
+def get_peak_keys(ms_level=1):
     if ms_level == 2:
-        peaks_key = 'fragments'
-        mz_key = 'fragmentMZ'
-        intensity_key = 'fragmentIntensity'
+        return 'fragments', 'fragmentMZ', 'fragmentIntensity'
     else:
-        peaks_key = 'peaks'
-        mz_key = 'mz'
-        intensity_key = 'intensity'
-    
+        return 'peaks', 'mz', 'intensity'
+
+
+def mz_tolerance_range(mz, tolerance, tolerance_unit='ppm'):
+    mz = np.asarray(mz)
     if tolerance_unit == 'ppm':
-        def mz_tolerance_range(mz, tolerance):        
-            return (
-                mz * (1 - tolerance * 1e-6),
-                mz * (1 + tolerance * 1e-6)
-            )
+        return (
+            mz * (1 - tolerance * 1e-6),
+            mz * (1 + tolerance * 1e-6)
+        )
     elif tolerance_unit == 'Da':
-        def mz_tolerance_range(mz, tolerance):        
-            return (
-                mz - tolerance,
-                mz + tolerance
-            )
+        return (
+            mz - tolerance,
+            mz + tolerance
+        )
     else:
         raise ValueError('invalid tolerance unit: ' + str(tolerance_unit))
-        
-    if criteria == 'mostintense':
-        def choose_first(target_index, target_mz, 
-                         index1, mz1, index2, mz2):
-            intensity = spectrum2[peaks_key].get(intensity_key, None)
-            if intensity is not None:
-                return intensity[index1] >= intensity[index2]
+
+
+def get_strong_dtype(values):
+    if isinstance(values, np.ndarray):
+        return values.dtype
+    if len(values) > 0 and isinstance(values[0], np.generic):
+        return np.asarray(values).dtype
+    return None
+
+
+class PeakMatcher():
+    def __init__(self, spectrum, 
+                 tolerance, tolerance_unit='ppm', 
+                 criteria='mostintense',
+                 ms_level=1):
+        if tolerance_unit not in {'ppm', 'Da'}:
+            raise ValueError('invalid tolerance unit: ' + str(tolerance_unit))
+        if criteria not in {'mostintense', 'nearst'}:
+            raise ValueError('invalid criteria: ' + str(criteria))
+
+        self.tolerance = tolerance
+        self.tolerance_unit = tolerance_unit
+        self.criteria = criteria
+        self.ms_level = ms_level
+
+        peaks_key, mz_key, intensity_key = get_peak_keys(ms_level)
+        self.mz = spectrum[peaks_key][mz_key]
+        self.intensity = spectrum[peaks_key].get(intensity_key, None)
+
+        # comparisons follow NumPy scalar promotion: a list holds Python 
+        # floats that take the dtype of the array on the other side
+        self.dtype = get_strong_dtype(self.mz)
+
+        mz = np.asarray(self.mz, dtype=np.float64)
+        order = np.argsort(mz, kind='mergesort')
+        self.order = order[~np.isnan(mz[order])]
+        self.sorted_mz = mz[self.order]
+        self.sorted_mz_cache = {}
+
+
+    def __len__(self):
+        return len(self.mz)
+
+
+    def choose_first(self, target_mz, index1, index2):
+        if self.criteria == 'mostintense':
+            if self.intensity is not None:
+                return self.intensity[index1] >= self.intensity[index2]
             else:
-                False
-    elif criteria == 'nearst':
-        def choose_first(target_index, target_mz, 
-                         index1, mz1, index2, mz2):
-            return abs(mz1 - target_mz) <= abs(mz2 - target_mz)
-    else:
-        raise ValueError('invalid criteria: ' + str(criteria))
-    
-    index = []
-    used = set()
-    for i, x in enumerate(spectrum1[peaks_key][mz_key]):
-        l, r = mz_tolerance_range(x, tolerance)        
-        j0 = None
-        y0 = None
-        for j, y in enumerate(spectrum2[peaks_key][mz_key]): 
-            if y <= r and y >= l and j not in used:
-                if j0 is None or not choose_first(
-                    target_index=i, target_mz=x,
-                    index1=j0, mz1=y0,
-                    index2=j, mz2=y
-                ):
-                    j0 = j
-                    y0 = y
-        if j0 is not None:
-            index.append((i, j0))
-            used.add(j0)
-        elif all1:
-            index.append((i, None))
-        
-    if all2:        
-        for j, y in enumerate(spectrum2[peaks_key][mz_key]): 
-            if j not in used:                
-                index.append((None, j))
-                
-    return index
+                return False
+        else:
+            return abs(self.mz[index1] - target_mz) <= \
+                abs(self.mz[index2] - target_mz)
+
+
+    def get_sorted_mz(self, dtype=None):
+        if self.dtype is None:
+            dtype = dtype or np.float64
+        elif dtype is not None:
+            dtype = np.result_type(self.dtype, dtype)
+        else:
+            dtype = self.dtype
+        dtype = np.dtype(dtype)
+        if dtype.kind != 'f':
+            dtype = np.dtype(np.float64)
+
+        sorted_mz = self.sorted_mz_cache.get(dtype, None)
+        if sorted_mz is None:
+            sorted_mz = self.sorted_mz.astype(dtype)
+            self.sorted_mz_cache[dtype] = sorted_mz
+        return sorted_mz
+
+
+    def match_ranges(self, mz, lower, upper, all1=False, all2=False):
+        sorted_mz = self.get_sorted_mz(get_strong_dtype(mz))
+        start = np.searchsorted(
+            sorted_mz, lower.astype(sorted_mz.dtype), side='left'
+        )
+        end = np.searchsorted(
+            sorted_mz, upper.astype(sorted_mz.dtype), side='right'
+        )
+
+        index = []
+        used = set()
+        for i, x in enumerate(mz):
+            j0 = None
+            if start[i] < end[i]:
+                for j in sorted(self.order[start[i]:end[i]].tolist()):
+                    if j not in used and (j0 is None or \
+                        not self.choose_first(x, j0, j)):
+                        j0 = j
+            if j0 is not None:
+                index.append((i, j0))
+                used.add(j0)
+            elif all1:
+                index.append((i, None))
+
+        if all2:
+            for j in range(len(self.mz)):
+                if j not in used:
+                    index.append((None, j))
+
+        return index
+
+
+    def match(self, spectrum, all1=False, all2=False):
+        peaks_key, mz_key, _ = get_peak_keys(self.ms_level)
+        mz = spectrum[peaks_key][mz_key]
+        lower, upper = mz_tolerance_range(
+            mz, self.tolerance, self.tolerance_unit
+        )
+        return self.match_ranges(
+            mz, lower, upper,
+            all1=all1, all2=all2
+        )
+
+
+def match_peaks(spectrum1, spectrum2, 
+                tolerance, tolerance_unit='ppm', 
+                criteria='mostintense',
+                all1=False, all2=False,
+                ms_level=1):    
+    return PeakMatcher(
+        spectrum2, 
+        tolerance=tolerance, tolerance_unit=tolerance_unit,
+        criteria=criteria, ms_level=ms_level
+    ).match(spectrum1, all1=all1, all2=all2)
+
+
+def match_peaks_batch(spectrum1, spectra2, 
+                      tolerance, tolerance_unit='ppm', 
+                      criteria='mostintense',
+                      all1=False, all2=False,
+                      ms_level=1):
+    peaks_key, mz_key, _ = get_peak_keys(ms_level)
+    mz = spectrum1[peaks_key][mz_key]
+    lower, upper = mz_tolerance_range(mz, tolerance, tolerance_unit)
+
+    return [
+        PeakMatcher(
+            spectrum2, 
+            tolerance=tolerance, tolerance_unit=tolerance_unit,
+            criteria=criteria, ms_level=ms_level
+        ).match_ranges(mz, lower, upper, all1=all1, all2=all2)
+        for spectrum2 in spectra2
+    ]
 
 
 def match_fragments(spectrum1, spectrum2, 
@@ -129,6 +279,19 @@ def match_fragments(spectrum1, spectrum2,
         all1=all1, all2=all2,
         ms_level=2
     )
+
+
+def match_fragments_batch(spectrum1, spectra2, 
+                          tolerance, tolerance_unit='ppm', 
+                          criteria='mostintense',
+                          all1=False, all2=False):
+    return match_peaks_batch(
+        spectrum1, spectra2, 
+        tolerance, tolerance_unit=tolerance_unit, 
+        criteria=criteria,
+        all1=all1, all2=all2,
+        ms_level=2
+    )
         
             
                 
@@ -1,9 +1,32 @@
-import copy
 import numpy as np
 import itertools
+from collections import OrderedDict
 
 from pepmass import ModifiedPeptideMassCalculator
 
+class FragmentIndexView():
+    __slots__ = ('values', 'index')
+
+    def __init__(self, values, index):
+        if isinstance(values, FragmentIndexView):
+            index = [values.index[i] for i in index]
+            values = values.values
+        self.values = values
+        self.index = index
+
+
+    def __len__(self):
+        return len(self.index)
+
+
+    def __getitem__(self, i):
+        return self.values[self.index[i]]
+
+
+    def __iter__(self):
+        return (self.values[i] for i in self.index)
+
+
 class AssayBuilder():
     def __init__(self,
                  mass_calculator=None,
@@ -62,13 +85,6 @@ class AssayBuilder():
                 ('-' + loss if loss is not None and loss != 'noloss' else '') + \
                 '^+' + str(charge)
 
-        fragment_mz = []
-        fragment_type = []
-        fragment_number = []
-        fragment_charge = []
-        fragment_loss_type = []
-        fragment_annotation = []
-
         frag_type = kwargs.pop('fragment_type', None)
         if frag_type is None:
             frag_type = list(self.fragment_types)
@@ -98,11 +114,11 @@ class AssayBuilder():
             if isinstance(frag_charge, int):
                 frag_charge = [frag_charge]
             frag_charge = [
-                x for x in fragment_charge
+                x for x in frag_charge
                 if x in self.fragment_charges
             ]
 
-        peptide_fragments = self.mass_calculator.fragment_mz(
+        peptide_fragments = self.mass_calculator.fragment_ions(
             sequence=sequence,
             modification=modification,
             fragment_type=frag_type,
@@ -111,36 +127,31 @@ class AssayBuilder():
             **kwargs
         )
 
-        for x in peptide_fragments:
-            frgtype = x['fragment_type']
-            frglossTpye = x['loss']
-            frgcharge = x['charge']
-            frgmz = x['fragment_mz']
-            frgnum = [i + 1 for i, x in enumerate(frgmz) if x is not None]
-            frgmz = [frgmz[i - 1] for i in frgnum]
-            frgannot = [
-                get_fragment_annotation(
-                    fragment_type=frgtype,
-                    fragment_number=i,
-                    loss=frglossTpye,
-                    charge=frgcharge
+        fragment_type = peptide_fragments['fragmentType'].tolist()
+        fragment_number = peptide_fragments['fragmentNumber'].tolist()
+        fragment_charge = peptide_fragments['fragmentCharge'].tolist()
+        fragment_loss_type = peptide_fragments['fragmentLossType'].tolist()
+        annotation_suffix = {}
+        for l, c in zip(fragment_loss_type, fragment_charge):
+            if (l, c) not in annotation_suffix:
+                annotation_suffix[(l, c)] = get_fragment_annotation(
+                    fragment_type='', fragment_number=None, 
+                    loss=l, charge=c
                 )
-                for i in frgnum
-            ]
-
-            fragment_mz.extend(frgmz)
-            fragment_number.extend(frgnum)
-            fragment_type.extend([frgtype] * len(frgnum))
-            fragment_charge.extend([frgcharge] * len(frgnum))
-            fragment_loss_type.extend([frglossTpye] * len(frgnum))
-            fragment_annotation.extend(frgannot)
+        fragment_annotation = [
+            t + str(n) + annotation_suffix[(l, c)]
+            for t, n, c, l in zip(
+                fragment_type, fragment_number,
+                fragment_charge, fragment_loss_type
+            )
+        ]
 
         result = {
             'peptideSequence': sequence,
             'modification': modification,
 
             'fragments': {
-                'fragmentMZ': fragment_mz,
+                'fragmentMZ': peptide_fragments['fragmentMZ'].tolist(),
                 'fragmentType': fragment_type,
                 'fragmentNumber': fragment_number,
                 'fragmentCharge': fragment_charge,
@@ -169,76 +180,156 @@ class AssayBuilder():
         return assay
 
 
-    def update_fragment_mz(self, assay, **kwargs):
+    def update_precursor_mz_batch(self, assays):
+        precursor_mz = self.mass_calculator.precursor_mz_array(
+            sequence=[x['peptideSequence'] for x in assays],
+            modification=[x.get('modification', None) for x in assays],
+            charge=[int(x['precursorCharge']) for x in assays]
+        )
+
+        for assay, mz in zip(assays, precursor_mz.tolist()):
+            assay.update({
+                'precursorMZ': mz
+            })
+        return assays
+
+
+    def get_fragment_mz_map(self, fragments):
+        fragment_mz_map = {}
+        for i, x in enumerate(fragments):
+            fragment_mz_map.setdefault(
+                (x['fragment_type'], x['charge'], x.get('loss', 'noloss')),
+                (i, x)
+            )
+        return fragment_mz_map
+
+
+    def find_fragment_mz(self, fragment_mz_map, fragment_type,
+                         fragment_charge, fragment_loss_type):
+        x = fragment_mz_map.get(
+            (fragment_type, fragment_charge, fragment_loss_type), None
+        )
+        if fragment_loss_type == '' or fragment_loss_type is None:
+            y = fragment_mz_map.get(
+                (fragment_type, fragment_charge, 'noloss'), None
+            )
+            if x is None or y is not None and y[0] < x[0]:
+                x = y
+        if x is None:
+            raise ValueError('fragment not found: ' + str(fragment_type))
+        return x[1]
+
+
+    def peptide_fragment_mz(self, assay, fragment_index=None, **kwargs):
         sequence = assay['peptideSequence']
         modification = assay.get('modification', None)
 
-        fragments = copy.deepcopy(assay['fragments'])
-        fragment_type = fragments['fragmentType']
-        fragment_number = fragments['fragmentNumber']
-        fragment_charge = fragments['fragmentCharge']
-        fragment_loss_type = fragments['fragmentLossType']
+        fragments = assay['fragments']
+        if fragment_index is None:
+            fragment_index = range(len(fragments['fragmentType']))
+        fragment_type = [fragments['fragmentType'][i] for i in fragment_index]
+        fragment_number = [
+            fragments['fragmentNumber'][i] for i in fragment_index
+        ]
+        fragment_charge = [
+            fragments['fragmentCharge'][i] for i in fragment_index
+        ]
+        fragment_loss_type = [
+            fragments['fragmentLossType'][i] for i in fragment_index
+        ]
 
-        fragment_types = list(set(fragment_type) \
-            .intersection(self.fragment_types))
-        if len(fragment_types) > 0:
-            peptide_fragments = self.mass_calculator.fragment_mz(
+        for x in fragment_type:
+            if x not in self.fragment_types:
+                raise ValueError('fragment not found: ' + str(x))
+
+        # the ion series are computed by the compiled loss engine and
+        # converted to m/z once per (type, charge, loss)
+        if len(fragment_type) > 0:
+            series = self.mass_calculator.fragment_ion_series(
                 sequence=sequence,
                 modification=modification,
-                fragment_type=fragment_types,
-                loss=list(set(fragment_loss_type)),
-                charge=list(set(fragment_charge)),
+                fragment_type=list(OrderedDict.fromkeys(fragment_type)),
+                loss=list(OrderedDict.fromkeys(fragment_loss_type)),
                 **kwargs
             )
         else:
-            peptide_fragments = []
-
-        fragment_mz = []
-        for i, _ in enumerate(fragment_type):
-            if fragment_type[i] not in self.fragment_types:
-                raise ValueError('fragment not found: ' + fragment_type[i])
-
-            mz = None
-            for x in peptide_fragments:
-                if x['fragment_type'] == fragment_type[i] and \
-                    x['charge'] == fragment_charge[i] and \
-                    (x['loss'] == fragment_loss_type[i] or \
-                     x['loss'] == 'noloss' and (fragment_loss_type[i] == '' or fragment_loss_type[i] is None)):
-                    mz = x['fragment_mz'][fragment_number[i] - 1]
-                    fragment_mz.append(mz)
-                    if mz is None:
-                        mz = 0
-                    break
-            if mz is None:
-                raise ValueError('fragment not found: ' + fragment_type[i])
-
-        assay['fragments'].update({
-            'fragmentMZ': fragment_mz
-        })
+            series = []
+
+        series_map = {}
+        for t, l, mw in series:
+            series_map.setdefault((t, l), mw)
+        proton_mass = self.mass_calculator.element_mass('proton')
+
+        ion_index = {}
+        for i, key in enumerate(zip(
+            fragment_type, fragment_charge, fragment_loss_type
+        )):
+            ion_index.setdefault(key, []).append(i)
+
+        fragment_mz = [None] * len(fragment_type)
+        for (t, c, l), index in ion_index.items():
+            mw = series_map.get((t, l), None)
+            if mw is None and (l == '' or l is None):
+                mw = series_map.get((t, 'noloss'), None)
+            if mw is None:
+                raise ValueError('fragment not found: ' + str(t))
+
+            number = np.asarray([fragment_number[i] for i in index]) - 1
+            mz = (mw[number] + c * proton_mass) / c
+            for i, x in zip(index, mz.tolist()):
+                fragment_mz[i] = x if x == x else None
+
+        return fragment_mz
+
+
+    def update_fragment_mz(self, assay, inplace=False, **kwargs):
+        fragment_mz = self.peptide_fragment_mz(assay, **kwargs)
+
+        if not inplace:
+            assay = assay.copy()
+            assay['fragments'] = assay['fragments'].copy()
+        assay['fragments']['fragmentMZ'] = fragment_mz
         return assay
 
 
-    def filter_fragments_by_index(self, assay, fragment_index, invert=False):
-        assay = copy.deepcopy(assay)
-
+    def filter_fragments_by_index(self, assay, fragment_index, invert=False,
+                                  return_view=False):
+        fragment_count = len(assay['fragments']['fragmentType'])
         if invert:
-            fragment_index = set(fragment_index)
-            for k, v in assay['fragments'].items():
-                assay['fragments'][k] = [
-                    x for i, x in enumerate(v)
-                    if i not in fragment_index
-                ]
+            fragment_mask = np.ones(fragment_count, dtype=bool)
+            fragment_mask[np.array(list(fragment_index), dtype=int)] = False
+            fragment_index = np.flatnonzero(fragment_mask).tolist()
         else:
-            for k, v in assay['fragments'].items():
-                assay['fragments'][k] = [v[i] for i in fragment_index]
+            fragment_index = list(fragment_index)
+
+        fragments = {}
+        for k, v in assay['fragments'].items():
+            if isinstance(v, np.ndarray):
+                fragments[k] = v[np.array(fragment_index, dtype=int)]
+            elif return_view:
+                fragments[k] = FragmentIndexView(v, fragment_index)
+            else:
+                fragments[k] = [v[i] for i in fragment_index]
 
+        assay = assay.copy()
+        assay['fragments'] = fragments
         return assay
 
 
+    def get_fragment_mask(self, assay, fragment_index):
+        fragment_mask = np.zeros(
+            len(assay['fragments']['fragmentType']), dtype=bool
+        )
+        fragment_mask[np.array(list(fragment_index), dtype=int)] = True
+        return fragment_mask
+
+
     def filter_fragments_by_type(self, assay, fragment_type=None,
                                  return_index=False):
         if fragment_type == None:
             fragment_type = self.fragment_types
+        if not isinstance(fragment_type, str):
+            fragment_type = set(fragment_type)
 
         fragment_index = [
             i
@@ -337,14 +428,25 @@ class AssayBuilder():
             )
 
 
+    def find_isolation_windows(self, swath_windows, precursor_mz):
+        start = np.asarray(swath_windows['start'])
+        end = np.asarray(swath_windows['end'])
+        isolation_window_index = np.where(
+            (start < precursor_mz) & (end > precursor_mz)
+        )[0]
+        return list(zip(
+            start[isolation_window_index].tolist(),
+            end[isolation_window_index].tolist()
+        ))
+
+
     def exclude_fragments_in_isolation_window(
             self, assay, swath_windows, return_index=False):
         precursor_mz = assay['precursorMZ']
-        isolation_window_index = np.where(
-            (swath_windows['start'] < precursor_mz) & \
-            (swath_windows['end'] > precursor_mz)
-        )[0]
-        if len(isolation_window_index) == 0:
+        isolation_windows = self.find_isolation_windows(
+            swath_windows, precursor_mz
+        )
+        if len(isolation_windows) == 0:
             if not return_index:
                 return assay
             else:
@@ -355,11 +457,11 @@ class AssayBuilder():
         exclude = set(itertools.chain.from_iterable((
             self.filter_fragments_by_mz(
                 assay,
-                min_mz=swath_windows['start'][i],
-                max_mz=swath_windows['end'][i],
+                min_mz=start,
+                max_mz=end,
                 return_index=True
             )
-            for i in isolation_window_index
+            for start, end in isolation_windows
         )))
 
         if not return_index:
@@ -419,90 +521,88 @@ class AssayBuilder():
             )
 
 
-    def filter_fragments(self, assay,
-                         max_fragment_number=None,
-                         fragment_type=None,
-                         fragment_charge=None,
-                         fragment_loss_type=None,
-                         min_fragment_amino_acid_number=None,
-                         min_fragment_mz=None,
-                         max_fragment_mz=None,
-                         swath_windows=None,
-                         min_relative_fragment_intensity=None,
-                         return_index=False):
-        fragment_index = None
+    def iter_fragment_criteria(self, assay,
+                               fragment_type=None,
+                               fragment_charge=None,
+                               fragment_loss_type=None,
+                               min_fragment_amino_acid_number=None,
+                               min_fragment_mz=None,
+                               max_fragment_mz=None,
+                               swath_windows=None):
         if fragment_type is not None:
-            fragment_index_1 = self.filter_fragments_by_type(
+            yield self.filter_fragments_by_type(
                 assay, fragment_type,
                 return_index=True
             )
-            if fragment_index is None:
-                fragment_index = set(fragment_index_1)
-            else:
-                fragment_index = fragment_index \
-                    .intersection(fragment_index_1)
 
         if fragment_charge is not None:
-            fragment_index_1 = self.filter_fragments_by_charge(
+            yield self.filter_fragments_by_charge(
                 assay, fragment_charge,
                 return_index=True
             )
-            if fragment_index is None:
-                fragment_index = set(fragment_index_1)
-            else:
-                fragment_index = fragment_index \
-                    .intersection(fragment_index_1)
 
         if fragment_loss_type is not None:
-            fragment_index_1 = self.filter_fragments_by_loss_type(
+            yield self.filter_fragments_by_loss_type(
                 assay, fragment_loss_type,
                 return_index=True
             )
-            if fragment_index is None:
-                fragment_index = set(fragment_index_1)
-            else:
-                fragment_index = fragment_index \
-                    .intersection(fragment_index_1)
 
         if min_fragment_amino_acid_number is not None:
-            fragment_index_1 = self.filter_fragments_by_amino_acid_number(
+            yield self.filter_fragments_by_amino_acid_number(
                 assay,
                 min_amino_acid_number=min_fragment_amino_acid_number,
                 return_index=True
             )
-            if fragment_index is None:
-                fragment_index = set(fragment_index_1)
-            else:
-                fragment_index = fragment_index \
-                    .intersection(fragment_index_1)
 
         if min_fragment_mz is not None or \
             max_fragment_mz is not None:
-            fragment_index_1 = self.filter_fragments_by_mz(
+            yield self.filter_fragments_by_mz(
                 assay, min_mz=min_fragment_mz, max_mz=max_fragment_mz,
                 return_index=True
             )
-            if fragment_index is None:
-                fragment_index = set(fragment_index_1)
-            else:
-                fragment_index = fragment_index \
-                    .intersection(fragment_index_1)
 
         if swath_windows is not None:
-            fragment_index_1 = self.exclude_fragments_in_isolation_window(
+            yield self.exclude_fragments_in_isolation_window(
                 assay, swath_windows=swath_windows,
                 return_index=True
             )
-            if fragment_index is None:
-                fragment_index = set(fragment_index_1)
+
+
+    def filter_fragments(self, assay,
+                         max_fragment_number=None,
+                         fragment_type=None,
+                         fragment_charge=None,
+                         fragment_loss_type=None,
+                         min_fragment_amino_acid_number=None,
+                         min_fragment_mz=None,
+                         max_fragment_mz=None,
+                         swath_windows=None,
+                         min_relative_fragment_intensity=None,
+                         return_index=False):
+        fragment_mask = None
+        for fragment_index_1 in self.iter_fragment_criteria(
+            assay,
+            fragment_type=fragment_type,
+            fragment_charge=fragment_charge,
+            fragment_loss_type=fragment_loss_type,
+            min_fragment_amino_acid_number=min_fragment_amino_acid_number,
+            min_fragment_mz=min_fragment_mz,
+            max_fragment_mz=max_fragment_mz,
+            swath_windows=swath_windows
+        ):
+            mask = self.get_fragment_mask(assay, fragment_index_1)
+            if fragment_mask is None:
+                fragment_mask = mask
             else:
-                fragment_index = fragment_index \
-                    .intersection(fragment_index_1)
+                fragment_mask &= mask
 
-        if fragment_index is not None:
-            fragment_index = list(fragment_index)
-            assay_1 = self.filter_fragments_by_index(assay, fragment_index)
+        if fragment_mask is not None:
+            fragment_index = np.flatnonzero(fragment_mask).tolist()
+            assay_1 = self.filter_fragments_by_index(
+                assay, fragment_index, return_view=True
+            )
         else:
+            fragment_index = None
             assay_1 = assay
 
         if max_fragment_number is not None or \
@@ -532,17 +632,15 @@ class AssayBuilder():
 
 
     def select_quantifying_transitions(self, assay, **kwargs):
-        assay = copy.deepcopy(assay)
-
         fragment_index = self.filter_fragments(
             assay, return_index=True,
             **kwargs
         )
 
-        assay['fragments']['quantifyingTransition'] = [
-            i in fragment_index
-            for i in range(0, len(assay['fragments']['fragmentType']))
-        ]
+        assay = assay.copy()
+        assay['fragments'] = assay['fragments'].copy()
+        assay['fragments']['quantifyingTransition'] = \
+            self.get_fragment_mask(assay, fragment_index).tolist()
         return assay
 
 
@@ -570,11 +668,9 @@ class AssayBuilder():
             if precursor_mz is None:
                 return None
 
-            isolation_window_index = np.where(
-                (swath_windows['start'] < precursor_mz) & \
-                (swath_windows['end'] > precursor_mz)
-            )[0]
-            if len(isolation_window_index) == 0:
+            if len(self.find_isolation_windows(
+                swath_windows, precursor_mz
+            )) == 0:
                 return None
 
         assay = self.filter_fragments(
@@ -595,6 +691,13 @@ class AssayBuilder():
 
 
     def filter_assays(self, assays, return_generator=False, **kwargs):
+        swath_windows = kwargs.get('swath_windows', None)
+        if swath_windows is not None:
+            kwargs['swath_windows'] = {
+                'start': np.asarray(swath_windows['start']),
+                'end': np.asarray(swath_windows['end'])
+            }
+
         result = filter(
             lambda x: x is not None,
             (self.filter_assay(assay, **kwargs)
@@ -607,6 +710,49 @@ class AssayBuilder():
         return result
 
 
+_assay_builders = {}
+
+def _filter_assays_task(task):
+    builder_class = task['builder_class']
+    assay_builder = _assay_builders.get(builder_class, None)
+    if assay_builder is None:
+        assay_builder = builder_class()
+        _assay_builders[builder_class] = assay_builder
+
+    return assay_builder.filter_assays(
+        task['assays'],
+        **task['filter_args']
+    )
+
+
+def filter_assays_parallel(assays, builder_class=AssayBuilder,
+                           processes=None, chunk_size=1000,
+                           return_generator=False, **kwargs):
+    from util import parallel_map, split_chunks
+
+    # chunks are sent to the workers one at a time, and the filtered
+    # chunks are returned in the input order
+    chunks = split_chunks(assays, -(-len(assays) // max(chunk_size, 1)))
+    tasks = (
+        {
+            'builder_class': builder_class,
+            'assays': chunk,
+            'filter_args': kwargs
+        }
+        for chunk in chunks
+    )
+
+    result = itertools.chain.from_iterable(parallel_map(
+        _filter_assays_task, tasks,
+        processes=processes
+    ))
+
+    if not return_generator:
+        result = list(result)
+
+    return result
+
+
 
 
 
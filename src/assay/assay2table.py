@@ -1,4 +1,5 @@
 from .modseq import stringify_modification
+import numpy as np
 import pandas as pd
 from collections import OrderedDict
 
@@ -9,7 +10,7 @@ class AssayToDataFrameConverter:
         self.columns = columns
     
         
-    def assay_to_dataframe(self, assay, **kwargs):
+    def assay_to_dict(self, assay, **kwargs):
         def convert_column(column, assay):
             value = None            
             path = column.get('path', None)
@@ -39,10 +40,14 @@ class AssayToDataFrameConverter:
             default = column.get('default', None)            
             return default
         
-        d = OrderedDict((
+        return OrderedDict((
             (column['name'], convert_column(column, assay))
             for column in self.columns
         ))
+
+
+    def assay_to_dataframe(self, assay, **kwargs):
+        d = self.assay_to_dict(assay, **kwargs)
         if not any((
             isinstance(x, list) or isinstance(x, tuple)
             for x in d.values()
@@ -52,12 +57,81 @@ class AssayToDataFrameConverter:
             return pd.DataFrame.from_dict(d)
         
         
+    def dicts_to_dataframe(self, data, start=0):
+        offsets = np.zeros(len(data) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([get_row_number(d) for d in data])
+
+        names = OrderedDict.fromkeys(
+            column['name'] for column in self.columns
+        )
+        result = OrderedDict()
+        for name in names:
+            values = np.empty(offsets[-1], dtype=object)
+            for d, i, j in zip(data, offsets[:-1], offsets[1:]):
+                values[i:j] = d[name]
+            values = values.tolist()
+
+            # a column that has missing values in any assay is kept as
+            # objects, as concatenating the per-assay frames does; the
+            # dtype is inferred only for columns without missing values
+            if None in values:
+                values = pd.Series(
+                    values, dtype=object,
+                    index=pd.RangeIndex(start, start + offsets[-1])
+                )
+            else:
+                values = pd.Series(
+                    values,
+                    index=pd.RangeIndex(start, start + offsets[-1])
+                )
+            result[name] = values
+
+        return pd.DataFrame(
+            result,
+            index=pd.RangeIndex(start, start + offsets[-1])
+        )
+
+
     def assays_to_dataframe(self, assays, **kwargs):
-        return pd.concat((
-            self.assay_to_dataframe(x, index=i, **kwargs)
+        return self.dicts_to_dataframe([
+            self.assay_to_dict(x, index=i, **kwargs)
             for i, x in enumerate(assays)
-        ), ignore_index=True)
-  
+        ])
+
+
+    def assays_to_dataframe_chunks(self, assays, chunk_size=100000,
+                                   **kwargs):
+        data = []
+        row_number = 0
+        start = 0
+        for i, x in enumerate(assays):
+            d = self.assay_to_dict(x, index=i, **kwargs)
+            n = get_row_number(d)
+            if len(data) > 0 and row_number + n > chunk_size:
+                yield self.dicts_to_dataframe(data, start=start)
+                start += row_number
+                data = []
+                row_number = 0
+
+            data.append(d)
+            row_number += n
+
+        if len(data) > 0:
+            yield self.dicts_to_dataframe(data, start=start)
+
+
+def get_row_number(d):
+    row_number = None
+    for k, v in d.items():
+        if isinstance(v, list) or isinstance(v, tuple) or \
+            isinstance(v, np.ndarray):
+            if row_number is None:
+                row_number = len(v)
+            elif row_number != len(v):
+                raise ValueError('column length mismatch: ' + str(k))
+    if row_number is None:
+        row_number = 1
+    return row_number
 
   
 def default_columns():
@@ -0,0 +1,475 @@
+import json
+import itertools
+import numpy as np
+
+
+def min_int_dtype(data):
+    if len(data) == 0:
+        return np.dtype(np.int8)
+    low, high = data.min(), data.max()
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if low >= info.min and high <= info.max:
+            return np.dtype(dtype)
+    return data.dtype
+
+
+class AssayColumn():
+    def __init__(self, kind, data, null=None, categories=None):
+        self.kind = kind
+        self.data = data
+        self.null = null
+        self.categories = categories
+
+
+    def __len__(self):
+        return len(self.data)
+
+
+    @staticmethod
+    def encode(values):
+        values = list(values)
+        types = set(map(type, values))
+        null = None
+        if type(None) in types:
+            types.discard(type(None))
+            null = np.fromiter(
+                (x is None for x in values),
+                dtype=bool, count=len(values)
+            )
+
+        def fill(default):
+            if null is None:
+                return values
+            return [default if x is None else x for x in values]
+
+        if types <= {float}:
+            return AssayColumn(
+                'float', np.array(fill(0.0), dtype=np.float64), null
+            )
+        if types == {bool}:
+            return AssayColumn('bool', np.array(fill(False), dtype=bool), null)
+        if types == {int}:
+            try:
+                data = np.array(fill(0), dtype=np.int64)
+                return AssayColumn(
+                    'int', data.astype(min_int_dtype(data)), null
+                )
+            except OverflowError:
+                pass
+        if len(types) == 1 and null is None:
+            scalar_type = next(iter(types))
+            if issubclass(scalar_type, np.number) or \
+                issubclass(scalar_type, np.bool_):
+                return AssayColumn(
+                    'scalar', np.array(values, dtype=scalar_type)
+                )
+        if types == {str}:
+            return AssayColumn.encode_categories('str', values)
+        if types <= {list, dict}:
+            try:
+                text = [
+                    json.dumps(x) if x is not None else None
+                    for x in values
+                ]
+                if all(
+                    x is None or json.loads(t) == x
+                    for x, t in zip(values, text)
+                ):
+                    return AssayColumn.encode_categories('json', text)
+            except (TypeError, ValueError):
+                pass
+
+        data = np.empty(len(values), dtype=object)
+        data[:] = values
+        return AssayColumn('object', data)
+
+
+    @staticmethod
+    def encode_categories(kind, values):
+        index = {}
+        codes = np.fromiter(
+            (
+                index.setdefault(x, len(index)) if x is not None else -1
+                for x in values
+            ),
+            dtype=np.int32, count=len(values)
+        )
+        return AssayColumn(
+            kind, codes.astype(min_int_dtype(codes)),
+            categories=list(index)
+        )
+
+
+    def decode(self, start=None, end=None):
+        data = self.data[start:end]
+        if self.kind in {'str', 'tuple'}:
+            categories = self.categories
+            return [
+                categories[x] if x >= 0 else None
+                for x in data.tolist()
+            ]
+        elif self.kind == 'json':
+            categories = self.categories
+            return [
+                json.loads(categories[x]) if x >= 0 else None
+                for x in data.tolist()
+            ]
+        elif self.kind == 'scalar':
+            return list(data)
+
+        result = data.tolist()
+        if self.null is not None:
+            for i in np.nonzero(self.null[start:end])[0].tolist():
+                result[i] = None
+        return result
+
+
+    def array(self, start=None, end=None):
+        if self.kind in {'str', 'json'} or self.null is not None:
+            return np.array(self.decode(start, end), dtype=object)
+        return self.data[start:end]
+
+
+class FragmentColumn(AssayColumn):
+    def __init__(self, kind, data, null=None, categories=None,
+                 containers=None, dtypes=None, offsets=None):
+        super(FragmentColumn, self).__init__(
+            kind, data, null=null, categories=categories
+        )
+        self.containers = containers
+        self.dtypes = dtypes
+        self.offsets = offsets
+
+
+CONTAINER_ABSENT = -1
+CONTAINER_LIST = 0
+CONTAINER_TUPLE = 1
+
+
+class Assay():
+    __slots__ = ('collection', 'index')
+
+    def __init__(self, collection, index):
+        self.collection = collection
+        self.index = index
+
+
+    def __getitem__(self, key):
+        value = self.collection.get_value(self.index, key, KeyError)
+        if value is KeyError:
+            raise KeyError(key)
+        return value
+
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+
+    def get(self, key, default=None):
+        return self.collection.get_value(self.index, key, default)
+
+
+    def keys(self):
+        return self.collection.get_keys(self.index)
+
+
+    @property
+    def fragments(self):
+        return self.get('fragments', None)
+
+
+    def fragment_array(self, name):
+        return self.collection.get_fragment_array(self.index, name)
+
+
+    def to_dict(self):
+        return {
+            k: self.collection.get_value(self.index, k)
+            for k in self.keys()
+        }
+
+
+    @staticmethod
+    def from_dict(assay):
+        return AssayCollection.from_dict([assay])[0]
+
+
+class AssayCollection():
+    def __init__(self, keys, columns, present,
+                 fragment_keys, fragment_columns,
+                 has_fragments, offsets,
+                 key_orders, fragment_key_orders):
+        self.keys = keys
+        self.columns = columns
+        self.present = present
+        self.fragment_keys = fragment_keys
+        self.fragment_columns = fragment_columns
+        self.has_fragments = has_fragments
+        self.offsets = offsets
+        self.key_orders = key_orders
+        self.fragment_key_orders = fragment_key_orders
+
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('assay index out of range: ' + str(index))
+        return Assay(self, index)
+
+
+    def __iter__(self):
+        return (Assay(self, i) for i in range(len(self)))
+
+
+    @property
+    def fragment_count(self):
+        return int(self.offsets[-1])
+
+
+    def get_keys(self, index):
+        return list(self.key_orders.decode(index, index + 1)[0])
+
+
+    def get_fragment_keys(self, index):
+        keys = self.fragment_key_orders.decode(index, index + 1)[0]
+        return list(keys) if keys is not None else None
+
+
+    def get_fragment_range(self, index, name):
+        offsets = self.fragment_columns[name].offsets
+        if offsets is None:
+            offsets = self.offsets
+        return offsets[index], offsets[index + 1]
+
+
+    def get_fragment_value(self, index, name):
+        column = self.fragment_columns[name]
+        container = column.containers[index]
+        if container == CONTAINER_ABSENT:
+            return None
+
+        start, end = self.get_fragment_range(index, name)
+        if container == CONTAINER_LIST:
+            return column.decode(start, end)
+        elif container == CONTAINER_TUPLE:
+            return tuple(column.decode(start, end))
+
+        dtype = column.dtypes[container - 2]
+        if column.kind in {'float', 'int', 'bool', 'scalar'} and \
+            column.null is None:
+            return column.data[start:end].astype(dtype)
+        return np.array(column.decode(start, end), dtype=dtype)
+
+
+    def get_fragment_array(self, index, name):
+        start, end = self.get_fragment_range(index, name)
+        return self.fragment_columns[name].array(start, end)
+
+
+    def get_value(self, index, key, default=None):
+        if key == 'fragments':
+            if not self.has_fragments[index]:
+                return default
+            keys = self.get_fragment_keys(index)
+            if keys is None:
+                return None
+            return {
+                k: self.get_fragment_value(index, k)
+                for k in keys
+            }
+
+        present = self.present.get(key, None)
+        if present is None or not present[index]:
+            return default
+        return self.columns[key].decode(index, index + 1)[0]
+
+
+    def to_dict(self):
+        columns = {
+            k: self.columns[k].decode()
+            for k in self.keys
+            if k != 'fragments'
+        }
+        fragment_columns = {
+            k: self.fragment_columns[k].decode()
+            for k in self.fragment_keys
+        }
+
+        def fragment_value(index, name):
+            column = self.fragment_columns[name]
+            container = column.containers[index]
+            start, end = self.get_fragment_range(index, name)
+            value = fragment_columns[name][start:end]
+            if container == CONTAINER_LIST:
+                return value
+            elif container == CONTAINER_TUPLE:
+                return tuple(value)
+            return np.array(value, dtype=column.dtypes[container - 2])
+
+        key_orders = self.key_orders.decode()
+        fragment_key_orders = self.fragment_key_orders.decode()
+
+        result = []
+        for i in range(len(self)):
+            assay = {}
+            for k in key_orders[i]:
+                if k == 'fragments':
+                    assay[k] = {
+                        name: fragment_value(i, name)
+                        for name in fragment_key_orders[i]
+                    } if fragment_key_orders[i] is not None else None
+                else:
+                    assay[k] = columns[k][i]
+            result.append(assay)
+        return result
+
+
+    @staticmethod
+    def from_dict(assays):
+        assays = list(assays)
+
+        keys = []
+        for assay in assays:
+            for k in assay.keys():
+                if k not in keys:
+                    keys.append(k)
+
+        # each assay keeps its own key order, dictionary-encoded as tuples
+        key_orders = AssayColumn.encode_categories('tuple', [
+            tuple(assay.keys()) for assay in assays
+        ])
+
+        columns = {}
+        present = {}
+        for k in keys:
+            if k == 'fragments':
+                continue
+            present[k] = np.fromiter(
+                (k in assay for assay in assays),
+                dtype=bool, count=len(assays)
+            )
+            columns[k] = AssayColumn.encode(
+                assay.get(k, None) for assay in assays
+            )
+
+        fragments = []
+        for assay in assays:
+            value = assay.get('fragments', None)
+            if value is not None and not isinstance(value, dict):
+                raise TypeError('invalid fragments: ' + str(type(value)))
+            fragments.append(value)
+        has_fragments = np.fromiter(
+            ('fragments' in assay for assay in assays),
+            dtype=bool, count=len(assays)
+        )
+
+        fragment_key_orders = AssayColumn.encode_categories('tuple', [
+            tuple(x.keys()) if x is not None else None
+            for x in fragments
+        ])
+
+        fragment_keys = []
+        for value in fragments:
+            if value is None:
+                continue
+            for k in value.keys():
+                if k not in fragment_keys:
+                    fragment_keys.append(k)
+
+        def get_lengths(name):
+            return np.fromiter(
+                (
+                    len(x[name]) if x is not None and name in x else 0
+                    for x in fragments
+                ),
+                dtype=np.int64, count=len(fragments)
+            )
+
+        def to_offsets(lengths):
+            return np.concatenate(([0], np.cumsum(lengths))) \
+                .astype(np.int64)
+
+        lengths = np.fromiter(
+            (
+                len(next(iter(x.values()))) if x else 0
+                for x in fragments
+            ),
+            dtype=np.int64, count=len(fragments)
+        )
+        offsets = to_offsets(lengths)
+
+        fragment_columns = {}
+        for name in fragment_keys:
+            dtypes = []
+            containers = np.empty(len(assays), dtype=np.int8)
+            for i, x in enumerate(fragments):
+                value = x.get(name, None) if x is not None else None
+                if x is None or name not in x:
+                    containers[i] = CONTAINER_ABSENT
+                elif isinstance(value, list):
+                    containers[i] = CONTAINER_LIST
+                elif isinstance(value, tuple):
+                    containers[i] = CONTAINER_TUPLE
+                elif isinstance(value, np.ndarray) and value.ndim == 1:
+                    if value.dtype not in dtypes:
+                        dtypes.append(value.dtype)
+                    containers[i] = 2 + dtypes.index(value.dtype)
+                else:
+                    raise TypeError('invalid fragment column ' + name + \
+                                    ': ' + str(type(value)))
+
+            # columns sharing the assay fragment counts are padded with
+            # nulls where absent, so that they use the common offsets
+            column_lengths = get_lengths(name)
+            present_index = containers != CONTAINER_ABSENT
+            shared = np.array_equal(
+                column_lengths[present_index], lengths[present_index]
+            )
+
+            def get_values(x, length):
+                if x is None or name not in x:
+                    return [None] * length if shared else []
+                value = x[name]
+                if isinstance(value, np.ndarray):
+                    return value.tolist()
+                return value
+
+            column = AssayColumn.encode(itertools.chain.from_iterable(
+                get_values(x, length)
+                for x, length in zip(fragments, lengths.tolist())
+            ))
+            fragment_columns[name] = FragmentColumn(
+                column.kind, column.data,
+                null=column.null, categories=column.categories,
+                containers=containers, dtypes=dtypes,
+                offsets=to_offsets(column_lengths) if not shared else None
+            )
+
+        return AssayCollection(
+            keys=keys,
+            columns=columns,
+            present=present,
+            fragment_keys=fragment_keys,
+            fragment_columns=fragment_columns,
+            has_fragments=has_fragments,
+            offsets=offsets,
+            key_orders=key_orders,
+            fragment_key_orders=fragment_key_orders
+        )
+
+
+def load_assays(file, **kwargs):
+    # loads a pickle of either assay dicts or an AssayCollection,
+    # so that scripts keep working on dicts whichever is stored
+    from util import load_pickle
+
+    assays = load_pickle(file, **kwargs)
+    if isinstance(assays, AssayCollection):
+        assays = assays.to_dict()
+    return assays
@@ -1,5 +1,5 @@
-import copy
 import re
+import numpy as np
 
 from .assay import AssayBuilder
 from pepmass import GlycoPeptideMassCalculator
@@ -213,86 +213,109 @@ class GlycoAssayBuilder(AssayBuilder):
         raise ValueError('invalid fragment name:' + str(fragment_name))
 
 
-    def update_fragment_mz(self, assay, **kwargs):
-        fragments = copy.deepcopy(assay['fragments'])
-
-        fragment_index = self.filter_fragments_by_type(
-            assay, self.glycan_fragment_types, return_index=True
+    def update_precursor_mz_batch(self, assays):
+        precursor_mz = self.mass_calculator.precursor_mz_array(
+            sequence=[x['peptideSequence'] for x in assays],
+            modification=[x.get('modification', None) for x in assays],
+            glycan=[x.get('glycanStruct', None) for x in assays],
+            charge=[int(x['precursorCharge']) for x in assays]
         )
 
-        assay = self.filter_fragments_by_index(
-            assay, fragment_index=fragment_index, invert=True
-        )
+        for assay, mz in zip(assays, precursor_mz.tolist()):
+            assay.update({
+                'precursorMZ': mz
+            })
+        return assays
+
+
+    def get_glycan_fragment_key(self, fragment_name):
+        fragment_type, composition = \
+            self.parse_glycan_fragment_name(fragment_name)
+        if composition is not None:
+            composition = tuple(sorted(composition.items()))
+        return fragment_type, composition
 
+
+    def glycan_fragment_mz(self, assay, fragment_index, **kwargs):
+        sequence = assay['peptideSequence']
+        modification = assay.get('modification', None)
         glycan_struct = assay.get('glycanStruct', None)
         glycan_site = assay.get('glycanSite', None)
 
-        assay = super(GlycoAssayBuilder, self).update_fragment_mz(
-            assay=assay,
+        fragments = assay['fragments']
+        fragment_type = [fragments['fragmentType'][i] for i in fragment_index]
+        fragment_glycan = [
+            fragments['fragmentGlycan'][i] for i in fragment_index
+        ]
+        fragment_charge = [
+            fragments['fragmentCharge'][i] for i in fragment_index
+        ]
+        fragment_loss_type = [
+            fragments['fragmentLossType'][i] for i in fragment_index
+        ]
+
+        glycan_fragments = self.mass_calculator.fragment_mz(
+            sequence=sequence,
             glycan=glycan_struct,
             glycan_site=glycan_site,
+            modification=modification,
+            fragment_type=list(set(fragment_type)),
+            loss=list(set(fragment_loss_type)),
+            charge=list(set(fragment_charge)),
             **kwargs
         )
 
-        if len(fragment_index) > 0:
-            sequence = assay['peptideSequence']
-            modification = assay.get('modification', None)
-
-            fragment_type = fragments['fragmentType']
-            fragment_glycan = fragments['fragmentGlycan']
-            fragment_charge = fragments['fragmentCharge']
-            fragment_loss_type = fragments['fragmentLossType']
-
-            glycan_fragments = self.mass_calculator.fragment_mz(
-                sequence=sequence,
-                glycan=glycan_struct,
-                glycan_site=glycan_site,
-                modification=modification,
-                fragment_type=list(set(fragment_type[i] \
-                    for i in fragment_index)),
-                loss=list(set(fragment_loss_type[i] for i in fragment_index)),
-                charge=list(set(fragment_charge[i] for i in fragment_index)),
-                **kwargs
+        fragment_mz_map = self.get_fragment_mz_map(glycan_fragments)
+
+        glycan_index = {}
+        fragment_mz = []
+        for j, key in enumerate(zip(
+            fragment_type, fragment_charge, fragment_loss_type
+        )):
+            x = self.find_fragment_mz(fragment_mz_map, *key)
+
+            index = glycan_index.get(id(x), None)
+            if index is None:
+                index = {}
+                for i, y in enumerate(x['fragment_name']):
+                    index.setdefault(self.get_glycan_fragment_key(y), i)
+                glycan_index[id(x)] = index
+
+            i = index.get(
+                self.get_glycan_fragment_key(fragment_glycan[j]), None
             )
+            fragment_mz.append(x['fragment_mz'][i] if i is not None else None)
+
+        return fragment_mz
 
-            fragment_mz = []
-            j = 0
-            for i, _ in enumerate(fragment_type):
-                if i not in fragment_index:
-                    fragment_mz.append(assay['fragments']['fragmentMZ'][j])
-                    j += 1
-                    continue
-
-                mz = None
-                for x in glycan_fragments:
-                    if x['fragment_type'] == fragment_type[i] and \
-                        x['charge'] == fragment_charge[i] and \
-                        (x.get('loss', 'noloss') == fragment_loss_type[i] or \
-                         x.get('loss', 'noloss') == 'noloss' and \
-                         (fragment_loss_type[i] is None or fragment_loss_type[i] == "")):
-                        glycan_composition = self \
-                            .parse_glycan_fragment_name(fragment_glycan[i])
-                        index = next((
-                            i for i, y in enumerate(x['fragment_name'])
-                            if self.parse_glycan_fragment_name(y) == \
-                                glycan_composition
-                        ), None)
-                        if index is None:
-                            mz = None
-                        else:
-                            mz = x['fragment_mz'][index]
-                        fragment_mz.append(mz)
-                        if mz is None:
-                            mz = 0
-                        break
-                if mz is None:
-                    raise ValueError('fragment not found: ', fragment_type[i])
-
-            fragments.update({
-                'fragmentMZ': fragment_mz
-            })
-            assay['fragments'] = fragments
 
+    def update_fragment_mz(self, assay, inplace=False, **kwargs):
+        glycan_index = self.filter_fragments_by_type(
+            assay, self.glycan_fragment_types, return_index=True
+        )
+        peptide_index = sorted(
+            set(range(len(assay['fragments']['fragmentType']))) \
+                .difference(glycan_index)
+        )
+
+        fragment_mz = [None] * len(assay['fragments']['fragmentType'])
+        for i, x in zip(peptide_index, self.peptide_fragment_mz(
+            assay, fragment_index=peptide_index,
+            glycan=assay.get('glycanStruct', None),
+            glycan_site=assay.get('glycanSite', None),
+            **kwargs
+        )):
+            fragment_mz[i] = x
+        if len(glycan_index) > 0:
+            for i, x in zip(glycan_index, self.glycan_fragment_mz(
+                assay, fragment_index=glycan_index, **kwargs
+            )):
+                fragment_mz[i] = x
+
+        if not inplace:
+            assay = assay.copy()
+            assay['fragments'] = assay['fragments'].copy()
+        assay['fragments']['fragmentMZ'] = fragment_mz
         return assay
 
 
@@ -372,24 +395,26 @@ class GlycoAssayBuilder(AssayBuilder):
                 else:
                     return monosaccharide_number >= min_monosaccharide_number
 
-        fragment_index = [
-            i
-            for i, x in enumerate(assay['fragments']['fragmentGlycan'])
-            if enough_monosaccharide_number(x)
-        ]
-
-        fragment_index_1 = self \
-            .filter_fragments_by_type(
+        monosaccharide_filter = {}
+        fragment_index = []
+        for i, x in enumerate(assay['fragments']['fragmentGlycan']):
+            enough = monosaccharide_filter.get(x, None)
+            if enough is None:
+                enough = enough_monosaccharide_number(x)
+                monosaccharide_filter[x] = enough
+            if enough:
+                fragment_index.append(i)
+
+        fragment_mask = ~self.get_fragment_mask(
+            assay,
+            self.filter_fragments_by_type(
                 assay,
                 fragment_type=self.glycan_fragment_types,
                 return_index=True
             )
-
-        fragment_index = list(sorted( \
-            set(range(0, len(assay['fragments']['fragmentType']))) \
-                .difference(fragment_index_1) \
-                .union(fragment_index)
-        ))
+        )
+        fragment_mask[np.array(fragment_index, dtype=int)] = True
+        fragment_index = np.flatnonzero(fragment_mask).tolist()
 
         if return_index:
             return fragment_index
@@ -414,16 +439,21 @@ class GlycoAssayBuilder(AssayBuilder):
             .filter_fragments(assay, return_index=True, **kwargs)
 
         if min_fragment_monosaccharide_number is not None:
-            fragment_index_1 = self \
-                .filter_glycan_fragments_by_monosaccharide_number(
+            fragment_mask = self.get_fragment_mask(assay, fragment_index_0)
+            fragment_mask &= self.get_fragment_mask(
+                assay,
+                self.filter_glycan_fragments_by_monosaccharide_number(
                     assay, return_index=True,
                     min_monosaccharide_number=min_fragment_monosaccharide_number
                 )
-            fragment_index_0 = list(sorted(set(fragment_index_0) \
-                                     .intersection(fragment_index_1)))
+            )
+            fragment_index_0 = np.flatnonzero(fragment_mask).tolist()
 
+        assay_0 = assay
         assay = super(GlycoAssayBuilder, self) \
-            .filter_fragments_by_index(assay, fragment_index_0)
+            .filter_fragments_by_index(
+                assay, fragment_index_0, return_view=True
+            )
 
         if prior_peptide_fragment_number is None and \
             prior_glycan_fragment_number is None:
@@ -435,16 +465,13 @@ class GlycoAssayBuilder(AssayBuilder):
                         min_relative_fragment_intensity,
                     return_index=True
                 )
+            fragment_index = [fragment_index_0[i] for i in fragment_index]
 
             if return_index:
-                return [fragment_index_0[i] for i in fragment_index]
+                return fragment_index
             else:
-                assay = super(GlycoAssayBuilder, self) \
-                    .filter_fragments_by_index(
-                        assay,
-                        fragment_index
-                    )
-                return assay
+                return super(GlycoAssayBuilder, self) \
+                    .filter_fragments_by_index(assay_0, fragment_index)
 
         if prior_peptide_fragment_number is not None:
             pep_frag_index = set(self.filter_fragments_by_type(
@@ -474,6 +501,7 @@ class GlycoAssayBuilder(AssayBuilder):
                     )
                 )
 
+        fragment_index = None
         if max_fragment_number is not None:
             fragment_intensity = assay['fragments']['fragmentIntensity']
             fragment_index = sorted(
@@ -516,7 +544,8 @@ class GlycoAssayBuilder(AssayBuilder):
         if fragment_index is not None:
             assay_1 = self.filter_fragments_by_index(
                 assay,
-                fragment_index=fragment_index
+                fragment_index=fragment_index,
+                return_view=True
             )
         else:
             assay_1 = assay
@@ -538,19 +567,16 @@ class GlycoAssayBuilder(AssayBuilder):
                     for i in fragment_index_1
                 ]
 
+        if fragment_index is None:
+            fragment_index = fragment_index_0
+        else:
+            fragment_index = [fragment_index_0[i] for i in fragment_index]
+
         if return_index:
-            if fragment_index is None:
-                return fragment_index_0
-            else:
-                return [fragment_index_0[i] for i in fragment_index]
+            return fragment_index
         else:
-            if fragment_index is not None:
-                assay = super(GlycoAssayBuilder, self) \
-                    .filter_fragments_by_index(
-                        assay,
-                        fragment_index
-                    )
-            return assay
+            return super(GlycoAssayBuilder, self) \
+                .filter_fragments_by_index(assay_0, fragment_index)
 
 
     def filter_assay(self, assay,
@@ -62,8 +62,9 @@ class GlycoformUisAssayBuilder(GlycoAssayBuilder):
             self.background_glycans = \
                 pd.DataFrame(background_glycans, columns=['glycanStruct'])
             self.background_glycans['mw'] = \
-                self.background_glycans['glycanStruct'] \
-                    .map(lambda x: self.mass_calculator.glycan_mw(x))
+                self.mass_calculator.glycan_mw_array(
+                    self.background_glycans['glycanStruct'].tolist()
+                )
 
         self.max_background_glycan_number = max_background_glycan_number
         self.enable_identification_ms2_precursors = \
@@ -135,24 +136,12 @@ class GlycoformUisAssayBuilder(GlycoAssayBuilder):
         if background_glycans is None or len(background_glycans) == 0:
             return background_glycans
 
-        if not hasattr(self, 'background_glycan_fragments'):
-            self.background_glycan_fragments = {}
-
         all_fragment_names = set(itertools.chain.from_iterable(fragment_names))
         fragment_names = fragment_names.copy()
         exclude = []
         jaccard = []
         for glycan in background_glycans:
-            fragments = self.background_glycan_fragments.get(glycan, None)
-            if fragments is None:
-                fragments = [
-                    'Y-' + ''.join(
-                        k + '(' + str(v) + ')'
-                        for k, v in x.items()
-                    )
-                    for x in self.mass_calculator.glycan_fragment(glycan)
-                ]
-                self.background_glycan_fragments[glycan] = fragments
+            fragments = self.mass_calculator.glycan_fragment_name(glycan)
 
             if any((
                 set(frag_names) == set(fragments)
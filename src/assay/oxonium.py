@@ -1,6 +1,7 @@
 import copy
+import numpy as np
 from pepmass.glycomass import GlycoPeptideMassCalculator
-from assay.annotation import match_fragments
+from assay.annotation import PeakMatcher
 
 
 class OxoniumIonExtractor:
@@ -26,22 +27,33 @@ class OxoniumIonExtractor:
                 'fragmentAnnotation': oxonium_ion_mz['fragment_name']
             }
         }
+        self.oxonium_matcher = PeakMatcher(
+            self.oxonium_ions,
+            tolerance=self.mz_tolerance,
+            tolerance_unit=self.mz_tolerance_unit,
+            ms_level=2
+        )
 
 
     def extract_oxonium_ions(self, spectrum):
-        index = match_fragments(
-            spectrum, self.oxonium_ions, 
-            tolerance=self.mz_tolerance, tolerance_unit=self.mz_tolerance_unit
-        )
-        spectrum = copy.deepcopy(spectrum)   
+        index = self.oxonium_matcher.match(spectrum)
+        fragments = spectrum['fragments']
+        spectrum = copy.deepcopy({
+            k: v for k, v in spectrum.items() 
+            if k != 'fragments'
+        })
+        
+        def take(values, index):
+            if isinstance(values, np.ndarray):
+                return values[np.array(index, dtype=int)]
+            return [values[i] for i in index]
+        
         spectrum.update({    
             'fragments': {
                 'fragmentMZ': \
-                    [spectrum['fragments']['fragmentMZ'][i] \
-                     for i, j in index],
+                    take(fragments['fragmentMZ'], [i for i, j in index]),
                 'fragmentIntensity': \
-                    [spectrum['fragments']['fragmentIntensity'][i] \
-                     for i, j in index],
+                    take(fragments['fragmentIntensity'], [i for i, j in index]),
                 'fragmentAnnotation': \
                     [self.oxonium_ions['fragments']['fragmentAnnotation'][j] \
                      for i, j in index]
@@ -51,4 +63,4 @@ class OxoniumIonExtractor:
         return spectrum
     
         
-        
\ No newline at end of file
+        
@@ -80,7 +80,8 @@ def set_assay_values(assay, params, func_args=None, **values):
     return assay
 
 
-def assign_assays_values(assays, keys, params, data):
+def assign_assays_values(assays, keys, params, data,
+                         return_unmatched=False):
     import pandas as pd
 
     key_columns = []
@@ -90,22 +91,66 @@ def assign_assays_values(assays, keys, params, data):
         if name in data.columns:
             key_columns.append(name)
             key_params.append(k)
-
-    data = data.set_index(key_columns)
-
-    for assay in assays:
-        assay_id = tuple(get_assay_values(assay, key_params).values())
-
-        values = data.loc[assay_id]
-        if isinstance(values, pd.DataFrame):
-            values = values.iloc[0]
-        values = values.to_dict()
-        for name, value in list(values.items()):
+    if len(key_columns) == 0:
+        raise ValueError('no key columns in data: ' + str(keys))
+
+    value_columns = [c for c in data.columns if c not in key_columns]
+
+    # keys are computed once per assay and matched against the table by a
+    # hash join; duplicated keys in the table take the first row
+    assay_keys = pd.DataFrame.from_records(
+        [
+            tuple(get_assay_values(assay, key_params).values())
+            for assay in assays
+        ],
+        columns=key_columns
+    )
+    for c in key_columns:
+        if assay_keys[c].dtype != data[c].dtype:
+            try:
+                assay_keys[c] = assay_keys[c].astype(data[c].dtype)
+            except (TypeError, ValueError):
+                assay_keys[c] = assay_keys[c].astype(object)
+    assay_keys['__assay_index__'] = np.arange(len(assay_keys))
+
+    data = data.drop_duplicates(subset=key_columns, keep='first')
+    data_keys = data[key_columns].copy()
+    data_keys['__data_index__'] = np.arange(len(data))
+    matched = assay_keys.merge(
+        data_keys, on=key_columns, how='left', sort=False
+    )
+
+    matched_index = ~matched['__data_index__'].isna().values
+    assay_index = matched['__assay_index__'].values[matched_index]
+    data_index = matched['__data_index__'].values[matched_index] \
+        .astype(np.int64)
+
+    # value columns are gathered from the table directly, so that their
+    # dtypes are not promoted by the unmatched rows of the join
+    columns = [
+        (c, data[c].values.astype(object)[data_index].tolist())
+        for c in value_columns
+    ]
+    for i, index in enumerate(assay_index.tolist()):
+        values = {}
+        for c, column in columns:
+            value = column[i]
             if isinstance(value, np.generic):
-                 values[name] = value.item()
-
-        set_assay_values(assay, params, **values)
-
+                value = value.item()
+            values[c] = value
+        set_assay_values(assays[index], params, **values)
+
+    unmatched = list(
+        matched.loc[~matched_index, key_columns] \
+            .itertuples(index=False, name=None)
+    )
+    if len(unmatched) > 0:
+        import warnings
+        warnings.warn(
+            'assays not matched: ' + str(len(unmatched)) + \
+            ', e.g. ' + str(unmatched[0])
+        )
+
+    if return_unmatched:
+        return assays, unmatched
     return assays
-
-
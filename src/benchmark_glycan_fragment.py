@@ -0,0 +1,146 @@
+import argparse
+import os
+
+parser = argparse.ArgumentParser(
+    description='Benchmark glycan Y-ion fragment enumeration.'
+)
+
+parser.add_argument(
+    '--glycans',
+    default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        '..', 'misc', 'background_glycan.txt'
+    ),
+    help='glycan structure list file (default: %(default)s)'
+)
+parser.add_argument(
+    '--repeat', default=3, type=int,
+    help='number of repeats (default: %(default)s)'
+)
+
+reference_group = parser.add_mutually_exclusive_group(required=False)
+reference_group.add_argument(
+    '--reference', dest='reference', action='store_true',
+    help='compare with list-based enumeration (default: %(default)s)'
+)
+reference_group.add_argument(
+    '--no-reference', dest='reference', action='store_false',
+    help='benchmark composition vector enumeration only'
+)
+parser.set_defaults(reference=True)
+
+
+def reference_glycan_fragment(glycan):
+    from functools import reduce
+    from collections import OrderedDict
+
+    def add(d1, d2):
+        return {
+            k: d1.get(k, 0) + d2.get(k, 0)
+            for k in set(d1) | set(d2)
+        }
+
+    def cross_add(l1, l2):
+        return [
+            add(x1, x2)
+            for x1 in l1
+            for x2 in l2
+        ]
+
+    def _glycan_fragment(glycan):
+        d = { glycan.monosaccharide: 1 }
+        if glycan.children is not None:
+            r = list(map(lambda x: add(d, x), reduce(cross_add, (
+                [{}] + _glycan_fragment(c)
+                for c in glycan.children
+            ))))
+        else:
+            r = [d]
+
+        return list(OrderedDict((
+            frozenset(d.items()), d)
+            for d in r
+        ).values())
+
+    fragment = _glycan_fragment(glycan)
+    fragment.remove(glycan.composition())
+    return fragment
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    glycan_file = args.glycans
+    repeat = args.repeat
+    reference = args.reference
+
+    # %%
+    import logging
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s %(filename)s: [%(levelname)s] %(message)s'
+    )
+
+    # %%
+    import time
+
+    from pepmass.glycomass import GlycanNode, GlycoPeptideMassCalculator, \
+        glycan_fragment_compositions
+
+    # %%
+    logging.info('loading glycans: ' + glycan_file)
+
+    with open(glycan_file, 'r') as f:
+        glycans = [
+            GlycanNode.from_str(line.strip())
+            for line in f
+            if line.strip() != ''
+        ]
+
+    logging.info('glycans loaded: {0} glycans'.format(len(glycans)))
+
+    # %%
+    calculator = GlycoPeptideMassCalculator()
+
+    def benchmark(name, func, clear=None):
+        elapsed = []
+        for i in range(repeat):
+            if clear is not None:
+                clear()
+            start = time.perf_counter()
+            result = [func(glycan) for glycan in glycans]
+            elapsed.append(time.perf_counter() - start)
+
+        logging.info(
+            '{0}: {1:.4f} s (min of {2}), {3} fragments' \
+            .format(name, min(elapsed), repeat, sum(map(len, result)))
+        )
+        return result
+
+    result = benchmark(
+        'composition vector enumeration (cold cache)',
+        calculator.glycan_fragment,
+        clear=glycan_fragment_compositions.cache_clear
+    )
+    benchmark(
+        'composition vector enumeration (warm cache)',
+        calculator.glycan_fragment
+    )
+
+    if reference:
+        reference_result = benchmark(
+            'list-based enumeration',
+            reference_glycan_fragment
+        )
+
+        mismatch = [
+            str(glycan)
+            for glycan, x, y in zip(glycans, result, reference_result)
+            if [frozenset(d.items()) for d in x] != \
+                [frozenset(d.items()) for d in y]
+        ]
+        if len(mismatch) > 0:
+            raise ValueError('fragment mismatch: ' + str(mismatch[:10]))
+        logging.info('fragments matched: {0} glycans'.format(len(glycans)))
+
+    logging.info('cache: ' + str(glycan_fragment_compositions.cache_info()))
@@ -25,134 +25,163 @@ parser.add_argument(
     help='total FDR threshold (default: %(default)s)'
 )
 
-args = ['--psm', r'D:\FD_7600_Glyco\fragpipe_CID_60min\psm.tsv',
-        '--mzml', r'D:\FD_7600_Glyco\mzML\20230324_FD_GlycoPepide_CID_60min_01-20230323_FD_GlycoPepide_CID_60min_01.mzML',
-                  r'D:\FD_7600_Glyco\mzML\20230324_FD_GlycoPepide_CID_60min_02-20230323_FD_GlycoPepide_CID_60min_02.mzML',
-        '--glycans', r'D:\GlycoDIA\data\background_glycan.txt']
-
-args = parser.parse_args(args)
-psm_report_files = args.psm
-spectra_files = args.mzml
-out_file = args.out
-glycan_file = args.glycans
-fdr_cutoff = args.fdr
-
-# %%
-import logging
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(filename)s: [%(levelname)s] %(message)s'
+cache_group = parser.add_mutually_exclusive_group(required=False)
+cache_group.add_argument(
+    '--cache', dest='use_cache', action='store_true',
+    help='read spectra from memory-mapped spectrum caches, building them if needed (default: %(default)s)'
+)
+cache_group.add_argument(
+    '--no-cache', dest='use_cache', action='store_false',
+    help='parse the mzML files directly (default: True)'
+)
+parser.set_defaults(use_cache=False)
+parser.add_argument(
+    '--cache_dir',
+    help='directory of spectrum caches (default: next to the mzML files; '
+        'read directly if not writable)'
 )
 
-# %%
-from util import list_files
+parser.add_argument(
+    '--processes', default=1, type=int,
+    help='number of worker processes (default: %(default)s)'
+)
 
-if globals().get('psm_report_files', None) is None:
-    psm_report_files = list_files(
-        path='.',
-        pattern='psm\\.tsv$'
+if __name__ == '__main__':
+    args = ['--psm', r'D:\FD_7600_Glyco\fragpipe_CID_60min\psm.tsv',
+            '--mzml', r'D:\FD_7600_Glyco\mzML\20230324_FD_GlycoPepide_CID_60min_01-20230323_FD_GlycoPepide_CID_60min_01.mzML',
+                      r'D:\FD_7600_Glyco\mzML\20230324_FD_GlycoPepide_CID_60min_02-20230323_FD_GlycoPepide_CID_60min_02.mzML',
+            '--glycans', r'D:\GlycoDIA\data\background_glycan.txt']
+
+    args = parser.parse_args(args)
+    psm_report_files = args.psm
+    spectra_files = args.mzml
+    out_file = args.out
+    glycan_file = args.glycans
+    fdr_cutoff = args.fdr
+    use_cache = args.use_cache
+    cache_dir = args.cache_dir
+    processes = args.processes
+
+    # %%
+    import logging
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s %(filename)s: [%(levelname)s] %(message)s'
     )
 
-if len(psm_report_files) == 0:
-    raise ValueError('no psm report files')
+    # %%
+    from util import list_files
 
-# %%
-if globals().get('spectra_files', None) is None:
-    spectra_files = list_files(
-        path='.',
-        pattern='\\.mzML$'
-    )
+    if globals().get('psm_report_files', None) is None:
+        psm_report_files = list_files(
+            path='.',
+            pattern='psm\\.tsv$'
+        )
 
-if len(spectra_files) == 0:
-    raise ValueError('no spectra files')
+    if len(psm_report_files) == 0:
+        raise ValueError('no psm report files')
 
-# %%
-import os
+    # %%
+    if globals().get('spectra_files', None) is None:
+        spectra_files = list_files(
+            path='.',
+            pattern='\\.mzML$'
+        )
 
-if globals().get('out_file', None) is None:
-    out_file = os.path.splitext(spectra_files[0])[0]
-    if len(spectra_files) > 1:
-        out_file += '_' + str(len(spectra_files))
-    out_file += '.assay.pickle'
+    if len(spectra_files) == 0:
+        raise ValueError('no spectra files')
 
-# %%
-if globals().get('fdr_cutoff', None) is None:
-    fdr_cutoff = 0.01
+    # %%
+    import os
 
-logging.info('use FDR cutoff: ' + str(fdr_cutoff))
+    if globals().get('out_file', None) is None:
+        out_file = os.path.splitext(spectra_files[0])[0]
+        if len(spectra_files) > 1:
+            out_file += '_' + str(len(spectra_files))
+        out_file += '.assay.pickle'
 
-# %%
-if globals().get('glycan_file', None) is None:
-    glycan_file = list_files(
-        path='.',
-        pattern='glycans\\.txt$'
-    )
+    # %%
+    if globals().get('fdr_cutoff', None) is None:
+        fdr_cutoff = 0.01
 
+    logging.info('use FDR cutoff: ' + str(fdr_cutoff))
 
-# %%
-import pandas as pd
+    if globals().get('use_cache', None) is None:
+        use_cache = False
 
-from util import save_pickle
-from spectra.mzmlreader import MzmlReader
-from fragpipe import extract_assays_from_spectra
+    logging.info('use spectrum cache: ' + str(use_cache))
 
-# %%
-logging.info('loading psm report(s): ' + '; '.join(psm_report_files))
+    if globals().get('cache_dir', None) is not None:
+        logging.info('use cache directory: ' + cache_dir)
 
-psm_report = pd.concat(
-    (pd.read_table(f) for f in psm_report_files),
-    ignore_index=True
-)
+    if globals().get('processes', None) is None:
+        processes = 1
 
-logging.info('psm report(s) loaded: {0} spectra' \
-    .format(len(psm_report)))
+    logging.info('use processes: ' + str(processes))
 
-# %%
-logging.info('loading glycans: ' + glycan_file)
+    # %%
+    if globals().get('glycan_file', None) is None:
+        glycan_file = list_files(
+            path='.',
+            pattern='glycans\\.txt$'
+        )
 
-glycan_struct = pd.read_csv(glycan_file, header=None) \
-    [0].values.tolist()
 
-logging.info('glycans loaded: {0} glycans' \
-            .format(len(glycan_struct)))
+    # %%
+    import pandas as pd
 
-# %%
-def get_spectra(spectra_file):
-    with MzmlReader(spectra_file) as reader:
-        while True:
-            spec = reader.read_spectrum()
-            if spec is None:
-                break
-            yield spec
+    from util import save_pickle
+    from fragpipe.fragpipe2assay import extract_assays_from_mzml_files
 
-# %%
-assays = []
+    # %%
+    logging.info('loading psm report(s): ' + '; '.join(psm_report_files))
 
-for spectra_file in spectra_files:
-    logging.info('converting spectra to assays: ' + spectra_file)
+    psm_report = pd.concat(
+        (pd.read_table(f) for f in psm_report_files),
+        ignore_index=True
+    )
+
+    logging.info('psm report(s) loaded: {0} spectra' \
+        .format(len(psm_report)))
+
+    # %%
+    logging.info('loading glycans: ' + glycan_file)
+
+    glycan_struct = pd.read_csv(glycan_file, header=None) \
+        [0].values.tolist()
 
-    assay_data = extract_assays_from_spectra(
+    logging.info('glycans loaded: {0} glycans' \
+                .format(len(glycan_struct)))
+
+    # %%
+    assays = []
+
+    logging.info('converting spectra to assays: ' + '; '.join(spectra_files))
+
+    for spectra_file, assay_data in extract_assays_from_mzml_files(
         psm_report=psm_report,
-        spectra=get_spectra(spectra_file),
+        spectra_files=spectra_files,
         glycan_struct=glycan_struct,
         glycan_fdr_cutoff=fdr_cutoff,
-        return_generator=False
-    )
-    assays.extend(assay_data)
+        use_cache=use_cache,
+        cache_dir=cache_dir,
+        processes=processes
+    ):
+        assays.extend(assay_data)
 
-    logging.info('assays converted: {0}, {1} spectra' \
-        .format(spectra_file, len(assay_data)))
+        logging.info('assays converted: {0}, {1} spectra' \
+            .format(spectra_file, len(assay_data)))
 
-logging.info('assays converted: {0} spectra totally' \
-    .format(len(assays)))
+    logging.info('assays converted: {0} spectra totally' \
+        .format(len(assays)))
 
-# %%
-logging.info('saving assays: {0}' \
-    .format(out_file))
+    # %%
+    logging.info('saving assays: {0}' \
+        .format(out_file))
 
-save_pickle(assays, out_file)
+    save_pickle(assays, out_file)
 
-logging.info('assays saved: {0}, {1} spectra' \
-    .format(out_file, len(assays)))
+    logging.info('assays saved: {0}, {1} spectra' \
+        .format(out_file, len(assays)))
 
@@ -42,125 +42,154 @@ clean_glycan_site_group.add_argument(
 )
 parser.set_defaults(clean_glycan_site=False)
 
-args = parser.parse_args()
-psm_report_files = args.psm
-spectra_files = args.mgf
-out_file = args.out
-fdr_cutoff = args.fdr
-clean_glycan_struct = args.clean_glycan_struct
-clean_glycan_site = args.clean_glycan_site
-
-# %%
-import logging
-
-logging.basicConfig(
-    level=logging.INFO, 
-    format='%(asctime)s %(filename)s: [%(levelname)s] %(message)s'
+index_group = parser.add_mutually_exclusive_group(required=False)
+index_group.add_argument(
+    '--index', dest='use_index', action='store_true',
+    help='read only PSM-matched spectra using MGF index files (default: True)'
+)
+index_group.add_argument(
+    '--no-index', dest='use_index', action='store_false',
+    help='read all spectra sequentially (default: %(default)s)'
+)
+parser.set_defaults(use_index=True)
+parser.add_argument(
+    '--index_dir',
+    help='directory of MGF index files (default: next to the MGF files; '
+        'kept in memory if not writable)'
 )
-   
-# %%
-from util import list_files
 
-if globals().get('psm_report_files', None) is None:
-    psm_report_files = list_files(
-        path='.', 
-        pattern='pGlycoDB-GP-FDR-Pro\\.txt$'
+parser.add_argument(
+    '--processes', default=1, type=int,
+    help='number of worker processes (default: %(default)s)'
+)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    psm_report_files = args.psm
+    spectra_files = args.mgf
+    out_file = args.out
+    fdr_cutoff = args.fdr
+    clean_glycan_struct = args.clean_glycan_struct
+    clean_glycan_site = args.clean_glycan_site
+    use_index = args.use_index
+    index_dir = args.index_dir
+    processes = args.processes
+
+    # %%
+    import logging
+
+    logging.basicConfig(
+        level=logging.INFO, 
+        format='%(asctime)s %(filename)s: [%(levelname)s] %(message)s'
     )
+   
+    # %%
+    from util import list_files
+
+    if globals().get('psm_report_files', None) is None:
+        psm_report_files = list_files(
+            path='.', 
+            pattern='pGlycoDB-GP-FDR-Pro\\.txt$'
+        )
     
-if len(psm_report_files) == 0:
-    raise ValueError('no psm report files')
-
-# %%
-if globals().get('spectra_files', None) is None:
-    spectra_files = list_files(
-        path='.', 
-        pattern='\\.mgf$'
-    )
+    if len(psm_report_files) == 0:
+        raise ValueError('no psm report files')
+
+    # %%
+    if globals().get('spectra_files', None) is None:
+        spectra_files = list_files(
+            path='.', 
+            pattern='\\.mgf$'
+        )
     
-if len(spectra_files) == 0:
-    raise ValueError('no spectra files')
+    if len(spectra_files) == 0:
+        raise ValueError('no spectra files')
         
-# %%
-import os
-
-if globals().get('out_file', None) is None:
-    out_file = os.path.splitext(spectra_files[0])[0]
-    if len(spectra_files) > 1:
-        out_file += '_' + str(len(spectra_files))
-    out_file += '.assay.pickle'
+    # %%
+    import os
+
+    if globals().get('out_file', None) is None:
+        out_file = os.path.splitext(spectra_files[0])[0]
+        if len(spectra_files) > 1:
+            out_file += '_' + str(len(spectra_files))
+        out_file += '.assay.pickle'
     
-# %%
-if globals().get('fdr_cutoff', None) is None:
-    fdr_cutoff = 0.01
+    # %%
+    if globals().get('fdr_cutoff', None) is None:
+        fdr_cutoff = 0.01
 
-logging.info('use FDR cutoff: ' + str(fdr_cutoff))
+    logging.info('use FDR cutoff: ' + str(fdr_cutoff))
 
-# %%
-if globals().get('clean_glycan_struct', None) is None:
-    clean_glycan_struct = False
+    # %%
+    if globals().get('clean_glycan_struct', None) is None:
+        clean_glycan_struct = False
 
-logging.info('use clean_glycan_struct: ' + str(clean_glycan_struct))
+    logging.info('use clean_glycan_struct: ' + str(clean_glycan_struct))
 
-if globals().get('clean_glycan_site', None) is None:
-    clean_glycan_site = False
+    if globals().get('clean_glycan_site', None) is None:
+        clean_glycan_site = False
 
-logging.info('use clean_glycan_site: ' + str(clean_glycan_site))
+    logging.info('use clean_glycan_site: ' + str(clean_glycan_site))
 
-# %%
-import pandas as pd
+    if globals().get('use_index', None) is None:
+        use_index = True
 
-from util import save_pickle
-from spectra.mgfreader import MgfReader
-from pglyco import extract_assays_from_spectra
+    logging.info('use index: ' + str(use_index))
 
-# %%
-logging.info('loading psm report(s): ' + '; '.join(psm_report_files))
+    if globals().get('index_dir', None) is not None:
+        logging.info('use index directory: ' + index_dir)
 
-psm_report = pd.concat(
-    (pd.read_table(f) for f in psm_report_files),
-    ignore_index=True
-)
+    if globals().get('processes', None) is None:
+        processes = 1
+
+    logging.info('use processes: ' + str(processes))
+
+    # %%
+    import pandas as pd
 
-logging.info('psm report(s) loaded: {0} spectra' \
-    .format(len(psm_report)))
+    from util import save_pickle
+    from pglyco.extract import extract_assays_from_mgf_files
+
+    # %%
+    logging.info('loading psm report(s): ' + '; '.join(psm_report_files))
+
+    psm_report = pd.concat(
+        (pd.read_table(f) for f in psm_report_files),
+        ignore_index=True
+    )
 
-# %%
-def get_spectra(spectra_file):
-    with MgfReader(spectra_file) as reader:
-        while True:
-            spec = reader.read_spectrum()
-            if spec is None:
-                break
-            yield spec
+    logging.info('psm report(s) loaded: {0} spectra' \
+        .format(len(psm_report)))
 
-# %%
-assays = []
+    # %%
+    assays = []
 
-for spectra_file in spectra_files:
-    logging.info('converting spectra to assays: ' + spectra_file)
+    logging.info('converting spectra to assays: ' + '; '.join(spectra_files))
 
-    assay_data = extract_assays_from_spectra(
+    for spectra_file, assay_data in extract_assays_from_mgf_files(
         psm_report=psm_report,
-        spectra=get_spectra(spectra_file),
+        spectra_files=spectra_files,
+        use_index=use_index,
+        index_dir=index_dir,
         total_fdr_cutoff=fdr_cutoff,
         clean_glycan_struct=clean_glycan_struct,
         clean_glycan_site=clean_glycan_site,
-        return_generator=False
-    )    
-    assays.extend(assay_data)
+        processes=processes
+    ):
+        assays.extend(assay_data)
     
-    logging.info('assays converted: {0}, {1} spectra' \
-        .format(spectra_file, len(assay_data)))
+        logging.info('assays converted: {0}, {1} spectra' \
+            .format(spectra_file, len(assay_data)))
     
-logging.info('assays converted: {0} spectra totally' \
-    .format(len(assays)))
+    logging.info('assays converted: {0} spectra totally' \
+        .format(len(assays)))
 
-# %%
-logging.info('saving assays: {0}' \
-    .format(out_file))
+    # %%
+    logging.info('saving assays: {0}' \
+        .format(out_file))
 
-save_pickle(assays, out_file)
+    save_pickle(assays, out_file)
 
-logging.info('assays saved: {0}, {1} spectra' \
-    .format(out_file, len(assays)))
+    logging.info('assays saved: {0}, {1} spectra' \
+        .format(out_file, len(assays)))
 
@@ -0,0 +1,66 @@
+import argparse
+
+parser = argparse.ArgumentParser(
+    description='Build a memory-mapped glycan fragment library from glycan lists.'
+)
+parser.add_argument(
+    '--glycans', nargs='+',
+    help='input glycan structure list files'
+)
+parser.add_argument(
+    '--out',
+    help='output library directory'
+)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    glycan_files = args.glycans
+    library_dir = args.out
+
+    # %%
+    import logging
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s %(filename)s: [%(levelname)s] %(message)s'
+    )
+
+    # %%
+    import os
+
+    if globals().get('glycan_files', None) is None or \
+        len(glycan_files) == 0:
+        raise ValueError('no glycan files')
+
+    if globals().get('library_dir', None) is None:
+        library_dir = os.path.splitext(glycan_files[0])[0]
+        if len(glycan_files) > 1:
+            library_dir += '_' + str(len(glycan_files))
+        library_dir += '.glycanlib'
+
+    # %%
+    from util import open_file
+
+    glycans = []
+    for glycan_file in glycan_files:
+        logging.info('loading glycans: ' + glycan_file)
+
+        with open_file(glycan_file, 'r') as f:
+            glycan_data = [
+                line.strip() for line in f
+                if line.strip() != ''
+            ]
+        glycans.extend(glycan_data)
+
+        logging.info('glycans loaded: {0}, {1} glycans' \
+            .format(glycan_file, len(glycan_data)))
+
+    # %%
+    from pepmass.glycanlibrary import build_glycan_fragment_library
+
+    logging.info('building glycan fragment library: ' + library_dir)
+
+    library = build_glycan_fragment_library(glycans, library_dir)
+
+    logging.info('glycan fragment library built: {0}, {1} glycans, {2} fragments' \
+        .format(library_dir, len(library), library.manifest['fragmentCount']))
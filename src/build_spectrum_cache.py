@@ -0,0 +1,84 @@
+import argparse
+
+parser = argparse.ArgumentParser(
+    description='Build memory-mapped spectrum caches from mzML files.'
+)
+parser.add_argument(
+    '--mzml', nargs='+',
+    help='input mzML files'
+)
+parser.add_argument(
+    '--cache_dir',
+    help='directory of spectrum caches (default: next to the mzML files)'
+)
+parser.add_argument(
+    '--rebuild', action='store_true',
+    help='rebuild caches even if they are up to date'
+)
+parser.add_argument(
+    '--processes', default=1, type=int,
+    help='number of worker processes (default: %(default)s)'
+)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    spectra_files = args.mzml
+    cache_dir = args.cache_dir
+    rebuild = args.rebuild
+    processes = args.processes
+    
+    # %%
+    import logging
+
+    logging.basicConfig(
+        level=logging.INFO, 
+        format='%(asctime)s %(filename)s: [%(levelname)s] %(message)s'
+    )
+
+    # %%
+    from util import list_files
+
+    if globals().get('spectra_files', None) is None:
+        spectra_files = list_files(
+            path='.', 
+            pattern='\\.mzML$'
+        )
+    
+    if len(spectra_files) == 0:
+        raise ValueError('no spectra files')
+        
+    # %%
+    if globals().get('cache_dir', None) is not None:
+        logging.info('use cache directory: ' + cache_dir)
+
+    if globals().get('rebuild', None) is None:
+        rebuild = False
+
+    logging.info('use rebuild: ' + str(rebuild))
+
+    if globals().get('processes', None) is None:
+        processes = 1
+
+    logging.info('use processes: ' + str(processes))
+
+    # %%
+    from util import parallel_map
+    from spectra.spectrumcache import build_spectrum_cache_task
+    
+    # %%
+    tasks = (
+        {
+            'file': spectra_file,
+            'cache_dir': cache_dir,
+            'rebuild': rebuild
+        }
+        for spectra_file in spectra_files
+    )
+    
+    for spectra_file, cache_info in zip(spectra_files, parallel_map(
+        build_spectrum_cache_task, tasks,
+        processes=processes
+    )):
+        logging.info('spectrum cache built: {0}, {1} spectra, {2} peaks' \
+            .format(cache_info[0], cache_info[1], cache_info[2]))
+
@@ -124,7 +124,8 @@ logging.info(
 )
     
 # %%
-from util import load_pickle, save_pickle
+from util import save_pickle
+from assay import load_assays
 from assay.rtcalibration import RetentionTimeCalibrator
 
 # %%
@@ -132,7 +133,7 @@ assays = []
 for assay_file in assay_files:
     logging.info('loading assays: ' + assay_file)  
     
-    assay_data = load_pickle(assay_file)
+    assay_data = load_assays(assay_file)
     assays.extend(assay_data)
     
     logging.info('assays loaded: {0}, {1} spectra' \
@@ -146,7 +147,7 @@ reference_assays = []
 for reference_assay_file in reference_assay_files:
     logging.info('loading assays: ' + assay_file)  
     
-    assay_data = load_pickle(reference_assay_file)
+    assay_data = load_assays(reference_assay_file)
     reference_assays.extend(assay_data)
     
     logging.info('assays loaded: {0}, {1} spectra' \
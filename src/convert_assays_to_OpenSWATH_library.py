@@ -71,7 +71,7 @@ if globals().get('out_file', None) is None:
     out_file += '.' + out_format
 
 # %%
-from util import load_pickle
+from assay import load_assays
 from assay.assay2table import AssayToDataFrameConverter
 from openswath import OpenSWATH_glyco_columns
 
@@ -80,7 +80,7 @@ assays = []
 for assay_file in assay_files:
     logging.info('loading assays: ' + assay_file)
 
-    assay_data = load_pickle(assay_file)
+    assay_data = load_assays(assay_file)
     assays.extend(assay_data)
 
     logging.info('assays loaded: {0}, {1} spectra' \
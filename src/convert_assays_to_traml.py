@@ -49,7 +49,7 @@ if globals().get('out_file', None) is None:
     out_file += '.traML'
     
 # %%
-from util import load_pickle
+from assay import load_assays
 from openswath.tramlwriter import TramlWriter
 from openswath.glycotraml import traml_writer_glyco_parameters
  
@@ -58,7 +58,7 @@ assays = []
 for assay_file in assay_files:
     logging.info('loading assays: ' + assay_file)  
     
-    assay_data = load_pickle(assay_file)
+    assay_data = load_assays(assay_file)
     assays.extend(assay_data)
     
     logging.info('assays loaded: {0}, {1} spectra' \
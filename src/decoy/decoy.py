@@ -61,11 +61,12 @@ class DecoyAssayGenerator():
                 assay, fragment_index=fragment_index
             )
         
-        assay = self.assay_builder.update_fragment_mz(assay)
+        assay = self.assay_builder.update_fragment_mz(assay, inplace=True)
         
         if self.unknown_fragment_type == 'ignore':
             pass
         elif self.unknown_fragment_type == 'keep':
+            fragment_index = set(fragment_index)
             j = 0
             for i, _ in enumerate(fragments['fragmentMZ']):
                 if i in fragment_index:
@@ -16,6 +16,10 @@ parser.add_argument(
     '--swath_windows',
     help='SWATH isolation window file'
 )
+parser.add_argument(
+    '--processes', default=1, type=int,
+    help='number of worker processes (default: %(default)s)'
+)
 
 assay_filter_group = parser.add_argument_group('assay filters') 
 assay_filter_group.add_argument(
@@ -116,16 +120,6 @@ def add_fragment_filter_args(parser):
 
 add_fragment_filter_args(parser)
 
-args = parser.parse_args()
-assay_files = getattr(args, 'in')
-out_file = args.out
-swath_window_file = args.swath_windows
-
-filter_args = vars(args)
-filter_args.pop('in')
-filter_args.pop('out')
-filter_args.pop('swath_windows')
-
 def arrange_filter_args(filter_args):
     main_args = {
         'prior_peptide_fragment_criteria': {},
@@ -153,97 +147,118 @@ def arrange_filter_args(filter_args):
     main_args['min_peptide_fragment_criteria'] = main_args['prior_peptide_fragment_criteria']
     main_args['min_glycan_fragment_criteria'] = main_args['prior_glycan_fragment_criteria']
     return main_args
-    
-filter_criteria = arrange_filter_args(filter_args) 
- 
-# %%
-import logging
 
-logging.basicConfig(
-    level=logging.INFO, 
-    format='%(asctime)s %(filename)s: [%(levelname)s] %(message)s'
-)
 
-# %%
-from util import list_files
+if __name__ == '__main__':
+    args = parser.parse_args()
+    assay_files = getattr(args, 'in')
+    out_file = args.out
+    swath_window_file = args.swath_windows
+    processes = args.processes
+
+    filter_args = vars(args)
+    filter_args.pop('in')
+    filter_args.pop('out')
+    filter_args.pop('swath_windows')
+    filter_args.pop('processes')
 
-if globals().get('assay_files', None) is None:
-    assay_files = list_files(
-        path='.', 
-        pattern='\\.assay\\.pickle$'
+    filter_criteria = arrange_filter_args(filter_args) 
+ 
+    # %%
+    import logging
+
+    logging.basicConfig(
+        level=logging.INFO, 
+        format='%(asctime)s %(filename)s: [%(levelname)s] %(message)s'
     )
+
+    # %%
+    from util import list_files
+
+    if globals().get('assay_files', None) is None:
+        assay_files = list_files(
+            path='.', 
+            pattern='\\.assay\\.pickle$'
+        )
     
-if len(assay_files) == 0:
-    raise ValueError('no assay files')
+    if len(assay_files) == 0:
+        raise ValueError('no assay files')
     
-# %%
-import os
-
-if globals().get('out_file', None) is None:
-    out_file = os.path.splitext(assay_files[0])[0]
-    if out_file.endswith('.assay'):
-        out_file = out_file[:-len('.assay')]
-    if len(assay_files) > 1:
-        out_file += '_' + str(len(assay_files))
-    out_file += '_filtered.assay.pickle'
-
-# %%
-from util import save_pickle, load_pickle
-from assay import GlycoAssayBuilder
-import pandas as pd
-
-# %%
-assays = []
-for assay_file in assay_files:
-    logging.info('loading assays: ' + assay_file)  
+    # %%
+    import os
+
+    if globals().get('out_file', None) is None:
+        out_file = os.path.splitext(assay_files[0])[0]
+        if out_file.endswith('.assay'):
+            out_file = out_file[:-len('.assay')]
+        if len(assay_files) > 1:
+            out_file += '_' + str(len(assay_files))
+        out_file += '_filtered.assay.pickle'
+
+    # %%
+    from util import save_pickle
+    from assay import GlycoAssayBuilder, load_assays
+    from assay.assay import filter_assays_parallel
+    import pandas as pd
+
+    # %%
+    assays = []
+    for assay_file in assay_files:
+        logging.info('loading assays: ' + assay_file)  
     
-    assay_data = load_pickle(assay_file)
-    assays.extend(assay_data)
+        assay_data = load_assays(assay_file)
+        assays.extend(assay_data)
     
-    logging.info('assays loaded: {0}, {1} spectra' \
-        .format(assay_file, len(assay_data)))
+        logging.info('assays loaded: {0}, {1} spectra' \
+            .format(assay_file, len(assay_data)))
 
-logging.info('assays loaded: {0} spectra totally' \
-    .format(len(assays))) 
+    logging.info('assays loaded: {0} spectra totally' \
+        .format(len(assays))) 
 
-# %%     
-if swath_window_file is not None:
-    logging.info('loading SWATH windows: ' + swath_window_file) 
-    
-    swath_windows = pd.read_csv(swath_window_file, sep='\t')
+    # %%     
+    if swath_window_file is not None:
+        logging.info('loading SWATH windows: ' + swath_window_file) 
     
-    logging.info('SWATH windows loaded: {0} windows' \
-                 .format(len(swath_windows)))
-else:
-    swath_windows = None
+        swath_windows = pd.read_csv(swath_window_file, sep='\t')
     
-# %%
-logging.info(
-    'filtering assays using the following parameters: \n' + \
-    '\n'.join((
-        k + '=' + str(v) 
-        for k, v in filter_args.items()
-        if v is not None
-    ))
-)
+        logging.info('SWATH windows loaded: {0} windows' \
+                     .format(len(swath_windows)))
+    else:
+        swath_windows = None
 
-assay_builder = GlycoAssayBuilder()
+    # %%
+    if globals().get('processes', None) is None:
+        processes = 1
 
-assays = assay_builder.filter_assays(
-    assays,
-    swath_windows=swath_windows,
-    **filter_criteria
-)
+    logging.info('use processes: ' + str(processes))
+    
+    # %%
+    logging.info(
+        'filtering assays using the following parameters: \n' + \
+        '\n'.join((
+            k + '=' + str(v) 
+            for k, v in filter_args.items()
+            if v is not None
+        ))
+    )
+
+    assays = filter_assays_parallel(
+        assays,
+        builder_class=GlycoAssayBuilder,
+        processes=processes,
+        swath_windows=swath_windows,
+        **filter_criteria
+    )
 
-logging.info('assays filtered: {0} spectra remaining' \
-    .format(len(assays)))
+    logging.info('assays filtered: {0} spectra remaining' \
+        .format(len(assays)))
 
-# %%
-logging.info('saving assays: {0}' \
-    .format(out_file))
+    # %%
+    logging.info('saving assays: {0}' \
+        .format(out_file))
 
-save_pickle(assays, out_file)
+    save_pickle(assays, out_file)
     
-logging.info('assays saved: {0}, {1} spectra' \
-    .format(out_file, len(assays)))
+    logging.info('assays saved: {0}, {1} spectra' \
+        .format(out_file, len(assays)))
 
@@ -1,3 +1,4 @@
+import os
 import re
 import numpy as np
 
@@ -7,6 +8,8 @@ from assay.annotation import SpectrumAnnotator
 from assay.glycoassay import GlycoAssayBuilder
 from assay.modseq import ModifiedSequenceConverter
 from pepmass.glycomass import GlycoPeptideMassCalculator, GlycanNode
+from spectra.mzmlreader import MzmlReader
+from util import parallel_map
 
 class FragPipeToAssayConverter:
     def __init__(self,
@@ -188,6 +191,74 @@ def extract_assays_from_spectra(psm_report, spectra,
     return assays
 
 
+def get_mzml_spectra(spectra_file, use_cache=False, cache_dir=None):
+    with MzmlReader(spectra_file, use_cache=use_cache,
+                    cache_dir=cache_dir) as reader:
+        while True:
+            spec = reader.read_spectrum()
+            if spec is None:
+                break
+            yield spec
+
+
+def extract_assays_from_mzml(psm_report, spectra_file, use_cache=False,
+                             cache_dir=None, **kwargs):
+    return extract_assays_from_spectra(
+        psm_report=psm_report,
+        spectra=get_mzml_spectra(spectra_file, use_cache=use_cache,
+                                 cache_dir=cache_dir),
+        return_generator=False,
+        **kwargs
+    )
+
+
+def split_psm_report_by_mzml(psm_report, spectra_files):
+    psm_files = psm_report['Spectrum'] \
+        .str.replace('\\.[0-9]+\\.[0-9]+\\.[0-9]+$', '', regex=True)
+
+    result = []
+    for spectra_file in spectra_files:
+        name = os.path.splitext(os.path.basename(spectra_file))[0]
+        report = psm_report.loc[psm_files == name, :]
+        if len(report) == 0:
+            from warnings import warn
+            warn('no PSMs matched by file name, use all PSMs: ' + \
+                 spectra_file)
+            report = psm_report
+        result.append(report)
+    return result
 
 
+def _extract_assays_from_mzml_task(task):
+    return extract_assays_from_mzml(**task)
 
+
+def extract_assays_from_mzml_files(psm_report, spectra_files,
+                                   glycan_struct,
+                                   glycan_fdr_cutoff=0.01,
+                                   use_cache=False, cache_dir=None,
+                                   processes=None):
+    if glycan_fdr_cutoff is not None:
+        psm_report = psm_report \
+            .loc[psm_report['Glycan q-value'] <= glycan_fdr_cutoff, :]
+
+    if processes is not None and processes > 1:
+        psm_reports = split_psm_report_by_mzml(psm_report, spectra_files)
+    else:
+        psm_reports = [psm_report] * len(spectra_files)
+
+    tasks = (
+        {
+            'psm_report': report,
+            'spectra_file': spectra_file,
+            'glycan_struct': glycan_struct,
+            'glycan_fdr_cutoff': glycan_fdr_cutoff,
+            'use_cache': use_cache,
+            'cache_dir': cache_dir
+        }
+        for report, spectra_file in zip(psm_reports, spectra_files)
+    )
+    return zip(spectra_files, parallel_map(
+        _extract_assays_from_mzml_task, tasks,
+        processes=processes
+    ))
@@ -19,12 +19,17 @@ parser.add_argument(
     '--out_both_decoy',
     help='output both decoy assay file'
 )
+parser.add_argument(
+    '--glycan_library',
+    help='precomputed glycan fragment library directory'
+)
 
 args = parser.parse_args()
 assay_files = getattr(args, 'in')
 peptide_decoy_out_file = args.out_peptide_decoy
 glycan_decoy_out_file = args.out_glycan_decoy
 both_decoy_out_file = args.out_both_decoy
+glycan_library_dir = args.glycan_library
     
 # %%
 import logging
@@ -62,7 +67,9 @@ if globals().get('peptide_decoy_out_file', None) is None and \
     both_decoy_out_file = out_file + '_both_decoy.assay.pickle'
       
 # %%
-from util import save_pickle, load_pickle
+from util import save_pickle
+from pepmass import GlycoPeptideMassCalculator
+from assay import GlycoAssayBuilder, load_assays
 from decoy import GlycoDecoyAssayGenerator
 
 # %%
@@ -70,7 +77,7 @@ assays = []
 for assay_file in assay_files:
     logging.info('loading assays: ' + assay_file)  
     
-    assay_data = load_pickle(assay_file)
+    assay_data = load_assays(assay_file)
     assays.extend(assay_data)
     
     logging.info('assays loaded: {0}, {1} spectra' \
@@ -80,7 +87,16 @@ logging.info('assays loaded: {0} spectra totally' \
     .format(len(assays))) 
 
 # %%
-decoy = GlycoDecoyAssayGenerator()
+if globals().get('glycan_library_dir', None) is not None:
+    logging.info('use glycan fragment library: ' + glycan_library_dir)
+
+decoy = GlycoDecoyAssayGenerator(
+    assay_builder=GlycoAssayBuilder(
+        mass_calculator=GlycoPeptideMassCalculator(
+            glycan_library=globals().get('glycan_library_dir', None)
+        )
+    )
+)
 
 # %%
 if globals().get('peptide_decoy_out_file', None) is not None:
@@ -21,6 +21,11 @@ parser.add_argument(
     help='background glycan file'
 )
 
+parser.add_argument(
+    '--glycan_library',
+    help='precomputed glycan fragment library directory'
+)
+
 parser.add_argument(
     '--max_background_glycan_number', default=20, type=int,
     help='maximum number of background glycans in a SWATH isolation window (default: %(default)s)'
@@ -55,6 +60,7 @@ assay_files = getattr(args, 'in')
 out_file = args.out
 swath_window_file = args.swath_windows
 background_glycan_file = args.background_glycans
+glycan_library_dir = args.glycan_library
 max_background_glycan_number = args.max_background_glycan_number
 enable_identification_ms2_precursors = args.enable_identification_ms2_precursors
 
@@ -93,7 +99,8 @@ if globals().get('out_file', None) is None:
     out_file += '_uis.assay.pickle'
     
 # %%
-from util import save_pickle, load_pickle
+from util import save_pickle
+from assay import load_assays
 import pandas as pd
 
 # %%
@@ -101,7 +108,7 @@ assays = []
 for assay_file in assay_files:
     logging.info('loading assays: ' + assay_file)  
     
-    assay_data = load_pickle(assay_file)
+    assay_data = load_assays(assay_file)
     assays.extend(assay_data)
     
     logging.info('assays loaded: {0}, {1} spectra' \
@@ -134,9 +141,16 @@ else:
     background_glycans = None
     
 # %%
+from pepmass import GlycoPeptideMassCalculator
 from assay.glycoformassay import GlycoformUisAssayBuilder
 
+if globals().get('glycan_library_dir', None) is not None:
+    logging.info('use glycan fragment library: ' + glycan_library_dir)
+
 builder = GlycoformUisAssayBuilder(
+    mass_calculator=GlycoPeptideMassCalculator(
+        glycan_library=globals().get('glycan_library_dir', None)
+    ),
     background_glycans=background_glycans,
     max_background_glycan_number=max_background_glycan_number,
     enable_identification_ms2_precursors=enable_identification_ms2_precursors
@@ -179,7 +179,8 @@ if from_list:
         out_file += '_semiempirical.assay.pickle'
 
 # %%
-from util import save_pickle, load_pickle
+from util import save_pickle
+from assay import load_assays
 
 # %%
 if interchange or cross_validation or from_list:
@@ -189,7 +190,7 @@ if interchange or cross_validation or from_list:
         for assay_file in assay_files:
             logging.info('loading assays: ' + assay_file)
 
-            assay_data = load_pickle(assay_file)
+            assay_data = load_assays(assay_file)
             assays.extend(assay_data)
 
             logging.info('assays loaded: {0}, {1} spectra' \
@@ -207,7 +208,7 @@ if exchange or from_list:
         for assay_file in peptide_assay_files:
             logging.info('loading peptide assays: ' + assay_file)
 
-            assay_data = load_pickle(assay_file)
+            assay_data = load_assays(assay_file)
             peptide_assays.extend(assay_data)
 
             logging.info('peptide assays loaded: {0}, {1} spectra' \
@@ -223,7 +224,7 @@ if exchange or from_list:
         for assay_file in glycan_assay_files:
             logging.info('loading glycan assays: ' + assay_file)
 
-            assay_data = load_pickle(assay_file)
+            assay_data = load_assays(assay_file)
             glycan_assays.extend(assay_data)
 
             logging.info('glycan assays loaded: {0}, {1} spectra' \
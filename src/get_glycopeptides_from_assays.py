@@ -48,7 +48,7 @@ if globals().get('out_file', None) is None:
     out_file += '.glycopeptides.csv'
 
 # %%
-from util import load_pickle
+from assay import load_assays
 from assay.assay2table import AssayToDataFrameConverter
 from assay.modseq import ModifiedSequenceConverter
 
@@ -105,7 +105,7 @@ assays = []
 for assay_file in assay_files:
     logging.info('loading assays: ' + assay_file)
 
-    assay_data = load_pickle(assay_file)
+    assay_data = load_assays(assay_file)
     assays.extend(assay_data)
 
     logging.info('assays loaded: {0}, {1} spectra' \
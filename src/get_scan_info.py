@@ -5,12 +5,12 @@ parser = argparse.ArgumentParser(
 )
 
 parser.add_argument(
-    '--in', 
-    help='input mzML file'
+    '--in', nargs='+',
+    help='input mzML files'
 )
 parser.add_argument(
-    '--out',
-    help='output CSV file'
+    '--out', nargs='+',
+    help='output CSV files'
 )
 parser.add_argument(
     '--start_scan', type=int,
@@ -33,136 +33,131 @@ parser.add_argument(
     help='information names'
 )
 
-args = parser.parse_args()
-mzml_file = getattr(args, 'in')
-out_file = args.out
-start_scan = args.start_scan
-end_scan = args.end_scan
-info_names = args.info_name
-
-# %%
-import logging
+cache_group = parser.add_mutually_exclusive_group(required=False)
+cache_group.add_argument(
+    '--cache', dest='use_cache', action='store_true',
+    help='read spectra from a memory-mapped spectrum cache, building it if needed (default: %(default)s)'
+)
+cache_group.add_argument(
+    '--no-cache', dest='use_cache', action='store_false',
+    help='parse the mzML file directly (default: True)'
+)
+parser.set_defaults(use_cache=False)
+parser.add_argument(
+    '--cache_dir',
+    help='directory of spectrum caches (default: next to the mzML files; '
+        'read directly if not writable)'
+)
 
-logging.basicConfig(
-    level=logging.INFO, 
-    format='%(asctime)s %(filename)s: [%(levelname)s] %(message)s'
+parser.add_argument(
+    '--processes', default=1, type=int,
+    help='number of worker processes (default: %(default)s)'
+)
+parser.add_argument(
+    '--shards', type=int,
+    help='number of scan ranges per indexed mzML file (default: number of processes)'
 )
 
-# %%
-if mzml_file is None:
-    raise ValueError('no mzML file')
- 
-# %%
-import os
-
-if globals().get('out_file', None) is None:
-    out_file = os.path.splitext(mzml_file)[0]
-    out_file += '.scaninfo.csv'
-    
-# %%
-if globals().get('info_names', None) is None or len(info_names) == 0:
-    raise ValueError('no information names')
-      
-logging.info('use information: ' + \
-    ', '.join(info_names))
-
-# %%
-from spectra.mzmlreader import MzmlReader
-import csv
-import re
-
-def get_info_from_assay(assay, name):
-    def get_value_from_dict(d, path):
-        value = None
-        for name in path:
-            if isinstance(d, dict):                
-                value = d.get(name, None)
-                d = value
-            else:
-                return None                
-        return value
-                
-    value = get_value_from_dict(assay, [name])
-    if value is None:
-        value = get_value_from_dict(assay, ['metadata', name])    
-    if value is None:
-        name = name.split('.')
-        value = get_value_from_dict(assay, name)
-    if value is None:
-        value = get_value_from_dict(assay, ['metadata'] + name)
-
-    return value
-
-# %%
-info_names_1 = [
-    re.sub('=[^=]+$', '', x)
-    for x in info_names
-]
-info_names_2 = [
-    re.sub('^[^=]+=', '', x)
-    for x in info_names
-] 
-
-# %%
-reader = MzmlReader(mzml_file)
-
-csv_file = open(out_file, 'w', newline='')
-writer = csv.writer(csv_file)
-
-# %%
-writer.writerow(['file', 'scan'] + info_names_1)
-
-# %%
-logging.info('loading scan information from mzML: ' + mzml_file)
-    
-scan = 0
-while True:
-    spec = reader.read_spectrum()    
-    if spec is None:
-        break
-    
-    scan += 1
-    if start_scan is not None and scan < start_scan:
-        continue
-    elif end_scan is not None and scan > end_scan:
-        break
-    
-    file = spec['metadata'].get('file', None)
-    if file is None:
-        title = spec['metadata'].get('title', None)
-        mat = re.search('^(.+)\\.([0-9]+)\\.[0-9]+\\.[0-9]*( |$)', title)
-        if mat is not None:
-            file = mat.group(1)
-    if file is None:
-        file = os.path.splitext(mzml_file)[0]
+if __name__ == '__main__':
+    args = parser.parse_args()
+    mzml_files = getattr(args, 'in')
+    out_files = args.out
+    start_scan = args.start_scan
+    end_scan = args.end_scan
+    info_names = args.info_name
+    use_cache = args.use_cache
+    cache_dir = args.cache_dir
+    processes = args.processes
+    shards = args.shards
+
+    # %%
+    import logging
+
+    logging.basicConfig(
+        level=logging.INFO, 
+        format='%(asctime)s %(filename)s: [%(levelname)s] %(message)s'
+    )
+
+    # %%
+    if globals().get('mzml_files', None) is None or len(mzml_files) == 0:
+        raise ValueError('no mzML files')
+     
+    # %%
+    import os
+
+    if globals().get('out_files', None) is None:
+        out_files = [
+            os.path.splitext(mzml_file)[0] + '.scaninfo.csv'
+            for mzml_file in mzml_files
+        ]
+
+    if len(out_files) != len(mzml_files):
+        raise ValueError('numbers of mzML files and output files not match: ' + \
+                         str(len(mzml_files)) + ', ' + str(len(out_files)))
         
-    scan_number = spec['metadata'].get('scan', None)  
-    if scan_number is None:
-        title = spec['metadata'].get('title', None)
-        mat = re.search('^(.+)\\.([0-9]+)\\.[0-9]+\\.[0-9]*( |$)', title)
-        if mat is not None:
-            scan_number = mat.group(2)
-    if scan_number is None:
-        scan_id = spec['metadata'].get('id', None) 
-        mat = re.search('scan=([0-9]+)', scan_id)
-        if mat is not None:
-            scan_number = mat.group(1)
-    if scan_number is None:
-        scan_number = scan
-    scan_number = int(scan_number)
-        
-    writer.writerow([file, scan_number] + [
-        get_info_from_assay(spec, x)
-        for x in info_names_2
-    ])
-    
-    if (scan - (start_scan or 1) + 1) % 1000 == 0 or scan == end_scan:
-        logging.info(
-            'scan {0} processed' \
-                .format(scan)
-        )
-    
-# %%
-csv_file.close()
+    # %%
+    if globals().get('info_names', None) is None or len(info_names) == 0:
+        raise ValueError('no information names')
+          
+    logging.info('use information: ' + \
+        ', '.join(info_names))
 
-logging.info('scan information saved: ' + out_file)
+    if globals().get('use_cache', None) is None:
+        use_cache = False
+
+    logging.info('use spectrum cache: ' + str(use_cache))
+
+    if globals().get('cache_dir', None) is not None:
+        logging.info('use cache directory: ' + cache_dir)
+
+    if globals().get('processes', None) is None:
+        processes = 1
+
+    logging.info('use processes: ' + str(processes))
+
+    if globals().get('shards', None) is None:
+        shards = processes
+
+    logging.info('use shards: ' + str(shards))
+
+    # %%
+    from util import parallel_map
+    from spectra.scaninfo import get_scan_info_tasks, \
+        merge_scan_info, _write_scan_info_task
+
+    # %%
+    tasks = []
+    for mzml_file, out_file in zip(mzml_files, out_files):
+        file_tasks = get_scan_info_tasks(
+            mzml_file, out_file, info_names,
+            start_scan=start_scan, end_scan=end_scan,
+            use_cache=use_cache, cache_dir=cache_dir, shards=shards
+        )
+        logging.info('loading scan information from mzML: {0}, {1} shard(s)' \
+            .format(mzml_file, len(file_tasks)))
+        tasks.extend(file_tasks)
+
+    # %%
+    remaining = {}
+    for task in tasks:
+        remaining[task['mzml_file']] = remaining.get(task['mzml_file'], 0) + 1
+    scan_counts = {}
+
+    for task, count in zip(tasks, parallel_map(
+        _write_scan_info_task, tasks, 
+        processes=processes
+    )):
+        mzml_file = task['mzml_file']
+        remaining[mzml_file] -= 1
+        scan_counts[mzml_file] = scan_counts.get(mzml_file, 0) + count
+        if remaining[mzml_file] > 0:
+            continue
+
+        out_file = out_files[mzml_files.index(mzml_file)]
+        merge_scan_info(out_file, [
+            t['out_file'] for t in tasks 
+            if t['mzml_file'] == mzml_file
+        ])
+
+        logging.info('scan information saved: {0}, {1} scans' \
+            .format(out_file, scan_counts[mzml_file]))
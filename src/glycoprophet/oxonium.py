@@ -2,6 +2,7 @@ import bisect
 import os
 import click
 import itertools
+import numpy as np
 import pandas as pd
 from collections import Counter
 
@@ -36,37 +37,62 @@ class OxoniumIonsValidator:
         self.relative_intensity = relative_intensity
         
     
-    def extract_oxonium_ions(self, spectra):
-        oxonium_ions = {}        
-        for spec in spectra: 
-            if spec.get('msLevel', 2) != 2:
-                continue
-                 
-            oxo = self.extractor.extract_oxonium_ions(spec)
-            
-            if 'basePeakIntensity' not in oxo['metadata']:
-                oxo['metadata']['basePeakIntensity'] = \
-                    max(spec['fragments']['fragmentIntensity'])                
-            if 'backgroundIntensity' not in oxo['metadata'] and \
-                self.background_estimator is not None:
-                oxo['metadata']['backgroundIntensity'] = \
-                    self.background_estimator.estimate_background(spec)
+    def extract_oxonium_ions(self, spectra, batch_size=1000):
+        def extract_batch(batch):
+            oxo_batch = [
+                self.extractor.extract_oxonium_ions(spec) 
+                for spec in batch
+            ]
             
-            filename = spec['metadata']['file']
-            oxo_dict = oxonium_ions.get(filename, None)
-            if oxo_dict is None:
-                oxo_dict = oxonium_ions.setdefault(filename, {})
+            for spec, oxo in zip(batch, oxo_batch):
+                if 'basePeakIntensity' not in oxo['metadata']:
+                    oxo['metadata']['basePeakIntensity'] = \
+                        float(np.max(spec['fragments']['fragmentIntensity']))
                 
-            isolation_window = (
-                spec['metadata']['isolationWindowTargetMZ'] - \
-                    spec['metadata']['isolationWindowLowerOffset'],
-                spec['metadata']['isolationWindowTargetMZ'] + \
-                    spec['metadata']['isolationWindowUpperOffset']
-            )
-            oxo_list = oxo_dict.get(isolation_window, None)
-            if oxo_list is None:
-                oxo_list = oxo_dict.setdefault(isolation_window, [])
-            oxo_list.append(oxo)
+            if self.background_estimator is not None:
+                index = [
+                    i for i, oxo in enumerate(oxo_batch)
+                    if 'backgroundIntensity' not in oxo['metadata']
+                ]
+                backgrounds = self.background_estimator.estimate_backgrounds(
+                    batch[i] for i in index
+                )
+                for i, background in zip(index, backgrounds):
+                    oxo_batch[i]['metadata']['backgroundIntensity'] = \
+                        background
+            
+            return oxo_batch
+        
+        def iter_batches(spectra):
+            batch = []
+            for spec in spectra: 
+                if spec.get('msLevel', 2) != 2:
+                    continue
+                batch.append(spec)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if len(batch) > 0:
+                yield batch
+        
+        oxonium_ions = {}        
+        for batch in iter_batches(spectra):
+            for spec, oxo in zip(batch, extract_batch(batch)):
+                filename = spec['metadata']['file']
+                oxo_dict = oxonium_ions.get(filename, None)
+                if oxo_dict is None:
+                    oxo_dict = oxonium_ions.setdefault(filename, {})
+                    
+                isolation_window = (
+                    spec['metadata']['isolationWindowTargetMZ'] - \
+                        spec['metadata']['isolationWindowLowerOffset'],
+                    spec['metadata']['isolationWindowTargetMZ'] + \
+                        spec['metadata']['isolationWindowUpperOffset']
+                )
+                oxo_list = oxo_dict.get(isolation_window, None)
+                if oxo_list is None:
+                    oxo_list = oxo_dict.setdefault(isolation_window, [])
+                oxo_list.append(oxo)
         
         for oxo_dict in oxonium_ions.values():
             for oxo_list in oxo_dict.values():
@@ -189,7 +215,8 @@ class OxoniumIonsValidator:
         return self.data
     
     
-def validate_oxonium_ions(report_file, mzml_files, out_file=None, **kwargs):
+def validate_oxonium_ions(report_file, mzml_files, out_file=None, 
+                          use_cache=False, **kwargs):
     if out_file is None:
         out_file = os.path.splitext(report_file)[0] + '_oxonium.tsv'
        
@@ -210,7 +237,8 @@ def validate_oxonium_ions(report_file, mzml_files, out_file=None, **kwargs):
         
         click.echo("Info: Loading {0}".format(filename))
         
-        reader = MzmlReader(path)
+        reader = MzmlReader(path, array=True, ms_level=2, 
+                            use_cache=use_cache)
         i = 0
         click.echo("Info: Scan", nl=False)  
         while True:
@@ -14,7 +14,7 @@ except ImportError:
     plt = None
 
 from spectra.mzmlreader import MzmlReader
-from assay.annotation import match_fragments, match_peaks
+from assay.annotation import PeakMatcher
 
 
 def read_feature_transition(infile, run_id,
@@ -205,6 +205,7 @@ def extract_feature_chromatograms(spectra, feature_data, swath_windows,
 
 
     def extract_ms2(features, spec, rt, rt_margin=0.2, min_rt_window=60):
+        matcher = None
         for feature in features:
             rt_left = feature['metadata']['leftWidth']
             rt_right = feature['metadata']['rightWidth']
@@ -254,12 +255,13 @@ def extract_feature_chromatograms(spectra, feature_data, swath_windows,
             for x in chromatograms['mz']:
                 x.append(None)
 
-            index = match_fragments(
-                feature, spec,
-                tolerance=tolerance, tolerance_unit=tolerance_unit,
-                criteria=criteria,
-                all1=True, all2=False
-            )
+            if matcher is None:
+                matcher = PeakMatcher(
+                    spec,
+                    tolerance=tolerance, tolerance_unit=tolerance_unit,
+                    criteria=criteria, ms_level=2
+                )
+            index = matcher.match(feature, all1=True, all2=False)
             for i, j in index:
                 if j is not None:
                     chromatograms['intensity'][i][-1] = \
@@ -269,6 +271,7 @@ def extract_feature_chromatograms(spectra, feature_data, swath_windows,
 
 
     def extract_ms1(features, spec, rt):
+        matcher = None
         for feature in features:
             if feature['metadata']['leftWidth'] > rt or \
                 feature['metadata']['rightWidth'] < rt:
@@ -289,11 +292,14 @@ def extract_feature_chromatograms(spectra, feature_data, swath_windows,
             for x in chromatograms['mz']:
                 x.append(None)
 
-            index = match_peaks(
+            if matcher is None:
+                matcher = PeakMatcher(
+                    spec,
+                    tolerance=ms1_tolerance, tolerance_unit=ms1_tolerance_unit,
+                    criteria=criteria
+                )
+            index = matcher.match(
                 { 'peaks': { 'mz': [feature['precursorMZ']] } },
-                spec,
-                tolerance=ms1_tolerance, tolerance_unit=ms1_tolerance_unit,
-                criteria=criteria,
                 all1=True, all2=False
             )
             for i, j in index:
@@ -758,7 +764,8 @@ def export_peakgroup_plots(osw_file, mzml_file, swath_window_file,
                            max_glycoform_qvalue=None,
                            max_transition_pep=None,
                            include_decoy=False,
-                           tolerance=20, tolerance_unit='ppm'):
+                           tolerance=20, tolerance_unit='ppm',
+                           use_cache=False):
     swath_windows = pd.read_csv(swath_window_file, sep='\t')
 
     run_id = None
@@ -805,8 +812,9 @@ def export_peakgroup_plots(osw_file, mzml_file, swath_window_file,
             feature_data['filename'].str.endswith(os.path.basename(mzml_file))
         ]
 
-    def mzml_as_iterable(path):
-        reader = MzmlReader(path)
+    def mzml_as_iterable(path, rt_range=None):
+        reader = MzmlReader(path, ms_level={1, 2}, rt_range=rt_range,
+                            use_cache=use_cache)
         i = 0
         click.echo("Info: Scan", nl=False)
         while True:
@@ -822,7 +830,10 @@ def export_peakgroup_plots(osw_file, mzml_file, swath_window_file,
         click.echo("")
         click.echo("Info: {0} loaded, {1} scans".format(path, i))
 
-    spectra = mzml_as_iterable(mzml_file)
+    spectra = mzml_as_iterable(
+        mzml_file, 
+        rt_range=((feature_data['leftWidth'].min() - 1) / 60, None)
+    )
 
     features = extract_feature_chromatograms(
         spectra, feature_data, swath_windows,
@@ -0,0 +1,139 @@
+import functools
+import numpy as np
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = {}
+        self.misses = {}
+
+
+    def __len__(self):
+        return len(self.data)
+
+
+    def get(self, key, default=None, name=None):
+        value = self.data.get(key, default)
+        if value is default:
+            self.misses[name] = self.misses.get(name, 0) + 1
+        else:
+            self.data.move_to_end(key)
+            self.hits[name] = self.hits.get(name, 0) + 1
+        return value
+
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+
+    def clear(self, reset_stats=False):
+        self.data.clear()
+        if reset_stats:
+            self.hits.clear()
+            self.misses.clear()
+
+
+    def info(self):
+        return {
+            'hits': sum(self.hits.values()),
+            'misses': sum(self.misses.values()),
+            'size': len(self.data),
+            'maxsize': self.maxsize,
+            'functions': {
+                name: {
+                    'hits': self.hits.get(name, 0),
+                    'misses': self.misses.get(name, 0)
+                }
+                for name in set(self.hits) | set(self.misses)
+            }
+        }
+
+
+_cache_key_functions = {}
+
+def register_cache_key(cls, func):
+    _cache_key_functions[cls] = func
+
+
+def cache_key(value):
+    if value is None or isinstance(value, str):
+        return value
+    elif isinstance(value, (bool, int, float)):
+        # 1, 1.0 and True are equal and hash alike, so they are tagged
+        return (type(value), value)
+
+    func = _cache_key_functions.get(type(value), None)
+    if func is not None:
+        return func(value)
+    elif isinstance(value, (list, tuple)):
+        return tuple(cache_key(x) for x in value)
+    elif isinstance(value, dict):
+        return ('dict',) + tuple(sorted(
+            ((k, cache_key(v)) for k, v in value.items()),
+            key=lambda x: repr(x[0])
+        ))
+    elif isinstance(value, range):
+        return ('range', value.start, value.stop, value.step)
+    elif isinstance(value, np.ndarray):
+        return ('ndarray', value.dtype.str, value.shape, value.tobytes())
+    elif isinstance(value, np.generic):
+        return cache_key(value.item())
+    else:
+        raise TypeError('unhashable value: ' + str(type(value)))
+
+
+def freeze_result(value):
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, (list, tuple)):
+        for x in value:
+            freeze_result(x)
+    elif isinstance(value, dict):
+        for x in value.values():
+            freeze_result(x)
+    return value
+
+
+def copy_result(value):
+    if isinstance(value, list):
+        return [copy_result(x) for x in value]
+    elif isinstance(value, dict):
+        return value.__class__(
+            (k, copy_result(v)) for k, v in value.items()
+        )
+    return value
+
+
+_MISSING = object()
+
+# NumPy arrays in cached results are shared read-only; lists and dicts are
+# copied for each caller, so they can be modified safely. Other objects, e.g.
+# the ModInfo from find_var_mod, are shared as the uncached methods share 
+# them and must not be modified.
+def cached(func):
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        cache = getattr(self, 'cache', None)
+        if cache is None:
+            return func(self, *args, **kwargs)
+
+        try:
+            key = (name, cache_key(args), cache_key(kwargs))
+        except TypeError:
+            return func(self, *args, **kwargs)
+
+        result = cache.get(key, _MISSING, name=name)
+        if result is _MISSING:
+            result = freeze_result(func(self, *args, **kwargs))
+            cache.put(key, result)
+        return copy_result(result)
+
+    return wrapper
@@ -0,0 +1,185 @@
+import os
+import json
+import numpy as np
+from collections import OrderedDict
+
+from .glycomass import GlycanNode, GlycoPeptideMassCalculator, \
+    monosaccharide_index
+
+
+GLYCAN_FRAGMENT_LIBRARY_VERSION = 1
+
+
+class GlycanFragmentLibrary():
+    def __init__(self, library_dir):
+        self.library_dir = library_dir
+
+        manifest_file = os.path.join(library_dir, 'manifest.json')
+        with open(manifest_file, 'r') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('version', None) != \
+            GLYCAN_FRAGMENT_LIBRARY_VERSION:
+            raise ValueError('invalid glycan fragment library version: ' + \
+                             str(self.manifest.get('version', None)))
+
+        def load_array(name):
+            file = os.path.join(library_dir, name + '.npy')
+            if self.manifest['fragmentCount'] == 0:
+                return np.load(file)
+            return np.load(file, mmap_mode='r')
+
+        self.offsets = np.load(os.path.join(library_dir, 'offsets.npy'))
+        self.compositions = load_array('compositions')
+        self.masses = load_array('masses')
+        self.names = load_array('names')
+
+        self.monosaccharides = self.manifest['monosaccharides']
+        self.monosaccharide_mass = self.manifest['monosaccharideMass']
+        self.column_order = sorted(
+            range(len(self.monosaccharides)),
+            key=lambda i: monosaccharide_index(self.monosaccharides[i])
+        )
+
+        with open(os.path.join(library_dir, 'glycans.txt'), 'r') as f:
+            self.glycans = f.read().splitlines()
+        self.index = {
+            glycan: i for i, glycan in enumerate(self.glycans)
+        }
+
+
+    def __len__(self):
+        return len(self.glycans)
+
+
+    def __contains__(self, glycan):
+        return self.get_index(glycan) is not None
+
+
+    def __reduce__(self):
+        return (GlycanFragmentLibrary, (self.library_dir,))
+
+
+    def get_index(self, glycan):
+        if not isinstance(glycan, str):
+            glycan = str(glycan)
+        index = self.index.get(glycan, None)
+        if index is None:
+            index = self.index.get(str(GlycanNode.from_str(glycan)), None)
+        return index
+
+
+    def fragment_compositions(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return [
+            {
+                self.monosaccharides[i]: int(x[i])
+                for i in self.column_order
+                if x[i] > 0
+            }
+            for x in self.compositions[start:end]
+        ]
+
+
+    def fragment_masses(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.masses[start:end]
+
+
+    def fragment_names(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return [x.decode() for x in self.names[start:end]]
+
+
+def load_glycan_fragment_library(library_dir, monosaccharide=None):
+    manifest_file = os.path.join(library_dir, 'manifest.json')
+    if not os.path.exists(manifest_file):
+        return None
+
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('version', None) != GLYCAN_FRAGMENT_LIBRARY_VERSION:
+        return None
+    if monosaccharide is not None and any(
+        monosaccharide.get(k, None) != v
+        for k, v in manifest.get('monosaccharideMass', {}).items()
+    ):
+        return None
+
+    return GlycanFragmentLibrary(library_dir)
+
+
+def build_glycan_fragment_library(glycans, library_dir,
+                                  mass_calculator=None):
+    if mass_calculator is None:
+        mass_calculator = GlycoPeptideMassCalculator()
+    else:
+        mass_calculator = GlycoPeptideMassCalculator(
+            monosaccharide=mass_calculator.monosaccharide
+        )
+
+    os.makedirs(library_dir, exist_ok=True)
+
+    manifest_file = os.path.join(library_dir, 'manifest.json')
+    if os.path.exists(manifest_file):
+        os.remove(manifest_file)
+
+    glycans = list(OrderedDict.fromkeys(
+        str(GlycanNode.from_str(glycan))
+        for glycan in glycans
+    ))
+
+    offsets = [0]
+    compositions = []
+    masses = []
+    names = []
+    for glycan in glycans:
+        fragment = mass_calculator.glycan_fragment(glycan)
+        fragment_mass = mass_calculator.glycan_fragment_mass(glycan)
+        compositions.extend(fragment)
+        masses.extend(fragment_mass['fragment_mass'])
+        names.extend(fragment_mass['fragment_name'])
+        offsets.append(offsets[-1] + len(fragment))
+
+    monosaccharides = sorted(
+        set(k for x in compositions for k in x),
+        key=monosaccharide_index
+    )
+    column = {m: i for i, m in enumerate(monosaccharides)}
+    composition_array = np.zeros(
+        (len(compositions), len(monosaccharides)),
+        dtype=np.int16
+    )
+    for i, x in enumerate(compositions):
+        for k, v in x.items():
+            composition_array[i, column[k]] = v
+
+    np.save(
+        os.path.join(library_dir, 'offsets.npy'),
+        np.array(offsets, dtype=np.int64)
+    )
+    np.save(os.path.join(library_dir, 'compositions.npy'), composition_array)
+    np.save(
+        os.path.join(library_dir, 'masses.npy'),
+        np.array(masses, dtype=np.float64)
+    )
+    np.save(
+        os.path.join(library_dir, 'names.npy'),
+        np.array([x.encode() for x in names], dtype=np.bytes_) \
+            if len(names) > 0 else np.zeros(0, dtype='S1')
+    )
+    with open(os.path.join(library_dir, 'glycans.txt'), 'w') as f:
+        f.writelines(glycan + '\n' for glycan in glycans)
+
+    with open(manifest_file, 'w') as f:
+        json.dump({
+            'version': GLYCAN_FRAGMENT_LIBRARY_VERSION,
+            'glycanCount': len(glycans),
+            'fragmentCount': offsets[-1],
+            'monosaccharides': monosaccharides,
+            'monosaccharideMass': {
+                m: mass_calculator.monosaccharide_mass(m)
+                for m in monosaccharides
+            }
+        }, f, indent=2)
+
+    return GlycanFragmentLibrary(library_dir)
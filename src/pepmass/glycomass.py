@@ -1,86 +1,197 @@
-from functools import reduce
+import weakref
+import numpy as np
+from functools import reduce, lru_cache
 from collections import OrderedDict
 
 from .modmass import ModifiedPeptideMassCalculator, ModInfo, ModSite
-from .pepmass import FragmentTypeInfo
+from .pepmass import FragmentTypeInfo, map_unique
+from .cache import cached, register_cache_key
+
+GLYCAN_MONOSACCHARIDES = ['H', 'N', 'A', 'G', 'F', 'X', 'R']
+
+_monosaccharide_index = {
+    m: i for i, m in enumerate(GLYCAN_MONOSACCHARIDES)
+}
+
+def monosaccharide_index(monosaccharide):
+    index = _monosaccharide_index.get(monosaccharide, None)
+    if index is None:
+        index = len(GLYCAN_MONOSACCHARIDES)
+        GLYCAN_MONOSACCHARIDES.append(monosaccharide)
+        _monosaccharide_index[monosaccharide] = index
+    return index
+
 
 class GlycanNode:
-    def __init__(self, monosaccharide, children=None):
-        self.monosaccharide = monosaccharide
-        self.children = children
+    __slots__ = (
+        'monosaccharide', '_children',
+        '_str', '_composition', '_composition_str',
+        '__weakref__'
+    )
+
+    _interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, monosaccharide, children=None):
+        if children is None:
+            children = ()
+        elif isinstance(children, GlycanNode):
+            children = (children,)
+        else:
+            children = tuple(children)
+
+        key = (monosaccharide, children)
+        node = cls._interned.get(key, None)
+        if node is not None:
+            return node
+
+        node = object.__new__(cls)
+        object.__setattr__(node, 'monosaccharide', monosaccharide)
+        object.__setattr__(node, '_children', children)
+
+        s = '(' + monosaccharide + ''.join(c._str for c in children) + ')'
+        object.__setattr__(node, '_str', s)
+
+        composition = [0] * (monosaccharide_index(monosaccharide) + 1)
+        composition[-1] = 1
+        for c in children:
+            if len(c._composition) > len(composition):
+                composition.extend(
+                    [0] * (len(c._composition) - len(composition))
+                )
+            for i, v in enumerate(c._composition):
+                composition[i] += v
+        object.__setattr__(node, '_composition', tuple(composition))
+        object.__setattr__(node, '_composition_str', None)
+
+        cls._interned[key] = node
+        return node
+
+    def __setattr__(self, name, value):
+        raise AttributeError('GlycanNode is immutable')
+
+    def __reduce__(self):
+        return (GlycanNode, (self.monosaccharide, self._children))
 
     def __str__(self):
-        s = '(' + self.monosaccharide
-        if isinstance(self.children, list):
-            s = s + ''.join(str(c) for c in self.children)
-        elif self.children is not None:
-            s = s + str(self.children)
-        return s + ')'
+        return self._str
+
+    def __repr__(self):
+        return 'GlycanNode(' + repr(self._str) + ')'
+
+    @property
+    def children(self):
+        if len(self._children) == 0:
+            return None
+        return list(self._children)
 
     def composition(self):
-        def add(d1, d2):
-            return {
-                k: d1.get(k, 0) + d2.get(k, 0)
-                for k in set(d1) | set(d2)
-            }
+        return {
+            GLYCAN_MONOSACCHARIDES[i]: v
+            for i, v in enumerate(self._composition)
+            if v > 0
+        }
 
-        d = { self.monosaccharide: 1 }
-        if isinstance(self.children, list):
-            d = reduce(add, (c.composition() for c in self.children), d)
-        elif self.children is not None:
-            d = add(d, self.children.composition())
-        return d
+    def composition_vector(self, monosaccharides=None):
+        if monosaccharides is None:
+            result = np.zeros(len(GLYCAN_MONOSACCHARIDES), dtype=int)
+            result[:len(self._composition)] = self._composition
+            return result
+
+        return np.array([
+            self._composition[i] \
+                if i is not None and i < len(self._composition) else 0
+            for i in (
+                _monosaccharide_index.get(m, None) 
+                for m in monosaccharides
+            )
+        ], dtype=int)
 
     def composition_str(self):
-        composition = self.composition()
-
-        return ''.join((
-            str(k) + '(' + str(v) +')'
-            for k, v in sorted(composition.items(), key=lambda t: t[0])
-        ))
+        if self._composition_str is None:
+            object.__setattr__(self, '_composition_str', ''.join((
+                str(k) + '(' + str(v) +')'
+                for k, v in sorted(
+                    self.composition().items(), 
+                    key=lambda t: t[0]
+                )
+            )))
+        return self._composition_str
 
 
     @staticmethod
     def from_str(s):
-        if s.startswith('(') and s.endswith(')'):
-            s = s[1:-1]
-
-        nodes = list()
-        start = None
-        for i, c in enumerate(s):
-            if c != '(' and c != ')':
-                if start is None:
-                    start = i
-            else:
-                if start is not None:
-                    node = GlycanNode(s[start:i])
-                    if len(nodes) > 0:
-                        if isinstance(nodes[-1].children, list):
-                            nodes[-1].children.append(node)
-                        elif nodes[-1].children is None:
-                            nodes[-1].children = [node]
-                        else:
-                            nodes[-1].children = [nodes[-1].children, node]
-                    nodes.append(node)
-                    start = None
-
-            if c == ')':
-                if len(nodes) <= 1:
-                    raise ValueError('invalid format: ' + s)
-                nodes.pop()
-
-        if len(nodes) == 0 and start is not None:
-            return GlycanNode(s[start:])
-        elif len(nodes) == 1:
-            return nodes[0]
+        if isinstance(s, GlycanNode):
+            return s
+        return parse_glycan(s)
+
+
+# nodes are interned and have no __dict__, so the structure string is the key
+register_cache_key(GlycanNode, lambda node: ('GlycanNode', str(node)))
+
+
+@lru_cache(maxsize=65536)
+def parse_glycan(s):
+    if s.startswith('(') and s.endswith(')'):
+        s = s[1:-1]
+
+    def build(entry):
+        return GlycanNode(entry[0], [build(c) for c in entry[1]])
+
+    nodes = list()
+    start = None
+    for i, c in enumerate(s):
+        if c != '(' and c != ')':
+            if start is None:
+                start = i
         else:
-            raise ValueError('invalid format: ' + s)
+            if start is not None:
+                entry = (s[start:i], [])
+                if len(nodes) > 0:
+                    nodes[-1][1].append(entry)
+                nodes.append(entry)
+                start = None
+
+        if c == ')':
+            if len(nodes) <= 1:
+                raise ValueError('invalid format: ' + s)
+            nodes.pop()
+
+    if len(nodes) == 0 and start is not None:
+        return GlycanNode(s[start:])
+    elif len(nodes) == 1:
+        return build(nodes[0])
+    else:
+        raise ValueError('invalid format: ' + s)
+
+
+
+def add_composition(x, y):
+    if len(x) < len(y):
+        x, y = y, x
+    return tuple(a + b for a, b in zip(x, y)) + x[len(y):]
 
 
+@lru_cache(maxsize=65536)
+def glycan_fragment_compositions(glycan):
+    root = [0] * (monosaccharide_index(glycan.monosaccharide) + 1)
+    root[-1] = 1
+
+    fragments = (tuple(root),)
+    for child in glycan._children:
+        child_fragments = glycan_fragment_compositions(child)
+        result = OrderedDict()
+        for x in fragments:
+            result[x] = None
+            for y in child_fragments:
+                result[add_composition(x, y)] = None
+        fragments = tuple(result)
+
+    return fragments
+
 
 class GlycoPeptideMassCalculator(ModifiedPeptideMassCalculator):
     def __init__(self, monosaccharide=None, fragments=None,
-                 **kwargs):
+                 glycan_library=None, **kwargs):
         if fragments is None:
             fragments = {
                 'b': FragmentTypeInfo.b(),
@@ -107,6 +218,7 @@ class GlycoPeptideMassCalculator(ModifiedPeptideMassCalculator):
             }
 
         self.monosaccharide = monosaccharide
+        self.glycan_library = glycan_library
 
         if not any(filter(
             lambda x: x.name == 'GlycoMod-N(1)' and x.site == 'J',
@@ -265,6 +377,7 @@ class GlycoPeptideMassCalculator(ModifiedPeptideMassCalculator):
             )
         return result
 
+    @cached
     def glycan_mw(self, glycan):
         if isinstance(glycan, str):
             glycan = GlycanNode.from_str(glycan)
@@ -275,6 +388,7 @@ class GlycoPeptideMassCalculator(ModifiedPeptideMassCalculator):
         )
 
 
+    @cached
     def mw(self, sequence, glycan=None, **kwargs):
         result = super(GlycoPeptideMassCalculator, self) \
             .mw(sequence=sequence, **kwargs)
@@ -285,44 +399,46 @@ class GlycoPeptideMassCalculator(ModifiedPeptideMassCalculator):
         return result
 
 
-    def glycan_fragment(self, glycan):
-        def _glycan_fragment(glycan, allow_duplicate=False):
-            def concat(a, b):
-                return a + b
+    def glycan_mw_array(self, glycan):
+        return map_unique(
+            lambda x: self.glycan_mw(x) if x is not None else 0.0,
+            glycan
+        )
 
-            def add(d1, d2):
-                return {
-                    k: d1.get(k, 0) + d2.get(k, 0)
-                    for k in set(d1) | set(d2)
-                }
 
-            def cross_add(l1, l2):
-                return [
-                    add(x1, x2)
-                    for x1 in l1
-                    for x2 in l2
-                ]
+    def mw_array(self, sequence, modification=None, glycan=None, **kwargs):
+        result = super(GlycoPeptideMassCalculator, self) \
+            .mw_array(sequence, modification=modification, **kwargs)
 
-            d = { glycan.monosaccharide: 1 }
-            if isinstance(glycan.children, list):
-                r = list(map(lambda x: add(d, x), reduce(cross_add, (
-                    concat([{}], _glycan_fragment(c))
-                    for c in glycan.children
-                ))))
-            elif glycan.children is not None:
-                r = concat([d], list(map(
-                    lambda x: add(d, x),
-                    _glycan_fragment(glycan.children)
-                )))
-            else:
-                r = [d]
+        if glycan is not None:
+            result += self.glycan_mw_array(glycan)
+
+        return result
+
+
+    def get_glycan_library(self):
+        library = self.glycan_library
+        if isinstance(library, str):
+            from .glycanlibrary import load_glycan_fragment_library
+            library_dir = library
+            library = load_glycan_fragment_library(
+                library_dir, monosaccharide=self.monosaccharide
+            )
+            if library is None:
+                import warnings
+                warnings.warn(
+                    'glycan fragment library not loaded: ' + library_dir
+                )
+            self.glycan_library = library
+        return library
 
-            if not allow_duplicate:
-                r = list(OrderedDict((
-                    frozenset(d.items()), d)
-                    for d in r
-                ).values())
-            return r
+
+    def glycan_fragment(self, glycan):
+        library = self.get_glycan_library()
+        if library is not None:
+            index = library.get_index(glycan)
+            if index is not None:
+                return library.fragment_compositions(index)
 
         if isinstance(glycan, str):
             glycan = GlycanNode.from_str(glycan)
@@ -331,40 +447,62 @@ class GlycoPeptideMassCalculator(ModifiedPeptideMassCalculator):
                 'invalid glycan: ' + str(glycan)
             )
 
-        fragment = _glycan_fragment(glycan)
-        fragment.remove(glycan.composition())
-        return fragment
+        return [
+            {
+                GLYCAN_MONOSACCHARIDES[i]: v
+                for i, v in enumerate(x)
+                if v > 0
+            }
+            for x in glycan_fragment_compositions(glycan)
+            if x != glycan._composition
+        ]
 
 
-    def glycan_fragment_mw(self, sequence, glycan, **kwargs):
-        def _glycan_fragment_mw(fragment):
-            return sum(
-                self.monosaccharide_mass(k) * v
-                for k, v in fragment.items()
-            )
+    @cached
+    def glycan_fragment_mass(self, glycan):
+        library = self.get_glycan_library()
+        if library is not None:
+            index = library.get_index(glycan)
+            if index is not None:
+                return {
+                    'fragment_mass': library.fragment_masses(index),
+                    'fragment_name': library.fragment_names(index)
+                }
+
+        fragment = self.glycan_fragment(glycan)
+        return {
+            'fragment_mass': np.array([
+                sum(
+                    self.monosaccharide_mass(k) * v
+                    for k, v in x.items()
+                )
+                for x in fragment
+            ], dtype=np.float64),
+            'fragment_name': [
+                'Y-' + ''.join(
+                    k + '(' + str(v) + ')'
+                    for k, v in x.items()
+                )
+                for x in fragment
+            ]
+        }
+
+
+    def glycan_fragment_name(self, glycan):
+        return self.glycan_fragment_mass(glycan)['fragment_name']
 
-        def _glycan_fragment_name(fragment):
-            return ''.join(
-                k + '(' + str(v) + ')'
-                for k, v in fragment.items()
-            )
 
+    def glycan_fragment_mw(self, sequence, glycan, **kwargs):
         seq_mw = super(GlycoPeptideMassCalculator, self) \
             .mw(sequence=sequence, **kwargs)
 
-        fragment = self.glycan_fragment(glycan)
+        fragment = self.glycan_fragment_mass(glycan)
 
-        fragment_mw = [
-            seq_mw + _glycan_fragment_mw(x)
-            for x in fragment
-        ]
-        fragment_name = [
-            'Y-' + _glycan_fragment_name(x)
-            for x in fragment
+        fragment_mw = [seq_mw] + [
+            seq_mw + float(x)
+            for x in fragment['fragment_mass']
         ]
-
-        fragment_mw.insert(0, seq_mw)
-        fragment_name.insert(0, 'Y0')
+        fragment_name = ['Y0'] + list(fragment['fragment_name'])
 
         mod = next((
             mod for mod in self.variable_modifications
@@ -547,6 +685,89 @@ class GlycoPeptideMassCalculator(ModifiedPeptideMassCalculator):
         return fragment_mw
 
 
+    def fragment_ion_series(self, sequence, modification=None,
+                            fragment_type='b', glycan_site=None,
+                            **kwargs):
+        if isinstance(fragment_type, str):
+            fragment_type = [fragment_type]
+
+        fragment_type_dict = OrderedDict()
+        for t in fragment_type:
+            if t in self.fragments:
+                fragment_type_dict.setdefault('naked', []).append(t)
+                continue
+            frag = next((
+                frag for frag in self.fragments
+                if t.startswith(frag)
+            ), None)
+            if frag is None:
+                raise ValueError('unknown fragment type: ' + t)
+            fragment_type_dict.setdefault(t[len(frag):], []).append(frag)
+
+        series = []
+
+        naked_type = fragment_type_dict.pop('naked', None)
+        if naked_type is not None:
+            series.extend(
+                super(GlycoPeptideMassCalculator, self) \
+                .fragment_ion_series(
+                    sequence=sequence,
+                    modification=modification,
+                    fragment_type=naked_type,
+                    **kwargs
+                )
+            )
+
+        if len(fragment_type_dict) == 0:
+            return series
+
+        if glycan_site is not None:
+            glyco_position = glycan_site
+        else:
+            glyco_position = sequence.find('J') + 1
+        if (glyco_position <= 0):
+            raise ValueError('Glyco site not found in ' + sequence)
+
+        glyco_count = np.zeros(len(sequence), dtype=np.int32)
+        glyco_count[glyco_position - 1] = 1
+        glyco_count = np.cumsum(glyco_count)
+
+        for k, v in fragment_type_dict.items():
+            glyco_mod_site = ModSite(
+                name='GlycoMod' + k,
+                position=glyco_position,
+                site=sequence[glyco_position - 1]
+            )
+            if isinstance(modification, list):
+                new_modification = modification + [glyco_mod_site]
+            elif modification is not None:
+                new_modification = [modification, glyco_mod_site]
+            else:
+                new_modification = glyco_mod_site
+
+            new_series = super(GlycoPeptideMassCalculator, self) \
+                .fragment_ion_series(
+                    sequence=sequence,
+                    modification=new_modification,
+                    fragment_type=v,
+                    **kwargs
+                )
+
+            glyco_mod = self.find_var_mod(sequence, glyco_mod_site)
+            mask_glycosite = glyco_mod is not None and \
+                glyco_mod.site == 'J'
+
+            for t, l, mw in new_series:
+                if mask_glycosite:
+                    mw = np.where(
+                        self.fragment_cumsum(glyco_count, t) == 0,
+                        np.nan, mw
+                    )
+                series.append((t + k, l, mw))
+
+        return series
+
+
     def oxonium_ion_mz(self, monosaccharide=None, glycan=None):
         if isinstance(monosaccharide, str):
             monosaccharide = [monosaccharide]
@@ -1,4 +1,9 @@
-from .pepmass import PeptideMassCalculator
+import time
+import numpy as np
+from collections import OrderedDict
+
+from .pepmass import PeptideMassCalculator, map_unique
+from .cache import cached, cache_key, register_cache_key
 
 class ModInfo:
     def __init__(self, name, site, delta_mass, 
@@ -53,6 +58,15 @@ class ModSite:
             d.get('position', None),
             d.get('site', None)
         )
+
+
+register_cache_key(ModInfo, lambda mod: (
+    'ModInfo', mod.name, cache_key(mod.site), cache_key(mod.delta_mass),
+    mod.loss_name, cache_key(mod.loss_mass)
+))
+register_cache_key(ModSite, lambda mod: (
+    'ModSite', mod.name, cache_key(mod.position), mod.site
+))
     
 
 
@@ -123,7 +137,52 @@ class ModifiedPeptideMassCalculator(PeptideMassCalculator):
         
         self.variable_modifications = variable_modifications
 
+        self.loss_specs = {}
+        self.loss_spec_stats = {'hits': 0, 'misses': 0, 'time': 0.0}
+
+
+    def clear_cache(self, reset_stats=False):
+        super(ModifiedPeptideMassCalculator, self) \
+            .clear_cache(reset_stats=reset_stats)
+        self.loss_specs.clear()
+        if reset_stats:
+            self.loss_spec_stats.update({'hits': 0, 'misses': 0, 'time': 0.0})
+
+
+    def loss_spec_info(self):
+        info = self.loss_spec_stats.copy()
+        info['size'] = len(self.loss_specs)
+        return info
+
+
+    def compile_loss(self, loss):
+        key = cache_key(loss)
+        spec = self.loss_specs.get(key, None)
+        if spec is not None:
+            self.loss_spec_stats['hits'] += 1
+            return spec
 
+        start = time.perf_counter()
+        spec = LossSpec(
+            loss, self.neutral_losses,
+            self.fixed_modifications + self.variable_modifications
+        )
+        self.loss_spec_stats['time'] += time.perf_counter() - start
+        self.loss_spec_stats['misses'] += 1
+        self.loss_specs[key] = spec
+        return spec
+
+
+    def set_modifications(self, fixed_modifications=None,
+                          variable_modifications=None):
+        if fixed_modifications is not None:
+            self.fixed_modifications = fixed_modifications
+        if variable_modifications is not None:
+            self.variable_modifications = variable_modifications
+        self.clear_cache()
+
+
+    @cached
     def find_var_mod(self, sequence, modification):
         def __find_mod(modification_list, name, site):
             mod = next((
@@ -168,6 +227,7 @@ class ModifiedPeptideMassCalculator(PeptideMassCalculator):
             )
 
 
+    @cached
     def mw(self, sequence, modification=None, **kwargs):
         def _fixed_mod_count(sequence, mod, site=None):
             if isinstance(mod, ModInfo):
@@ -220,6 +280,17 @@ class ModifiedPeptideMassCalculator(PeptideMassCalculator):
         return result
 
 
+    def mw_array(self, sequence, modification=None, **kwargs):
+        if modification is None:
+            return super(ModifiedPeptideMassCalculator, self) \
+                .mw_array(sequence, **kwargs)
+
+        return map_unique(
+            lambda x, y: self.mw(sequence=x, modification=y, **kwargs),
+            sequence, modification
+        )
+
+
     def fragment_mod_count(self, sequence, modification=None,
                            fragment_type = 'b'):
         def _fixed_mod_count(sequence):
@@ -555,89 +626,6 @@ class ModifiedPeptideMassCalculator(PeptideMassCalculator):
                     str(type(fragment_mw)))
 
 
-        def _parse_loss(loss):
-            def __parse_loss_single(loss):
-                if loss == 'modloss':
-                    return None, 'any'
-                if loss in self.neutral_losses:
-                    return loss, None
-                for m in self.fixed_modifications + self.variable_modifications:
-                    if m.loss_name == loss:
-                        return None, loss
-                return None, None
-
-            def __parse_loss_term(loss):
-                c, m = __parse_loss_single(loss)
-                if c is not None or m is not None:
-                    return c, m
-                t = loss.split('*', 1)
-                if len(t) == 2:
-                    if t[0].isdigit():
-                        n = int(t[0])
-                        if n > 0:
-                            c, m = __parse_loss_single(t[1])
-                            if m is not None and m != 'any':
-                                return None, {m: n}
-                return None, None
-
-            def __parse_loss_sum(loss):
-                c, m = __parse_loss_term(loss)
-                if c is not None or m is not None:
-                    return c, m
-                common_loss = None
-                mod_loss = None
-                for s in loss.split('+'):
-                    c, m = __parse_loss_term(s)
-                    if c is not None:
-                        if common_loss != None:
-                            return None, None
-                        common_loss = c
-                    elif m is not None:
-                        if mod_loss == 'any':
-                            return None, None
-                        if m == 'any':
-                            if mod_loss is not None:
-                                return None, None
-                            mod_loss = 'any'
-                            continue
-                        if mod_loss is None:
-                            mod_loss = m
-                            continue
-                        if isinstance(mod_loss, str):
-                            mod_loss = {mod_loss: 1}
-                        if isinstance(m, str):
-                            mod_loss[m] = mod_loss.get(m, 0) + 1
-                        elif isinstance(m, dict):
-                            for k, v in m:
-                                mod_loss[k] = mod_loss.get(k, 0) + v
-                        else:
-                            return None, None
-                    else:
-                        return None, None
-                return common_loss, mod_loss
-
-            if loss is None:
-                return 'noloss', None
-            if loss == '' or loss == 'noloss' or loss == 'None':
-                return 'noloss', None
-
-            if isinstance(loss, str):
-                c, m = __parse_loss_sum(loss)
-                if c is not None or m is not None:
-                    return c, m
-                else:
-                    raise ValueError('invalid loss: ' + loss)
-
-            if isinstance(loss, list) or \
-                isinstance(loss, tuple):
-                return [
-                    _parse_loss(l)
-                    for l in loss
-                ]
-            else:
-                raise TypeError('invalid loss: ', str(type(loss)))
-
-
         def _filter_loss_mass(loss_mass, loss):
             def __get_loss_id(loss):
                 if isinstance(loss, tuple):
@@ -782,17 +770,17 @@ class ModifiedPeptideMassCalculator(PeptideMassCalculator):
             else:
                 return fragment_mw
 
-        loss = _parse_loss(loss)
-        if isinstance(loss, list):
-            has_mod_loss = any(map(lambda t: t[1] is not None, loss))
-        else:
-            has_mod_loss = loss[1] is not None
-        if isinstance(loss, list):
+        spec = self.compile_loss(loss)
+        if isinstance(loss, (list, tuple)):
+            loss = spec.parsed
             common_loss = list(set(map(lambda t: t[0], loss)))
-        elif has_mod_loss:
-            common_loss = [loss[0]]
         else:
-            common_loss = loss[0]
+            loss = spec.parsed[0]
+            if spec.has_mod_loss:
+                common_loss = [loss[0]]
+            else:
+                common_loss = loss[0]
+        has_mod_loss = spec.has_mod_loss
 
 
         fragment_mw = super(ModifiedPeptideMassCalculator, self) \
@@ -821,6 +809,271 @@ class ModifiedPeptideMassCalculator(PeptideMassCalculator):
 
         return fragment_mw
 
+    def fragment_mod_indicators(self, sequence, modification=None):
+        result = OrderedDict()
+
+        for mod in self.fixed_modifications:
+            count = np.zeros(len(sequence), dtype=np.int32)
+            if mod.site == 'N-term':
+                count[0] = 1
+            elif mod.site == 'C-term':
+                count[-1] = 1
+            else:
+                count[[
+                    i for i, aa in enumerate(sequence)
+                    if aa == mod.site or aa in mod.site
+                ]] = 1
+            if count.any():
+                result[mod] = count
+
+        if isinstance(modification, (dict, ModSite)):
+            modification = [modification]
+        if isinstance(modification, list):
+            for m in modification:
+                if isinstance(m, dict):
+                    m = ModSite.from_dict(m)
+                elif not isinstance(m, ModSite):
+                    raise TypeError('invalid modification: ' + \
+                        str(type(m)))
+                mod = self.find_var_mod(sequence, m)
+                if mod is None:
+                    continue
+                count = result.get(mod, None)
+                if count is None:
+                    count = np.zeros(len(sequence), dtype=np.int32)
+                    result[mod] = count
+                if m.site == 'N-term':
+                    count[0] += 1
+                elif m.site == 'C-term':
+                    count[-1] += 1
+                else:
+                    count[m.position - 1] += 1
+        elif modification is not None:
+            raise TypeError('invalid modification: ' + \
+                str(type(modification)))
+
+        return result
+
+
+    def fragment_ion_series(self, sequence, modification=None,
+                            fragment_type='b', loss=None, **kwargs):
+        if isinstance(fragment_type, str):
+            fragment_type = [fragment_type]
+
+        spec = self.compile_loss(loss)
+
+        mod_indicators = self.fragment_mod_indicators(
+            sequence, modification
+        )
+
+        residue_masses = self.residue_masses(sequence)
+        for mod, count in mod_indicators.items():
+            residue_masses += mod.delta_mass * count
+        residue_cumsum = np.cumsum(residue_masses)
+
+        fragment_mw = [
+            (t, self.fragment_cumsum(residue_cumsum, t) + \
+                self.fragment_atom_mass(t))
+            for t in fragment_type
+        ]
+
+        series = [
+            (t, c, mw - loss_mass, None)
+            for c, loss_mass in zip(spec.common_loss, spec.common_loss_mass)
+            for t, mw in fragment_mw
+        ]
+
+        if not spec.has_mod_loss:
+            return [x[:3] for x in series]
+
+        mod_loss_mass = {
+            t: self.fragment_mod_loss_mass(
+                sequence, mod_indicators, t, spec.mod_loss_id
+            )
+            for t in fragment_type
+        }
+        series.extend([
+            (
+                t, r + ('+' + c if c != 'noloss' else ''), 
+                mw - mod_loss_mass[t][r], c
+            )
+            for t, c, mw, _ in series
+            for r in mod_loss_mass[t]
+        ])
+
+        return [
+            (t, l, mw)
+            for t, l, mw, c in series
+            if l in spec.loss_id or \
+                c is not None and c in spec.common_loss_any_mod_loss
+        ]
+
+
+    def fragment_mod_loss_mass(self, sequence, mod_indicators, 
+                               fragment_type, mod_loss_id='any'):
+        loss_mass_list = []
+        for mod, count in mod_indicators.items():
+            if mod.loss_mass is None:
+                continue
+            count = self.fragment_cumsum(np.cumsum(count), fragment_type)
+            if len(count) == 0:
+                continue
+
+            for n in range(1, count.max() + 1):
+                name = (str(n) + '*' if n > 1 else '') + mod.loss_name
+                loss_mass_list.append((
+                    name, [mod],
+                    np.where(count >= n, n * mod.loss_mass, np.nan)
+                ))
+                for i in range(len(loss_mass_list)):
+                    if mod in loss_mass_list[i][1]:
+                        continue
+                    loss_mass_list.append((
+                        loss_mass_list[i][0] + '+' + name,
+                        loss_mass_list[i][1] + [mod],
+                        np.where(
+                            count >= n, 
+                            loss_mass_list[i][2] + n * mod.loss_mass, 
+                            np.nan
+                        )
+                    ))
+
+        return OrderedDict(
+            (name, mass)
+            for name, _, mass in loss_mass_list
+            if mod_loss_id == 'any' or name in mod_loss_id
+        )
+
+
+
+def parse_loss(loss, neutral_losses, modifications):
+    def parse_loss_single(loss):
+        if loss == 'modloss':
+            return None, 'any'
+        if loss in neutral_losses:
+            return loss, None
+        for m in modifications:
+            if m.loss_name == loss:
+                return None, loss
+        return None, None
+
+    def parse_loss_term(loss):
+        c, m = parse_loss_single(loss)
+        if c is not None or m is not None:
+            return c, m
+        t = loss.split('*', 1)
+        if len(t) == 2:
+            if t[0].isdigit():
+                n = int(t[0])
+                if n > 0:
+                    c, m = parse_loss_single(t[1])
+                    if m is not None and m != 'any':
+                        return None, {m: n}
+        return None, None
+
+    def parse_loss_sum(loss):
+        c, m = parse_loss_term(loss)
+        if c is not None or m is not None:
+            return c, m
+        common_loss = None
+        mod_loss = None
+        for s in loss.split('+'):
+            c, m = parse_loss_term(s)
+            if c is not None:
+                if common_loss != None:
+                    return None, None
+                common_loss = c
+            elif m is not None:
+                if mod_loss == 'any':
+                    return None, None
+                if m == 'any':
+                    if mod_loss is not None:
+                        return None, None
+                    mod_loss = 'any'
+                    continue
+                if mod_loss is None:
+                    mod_loss = m
+                    continue
+                if isinstance(mod_loss, str):
+                    mod_loss = {mod_loss: 1}
+                if isinstance(m, str):
+                    mod_loss[m] = mod_loss.get(m, 0) + 1
+                elif isinstance(m, dict):
+                    for k, v in m.items():
+                        mod_loss[k] = mod_loss.get(k, 0) + v
+                else:
+                    return None, None
+            else:
+                return None, None
+        return common_loss, mod_loss
+
+    if loss is None:
+        return 'noloss', None
+    if loss == '' or loss == 'noloss' or loss == 'None':
+        return 'noloss', None
+
+    if isinstance(loss, str):
+        c, m = parse_loss_sum(loss)
+        if c is not None or m is not None:
+            return c, m
+        else:
+            raise ValueError('invalid loss: ' + loss)
+    else:
+        raise TypeError('invalid loss: ' + str(type(loss)))
+
+
+class LossSpec:
+    def __init__(self, loss, neutral_losses, modifications):
+        if loss is None or isinstance(loss, str):
+            loss = [loss]
+
+        self.parsed = [
+            parse_loss(l, neutral_losses, modifications)
+            for l in loss
+        ]
+        self.has_mod_loss = any(m is not None for c, m in self.parsed)
+
+        self.common_loss = list(OrderedDict.fromkeys(
+            c if c is not None else 'noloss'
+            for c, m in self.parsed
+        ))
+        self.common_loss_mass = np.array([
+            neutral_losses[c] if c != 'noloss' else 0.0
+            for c in self.common_loss
+        ], dtype=np.float64)
+
+        self.mod_loss_id = set()
+        for c, m in self.parsed:
+            if m == 'any':
+                self.mod_loss_id = 'any'
+                break
+            if m is not None:
+                self.mod_loss_id.add(format_mod_loss(m))
+
+        self.loss_id = set()
+        self.common_loss_any_mod_loss = set()
+        for c, m in self.parsed:
+            if m is None:
+                self.loss_id.add(c)
+            elif m == 'any':
+                self.common_loss_any_mod_loss.add(
+                    c if c is not None else 'noloss'
+                )
+            else:
+                self.loss_id.add(
+                    format_mod_loss(m) + ('+' + c if c is not None else '')
+                )
+
+
+def format_mod_loss(mod_loss):
+    if isinstance(mod_loss, dict):
+        return '+'.join(
+            (str(v) + '*' if v > 1 else '') + k
+            for k, v in mod_loss.items()
+        )
+    else:
+        return mod_loss
+
 
 
 if __name__ == '__main__':
@@ -1,3 +1,8 @@
+import numpy as np
+
+from .cache import LRUCache, cached, cache_key
+
+
 class FragmentTypeInfo:
     def __init__(self, name, n_term=True, atoms=None):
         self.name = name
@@ -32,10 +37,37 @@ class FragmentTypeInfo:
         )
 
 
+def map_unique(func, *columns):
+    if len(set(len(x) for x in columns)) > 1:
+        raise ValueError('columns of different lengths: ' + \
+                         str([len(x) for x in columns]))
+
+    index = {}
+    values = []
+    inverse = []
+    for row in zip(*columns):
+        try:
+            key = cache_key(row)
+        except TypeError:
+            inverse.append(len(values))
+            values.append(func(*row))
+            continue
+
+        i = index.get(key, None)
+        if i is None:
+            i = len(values)
+            index[key] = i
+            values.append(func(*row))
+        inverse.append(i)
+
+    return np.array(values, dtype=np.float64) \
+        [np.array(inverse, dtype=np.int64)]
+
+
 class PeptideMassCalculator:
     def __init__(self, aa_residues=None, elements=None,
                  fragments=None, neutral_losses=None,
-                 **kwargs):
+                 cache_size=4096, **kwargs):
         if aa_residues is None:
             aa_residues = {
                 'A': 71.037114,
@@ -94,6 +126,21 @@ class PeptideMassCalculator:
             
         self.neutral_losses = neutral_losses
 
+        if cache_size is not None and cache_size > 0:
+            self.cache = LRUCache(maxsize=cache_size)
+        else:
+            self.cache = None
+
+
+    def cache_info(self):
+        if self.cache is None:
+            return None
+        return self.cache.info()
+
+    def clear_cache(self, reset_stats=False):
+        if self.cache is not None:
+            self.cache.clear(reset_stats=reset_stats)
+
 
     def aa_residue_mass(self, aa):
         result = self.aa_residues.get(aa, None)
@@ -141,6 +188,22 @@ class PeptideMassCalculator:
         return mw
 
 
+    def mw_array(self, sequence, **kwargs):
+        return map_unique(
+            lambda x: self.mw(sequence=x, **kwargs),
+            sequence
+        )
+
+
+    def precursor_mz_array(self, sequence, charge, **kwargs):
+        mw = self.mw_array(sequence, **kwargs)
+        charge = np.asarray(charge)
+        if np.any(charge == 0):
+            raise ValueError('invalid charge: 0')
+        return (mw + charge * self.element_mass('H')) / np.abs(charge)
+
+
+    @cached
     def precursor_mz(self, sequence, charge=1, **kwargs):
         def _precursor_mz_from_mw(mw, charge, allow_list=False):
             if isinstance(charge, int):
@@ -305,6 +368,90 @@ class PeptideMassCalculator:
         return fragment_mw
 
 
+    def residue_masses(self, sequence, **kwargs):
+        if not isinstance(sequence, str):
+            raise TypeError('invalid sequence: ' + str(type(sequence)))
+        elif len(sequence) <= 1:
+            raise ValueError('sequence length < 2: ' + sequence)
+
+        return np.fromiter(
+            (self.aa_residue_mass(aa) for aa in sequence),
+            dtype=np.float64, count=len(sequence)
+        )
+
+
+    def fragment_atom_mass(self, fragment_type):
+        frag_type = self.fragment_type(fragment_type)
+        if frag_type.atoms is None:
+            return 0.0
+        elif isinstance(frag_type.atoms, dict):
+            return sum(
+                self.element_mass(k) * v
+                for k, v in frag_type.atoms.items()
+            )
+        else:
+            raise TypeError('invalid frag_type.atoms: ' + \
+                str(type(frag_type.atoms)))
+
+
+    def fragment_cumsum(self, values, fragment_type):
+        if self.fragment_type(fragment_type).n_term:
+            return values[:-1]
+        else:
+            return values[-1] - values[-2::-1]
+
+
+    def fragment_ion_series(self, sequence, fragment_type='b',
+                            loss='noloss', **kwargs):
+        if isinstance(fragment_type, str):
+            fragment_type = [fragment_type]
+        if loss is None or isinstance(loss, str):
+            loss = [loss]
+
+        residue_cumsum = np.cumsum(self.residue_masses(sequence))
+
+        fragment_mw = [
+            (t, self.fragment_cumsum(residue_cumsum, t) + \
+                self.fragment_atom_mass(t))
+            for t in fragment_type
+        ]
+
+        series = []
+        for l in loss:
+            if l is None or l == '' or l == 'None':
+                l = 'noloss'
+            loss_mass = self.neutral_loss_mass(l) if l != 'noloss' else 0.0
+            series.extend(
+                (t, l, mw - loss_mass)
+                for t, mw in fragment_mw
+            )
+        return series
+
+
+    @cached
+    def fragment_ions(self, sequence, fragment_type='b', charge=1,
+                      loss='noloss', **kwargs):
+        if isinstance(charge, int):
+            charge = [charge]
+        elif not isinstance(charge, (list, tuple, range, np.ndarray)):
+            raise TypeError('invalid charge: ' + str(type(charge)))
+        charge = np.asarray(charge, dtype=np.int32)
+        if np.any(charge <= 0):
+            raise ValueError('invalid charge: ' + str(charge.tolist()))
+
+        series = self.fragment_ion_series(
+            sequence=sequence,
+            fragment_type=fragment_type,
+            loss=loss,
+            **kwargs
+        )
+        return fragment_ion_records(
+            series, charge, 
+            proton_mass=self.element_mass('proton')
+        )
+
+
+    @cached
     def fragment_mz(self, sequence, fragment_type='b', charge=1, loss='noloss',
                     **kwargs):
         def _fragment_mz_from_mw(fragment_mw, charge, allow_list=False):
@@ -378,6 +525,44 @@ class PeptideMassCalculator:
         return fragment_mz
 
 
+def fragment_ion_dtype(type_length=1, loss_length=1):
+    return np.dtype([
+        ('fragmentMZ', np.float64),
+        ('fragmentType', 'U' + str(max(type_length, 1))),
+        ('fragmentNumber', np.int32),
+        ('fragmentCharge', np.int32),
+        ('fragmentLossType', 'U' + str(max(loss_length, 1)))
+    ])
+
+
+def fragment_ion_records(series, charge, proton_mass):
+    if len(series) == 0 or len(charge) == 0:
+        return np.zeros(0, dtype=fragment_ion_dtype())
+
+    fragment_type, loss_type, fragment_mw = zip(*series)
+    fragment_type = np.array(fragment_type)
+    loss_type = np.array(loss_type)
+    fragment_mw = np.vstack(fragment_mw)
+    charge = np.asarray(charge)[:, None, None]
+    fragment_mz = (fragment_mw[None, :, :] + charge * proton_mass) / charge
+
+    valid = ~np.isnan(fragment_mz)
+    charge_index, series_index, number_index = np.nonzero(valid)
+
+    result = np.empty(
+        len(charge_index), 
+        dtype=fragment_ion_dtype(
+            fragment_type.dtype.itemsize // 4, 
+            loss_type.dtype.itemsize // 4
+        )
+    )
+    result['fragmentMZ'] = fragment_mz[valid]
+    result['fragmentType'] = fragment_type[series_index]
+    result['fragmentNumber'] = number_index + 1
+    result['fragmentCharge'] = charge[charge_index, 0, 0]
+    result['fragmentLossType'] = loss_type[series_index]
+    return result
+
 
 if __name__ == '__main__':
     pep_calc = PeptideMassCalculator();
@@ -1,5 +1,7 @@
 from assay import GlycoAssayBuilder 
 from assay.annotation import SpectrumAnnotator
+from spectra.mgfreader import MgfReader
+from util import parallel_map, split_chunks
 from .pglyco2assay import pGlycoToAssayConverter
 
 import numpy as np
@@ -61,6 +63,22 @@ def remove_suspicious_glycan_site(psm_report):
     return psm_report.iloc[data['index'].sort_values()]
 
 
+def filter_psm_report(psm_report, total_fdr_cutoff=0.01,
+                      clean_glycan_struct=False,
+                      clean_glycan_site=False):
+    if total_fdr_cutoff is not None:
+        psm_report = psm_report \
+            .loc[psm_report['TotalFDR'] <= total_fdr_cutoff, :]
+    
+    if clean_glycan_struct:
+        psm_report = remove_suspicious_glycan_struct(psm_report)
+        
+    if clean_glycan_site:
+        psm_report = remove_suspicious_glycan_site(psm_report)
+        
+    return psm_report
+
+
 def extract_assays_from_spectra(psm_report, spectra, 
                                 total_fdr_cutoff=0.01,
                                 clean_glycan_struct=False,
@@ -72,15 +90,12 @@ def extract_assays_from_spectra(psm_report, spectra,
     )
     pglyco = pGlycoToAssayConverter()        
     
-    if total_fdr_cutoff is not None:
-        psm_report = psm_report \
-            .loc[psm_report['TotalFDR'] <= total_fdr_cutoff, :]
-    
-    if clean_glycan_struct:
-        psm_report = remove_suspicious_glycan_struct(psm_report)
-        
-    if clean_glycan_site:
-        psm_report = remove_suspicious_glycan_site(psm_report)
+    psm_report = filter_psm_report(
+        psm_report, 
+        total_fdr_cutoff=total_fdr_cutoff,
+        clean_glycan_struct=clean_glycan_struct,
+        clean_glycan_site=clean_glycan_site
+    )
     
     def convert(sp):
         row = np.where(psm_report['PepSpec'] == sp['metadata']['title'])[0]
@@ -125,15 +140,12 @@ def extract_assays_from_glabel(psm_report, glabel_report,
     pglyco = pGlycoToAssayConverter(matched_ion_has_mz=matched_ion_has_mz)
     assay_builder = GlycoAssayBuilder()
     
-    if total_fdr_cutoff is not None:
-        psm_report = psm_report \
-            .loc[psm_report['TotalFDR'] <= total_fdr_cutoff, :]
-    
-    if clean_glycan_struct:
-        psm_report = remove_suspicious_glycan_struct(psm_report)
-    
-    if clean_glycan_site:
-        psm_report = remove_suspicious_glycan_site(psm_report)
+    psm_report = filter_psm_report(
+        psm_report, 
+        total_fdr_cutoff=total_fdr_cutoff,
+        clean_glycan_struct=clean_glycan_struct,
+        clean_glycan_site=clean_glycan_site
+    )
         
     assays = pglyco.report_to_assays(
         psm_report, glabel_report, 
@@ -155,5 +167,143 @@ def extract_assays_from_glabel(psm_report, glabel_report,
     if not return_generator:
         assays = list(assays)    
     return assays
+
+
+def get_mgf_spectra(spectra_file, titles=None, index_dir=None):
+    with MgfReader(spectra_file, index=titles is not None, 
+                   index_dir=index_dir, engine='block') as reader:
+        if titles is not None:
+            for spec in reader.iter_titles(titles):
+                yield spec
+            return
+        
+        while True:
+            spec = reader.read_spectrum()
+            if spec is None:
+                break
+            yield spec
+            
+
+def extract_assays_from_mgf(psm_report, spectra_file, use_index=True,
+                            index_dir=None, **kwargs):
+    if use_index:
+        titles = set(filter_psm_report(
+            psm_report, 
+            total_fdr_cutoff=kwargs.get('total_fdr_cutoff', 0.01)
+        )['PepSpec'])
+    else:
+        titles = None
+    
+    return extract_assays_from_spectra(
+        psm_report=psm_report,
+        spectra=get_mgf_spectra(
+            spectra_file, titles=titles, index_dir=index_dir
+        ),
+        return_generator=False,
+        **kwargs
+    )
+    
+
+def get_mgf_titles(spectra_file, index_dir=None):
+    with MgfReader(spectra_file, index_dir=index_dir) as reader:
+        return list(reader.load_index().keys())
+    
+
+def _get_mgf_titles_task(task):
+    return get_mgf_titles(**task)
+    
+    
+def split_psm_report_by_mgf(psm_report, spectra_files, index_dir=None,
+                            processes=None):
+    spectra_titles = parallel_map(
+        _get_mgf_titles_task, 
+        (
+            {'spectra_file': spectra_file, 'index_dir': index_dir}
+            for spectra_file in spectra_files
+        ),
+        processes=processes
+    )
+    return [
+        psm_report.loc[psm_report['PepSpec'].isin(titles), :]
+        for titles in spectra_titles
+    ]
+    
+
+def _extract_assays_from_mgf_task(task):
+    return extract_assays_from_mgf(**task)
+    
+
+def _extract_assays_from_glabel_task(task):
+    return extract_assays_from_glabel(**task)
+    
+
+def extract_assays_from_mgf_files(psm_report, spectra_files,
+                                  use_index=True, index_dir=None,
+                                  total_fdr_cutoff=0.01,
+                                  clean_glycan_struct=False,
+                                  clean_glycan_site=False,
+                                  processes=None):
+    psm_report = filter_psm_report(
+        psm_report, 
+        total_fdr_cutoff=total_fdr_cutoff,
+        clean_glycan_struct=clean_glycan_struct,
+        clean_glycan_site=clean_glycan_site
+    )
+    
+    if processes is not None and processes > 1:
+        psm_reports = split_psm_report_by_mgf(
+            psm_report, spectra_files, 
+            index_dir=index_dir,
+            processes=processes
+        )
+    else:
+        psm_reports = [psm_report] * len(spectra_files)
+    
+    tasks = (
+        {
+            'psm_report': report,
+            'spectra_file': spectra_file,
+            'use_index': use_index,
+            'index_dir': index_dir,
+            'total_fdr_cutoff': None
+        }
+        for report, spectra_file in zip(psm_reports, spectra_files)
+    )
+    return zip(spectra_files, parallel_map(
+        _extract_assays_from_mgf_task, tasks,
+        processes=processes
+    ))
+
+
+def extract_assays_from_glabel_shards(psm_report, glabel_report, 
+                                      matched_ion_has_mz=False,
+                                      total_fdr_cutoff=0.01,
+                                      clean_glycan_struct=False,
+                                      clean_glycan_site=False,
+                                      processes=None, shards=None):
+    psm_report = filter_psm_report(
+        psm_report, 
+        total_fdr_cutoff=total_fdr_cutoff,
+        clean_glycan_struct=clean_glycan_struct,
+        clean_glycan_site=clean_glycan_site
+    )
+    
+    if shards is None:
+        shards = (processes or 1) * 4
+    
+    tasks = (
+        {
+            'psm_report': report,
+            'glabel_report': glabel_report \
+                .loc[glabel_report['Spec'].isin(report['PepSpec']), :],
+            'matched_ion_has_mz': matched_ion_has_mz,
+            'total_fdr_cutoff': None,
+            'return_generator': False
+        }
+        for report in split_chunks(psm_report, shards)
+    )
+    return parallel_map(
+        _extract_assays_from_glabel_task, tasks,
+        processes=processes
+    )
             
-            
\ No newline at end of file
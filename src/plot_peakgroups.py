@@ -16,10 +16,11 @@ import click
 
 @click.option('--tolerance', default=20, show_default=True, type=float, help='m/z extraction window.')
 @click.option('--tolerance_unit', default='ppm', show_default=True, type=click.Choice(['ppm', 'Da']), help='m/z extraction window unit.')
+@click.option('--cache/--no-cache', 'use_cache', default=False, show_default=True, help='Read spectra from a memory-mapped spectrum cache, building it if needed.')
 def export_plots(osw_file, mzml_file, swath_window_file, transition_group_file,
                  glycoform, max_peakgroup_rank,
                  max_rs_peakgroup_qvalue, max_glycoform_qvalue, max_transition_pep, include_decoy,
-                 tolerance, tolerance_unit):
+                 tolerance, tolerance_unit, use_cache):
     """
     Export peak group plots
     """
@@ -35,7 +36,8 @@ def export_plots(osw_file, mzml_file, swath_window_file, transition_group_file,
         max_transition_pep=max_transition_pep,
         include_decoy=include_decoy,
         tolerance=tolerance,
-        tolerance_unit=tolerance_unit
+        tolerance_unit=tolerance_unit,
+        use_cache=use_cache
     )
 
 
@@ -1,18 +1,22 @@
 import numpy as np
 
 class BackgroundEstimator:
-    def __init__(self, 
+    def __init__(self,
                  noise_peak_ratio=2.0,
-                 isotope_number=4, 
-                 isotope_tolerance=0.01, 
-                 isotope_tolerance_unit='Da'):
+                 isotope_number=4,
+                 isotope_tolerance=0.01,
+                 isotope_tolerance_unit='Da',
+                 threshold_number=21,
+                 max_batch_peaks=200000):
         self.noise_peak_ratio = noise_peak_ratio
         self.isotope_number = isotope_number
         self.isotope_tolerance = isotope_tolerance
         self.isotope_tolerance_unit = isotope_tolerance_unit
-        
-    
-    def estimate_background(self, spectrum):
+        self.threshold_number = threshold_number
+        self.max_batch_peaks = max_batch_peaks
+
+
+    def get_peaks(self, spectrum):
         peak_dict = spectrum.get('fragments', None)
         if peak_dict is not None:
             peaks = np.column_stack((
@@ -25,49 +29,118 @@ class BackgroundEstimator:
                 peaks = np.column_stack((
                     peak_dict['mz'],
                     peak_dict['intensity']
-                ))     
+                ))
         if peak_dict is None:
             raise ValueError('missing peaks')
-                
-        if peaks.shape[0] < 0:
-            return 0.0
-        
-        lower, upper = np.percentile(
-            peaks[:, 1], q=(0, 70), 
-            interpolation='lower'
-        )
-        
-        if upper <= lower + 0.001:
-            return 0.0
-                      
-        for bk in np.linspace(lower, upper, 21):              
-            filtered_peaks = peaks[peaks[:, 1] > bk, :]
-            mz_dist = filtered_peaks[1:, 0] - filtered_peaks[:-1, 0]
-            int_diff = filtered_peaks[1:, 1] - filtered_peaks[:-1, 1]
-            
-            if self.isotope_tolerance_unit in {'Da' ,'Th'}:
-                isotope_tolerance = self.isotope_tolerance
-            elif self.isotope_tolerance_unit == 'ppm':
-                isotope_tolerance = filtered_peaks[1:, 0] * \
+        return peaks
+
+
+    def estimate_background(self, spectrum):
+        return self.estimate_backgrounds([spectrum])[0]
+
+
+    def estimate_backgrounds(self, spectra):
+        result = []
+        batch = []
+        batch_peaks = 0
+        for spectrum in spectra:
+            peaks = self.get_peaks(spectrum)
+            if batch_peaks + peaks.shape[0] > self.max_batch_peaks and \
+                len(batch) > 0:
+                result.extend(self.estimate_backgrounds_from_peaks(batch))
+                batch = []
+                batch_peaks = 0
+            batch.append(peaks)
+            batch_peaks += peaks.shape[0]
+
+        if len(batch) > 0:
+            result.extend(self.estimate_backgrounds_from_peaks(batch))
+        return result
+
+
+    def estimate_backgrounds_from_peaks(self, peak_list):
+        result = [0.0] * len(peak_list)
+
+        thresholds = []
+        segments = []
+        for k, peaks in enumerate(peak_list):
+            lower, upper = percentile_lower(peaks[:, 1], q=(0, 70))
+            if upper <= lower + 0.001:
+                continue
+            thresholds.append(
+                np.linspace(lower, upper, self.threshold_number)
+            )
+            segments.append(k)
+
+        if len(segments) == 0:
+            return result
+
+        if self.isotope_tolerance_unit not in {'Da' ,'Th', 'ppm'}:
+            raise ValueError('invalid isotope_tolerance_unit: ' + \
+                             str(self.isotope_tolerance_unit))
+
+        thresholds = np.column_stack(thresholds)
+        segments = np.array(segments)
+        lengths = np.array([peak_list[k].shape[0] for k in segments])
+        segment_index = np.repeat(np.arange(len(segments)), lengths)
+        peaks = np.concatenate([peak_list[k] for k in segments])
+
+        # each pass tests one threshold for all spectra without a result
+        for t in range(thresholds.shape[0]):
+            if len(segments) == 0:
+                break
+
+            kept = np.nonzero(
+                peaks[:, 1] > thresholds[t, segment_index]
+            )[0]
+            pair = segment_index[kept[1:]] == segment_index[kept[:-1]]
+            i = kept[:-1][pair]
+            j = kept[1:][pair]
+
+            mz_dist = peaks[j, 0] - peaks[i, 0]
+            int_diff = peaks[j, 1] - peaks[i, 1]
+
+            if self.isotope_tolerance_unit == 'ppm':
+                isotope_tolerance = peaks[j, 0] * \
                     self.isotope_tolerance * 1e-6
             else:
-                raise ValueError('invalid isotope_tolerance_unit: ' + \
-                                 str(self.isotope_tolerance_unit))
-                
-            count = [
-                sum(
-                    (mz_dist > 1.0 / i - isotope_tolerance) &
-                    (mz_dist < 1.0 / i + isotope_tolerance) &
-                    (int_diff < 0)
+                isotope_tolerance = self.isotope_tolerance
+
+            bins = segment_index[j]
+            count = np.zeros(len(segments))
+            for n in range(1, 1 + self.isotope_number):
+                count += np.bincount(
+                    bins,
+                    weights=(mz_dist > 1.0 / n - isotope_tolerance) &
+                        (mz_dist < 1.0 / n + isotope_tolerance) &
+                        (int_diff < 0),
+                    minlength=len(segments)
                 )
-                for i in range(1, 1 + self.isotope_number)
-            ]
-            noise = sum(mz_dist < 1.0 / self.isotope_number - \
-                        isotope_tolerance)
-            
-            if noise < sum(count) * self.noise_peak_ratio:
-                return float(bk)
-        
-        return 0.0
-            
-            
\ No newline at end of file
+            noise = np.bincount(
+                bins,
+                weights=mz_dist < 1.0 / self.isotope_number - \
+                    isotope_tolerance,
+                minlength=len(segments)
+            )
+
+            accept = noise < count * self.noise_peak_ratio
+            for k, bk in zip(segments[accept], thresholds[t, accept]):
+                result[k] = float(bk)
+
+            if accept.any():
+                remain = ~accept
+                mask = remain[segment_index]
+                peaks = peaks[mask]
+                segment_index = (np.cumsum(remain) - 1) \
+                    [segment_index[mask]]
+                segments = segments[remain]
+                thresholds = thresholds[:, remain]
+
+        return result
+
+
+def percentile_lower(values, q):
+    try:
+        return np.percentile(values, q=q, method='lower')
+    except TypeError:
+        return np.percentile(values, q=q, interpolation='lower')
@@ -1,59 +1,270 @@
+import os
+import re
+import numpy as np
+from io import StringIO
+from collections import OrderedDict, namedtuple
+
+from util import open_file
+
+
+MgfIndexEntry = namedtuple(
+    'MgfIndexEntry', 
+    ['offset', 'length', 'rt', 'precursorMZ']
+)
+
+
 class MgfReader():
-    def __init__(self, file, parameters=None):
+    def __init__(self, file, parameters=None, index=False, index_file=None,
+                 index_dir=None, array=False, engine='line', 
+                 chunk_size=1 << 24, processes=None):
+        if engine not in {'line', 'block'}:
+            raise ValueError('invalid engine: ' + str(engine))
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.blocks = None
+        
         if isinstance(file, str):
-            file = open(file, 'r')
+            self.path = file
+            file = open_file(file, 'r', processes=processes)
+        else:
+            self.path = getattr(file, 'name', None)
         self.file = file
         
         if parameters is None:
-            parameters = mgfreader_parameters()
+            parameters = mgfreader_parameters(array=array)
         self.parameters = parameters
         
+        self.index = None
+        self.index_dir = index_dir
+        self.binary_file = None
+        if index:
+            self.load_index(index_file=index_file)
+        
     
     def __enter__(self):
         return self        
         
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.file.close()
+        self.close()
         
     def close(self):
         self.file.close()
+        if self.binary_file is not None:
+            self.binary_file.close()
+            self.binary_file = None
+            
+    
+    def load_index(self, index_file=None, index_dir=None, rebuild=False):
+        if self.path is None:
+            raise ValueError('indexed mode requires a file path')
+        if index_file is None:
+            if index_dir is None:
+                index_dir = self.index_dir
+            index_file = mgf_index_file(self.path, index_dir=index_dir)
+        
+        index = None
+        if not rebuild and os.path.exists(index_file):
+            index = load_mgf_index(index_file, source=self.path)
+        if index is None:
+            index = build_mgf_index(self.path)
+            try:
+                save_mgf_index(index, index_file, source=self.path)
+            except OSError as e:
+                # e.g. read-only input directories: keep the index in memory
+                from warnings import warn
+                warn('MGF index not saved: ' + index_file + ': ' + str(e))
+        
+        self.index = index
+        return index
+    
+    
+    def get_by_title(self, title):
+        if self.index is None:
+            self.load_index()
+        
+        entries = self.index.get(title, None)
+        if entries is None:
+            return None
+        return self.read_spectrum_at(entries[0])
+    
+    
+    def iter_titles(self, titles):
+        if self.index is None:
+            self.load_index()
+        
+        entries = sorted(
+            set(
+                entry 
+                for t in titles if t in self.index
+                for entry in self.index[t]
+            ),
+            key=lambda x: x.offset
+        )
+        for entry in entries:
+            yield self.read_spectrum_at(entry)
+            
+    
+    def read_spectrum_at(self, entry):
+        if self.binary_file is None:
+            self.binary_file = open_file(self.path, 'rb')
+        
+        self.binary_file.seek(entry.offset)
+        data = self.binary_file.read(entry.length)
+        encoding = getattr(self.file, 'encoding', None) or 'utf-8'
+        if self.engine == 'block':
+            return self.parse_block(data.decode(encoding))
+        return self._read_spectrum(StringIO(data.decode(encoding)))
         
     
     def read_spectrum(self):
-        local_params = self.parameters.get('localParams', None)        
+        if self.engine == 'block':
+            if self.blocks is None:
+                self.blocks = iter_mgf_blocks(
+                    self.file, chunk_size=self.chunk_size
+                )
+            block = next(self.blocks, None)
+            if block is None:
+                return None
+            return self.parse_block(block[1])
+        
+        return self._read_spectrum(self.file)
+    
+    
+    def convert_ions(self, spectrum):
         ions_params = self.parameters.get('ions', None)
+        if ions_params is None:
+            return spectrum
         
-        def set_local_params(spectrum, key, value):
-            parameter = None
-            if local_params is not None:
-                parameter = local_params.get(key, None)
+        for parameter in ions_params.values():
+            dtype = parameter.get('dtype', None)
+            path = parameter.get('path', None)
+            if dtype is None or path is None:
+                continue
+            
+            if isinstance(path, str):
+                path = [path]
+            d = spectrum
+            for field in path[:-1]:
+                d = d.get(field, None)
+                if d is None:
+                    break
+            if d is not None and path[-1] in d:
+                d[path[-1]] = np.asarray(d[path[-1]], dtype=dtype)
+        
+        return spectrum
+            
+    
+    def set_local_params(self, spectrum, key, value):
+        local_params = self.parameters.get('localParams', None)
+        parameter = None
+        if local_params is not None:
+            parameter = local_params.get(key, None)
 
-            if parameter is None:
-                from warnings import warn
-                warn('unknown parmeter: ' + key)
-                return
+        if parameter is None:
+            from warnings import warn
+            warn('unknown parmeter: ' + key)
+            return
+            
+        path = parameter.get('path', None)
+        if path is not None:
+            convert = parameter.get('convert', None)
+            if callable(convert):
+                value = convert(value)
+            
+            if isinstance(path, str):
+                spectrum[path] = value
+            elif isinstance(path, list):
+                d = spectrum
+                for i, field in enumerate(path): 
+                    if i == len(path) - 1:
+                        d[field] = value
+                        break
+                    d = d.setdefault(field, {})
+            return
+        
+        func = parameter.get('function', None)
+        if callable(func):
+            func(spectrum, value)
+            
+    
+    def parse_block(self, block):
+        lines = block.split('\n')
+        
+        spectrum = None
+        peak_start = len(lines)
+        for i, line in enumerate(lines):
+            line = line.strip()
+            if len(line) == 0 or \
+                line[0] in {'#', ';', '!', '/'}:
+                continue
+            
+            if line == 'BEGIN IONS':
+                if spectrum is not None:
+                    raise ValueError('invalid format: ' + line)
+                spectrum = {}
+                continue
+            
+            if spectrum is None:
+                continue
+            
+            if line == 'END IONS' or line[0].isdigit():
+                peak_start = i
+                break
+            
+            s = line.split('=', 1)
+            if len(s) == 2:                                
+                self.set_local_params(spectrum, key=s[0], value=s[1])
+                continue
+            
+            peak_start = i
+            break
+        
+        if spectrum is None:
+            return None
+        
+        peak_end = len(lines)
+        while peak_end > peak_start:
+            peak_end -= 1
+            if lines[peak_end].strip() == 'END IONS':
+                break
+        else:
+            raise ValueError('unexpected EOF')
+        
+        peak_lines = lines[peak_start:peak_end]
+        if peak_lines:
+            peaks = parse_peak_lines(peak_lines)
+            if peaks is None:
+                return self._read_spectrum(StringIO(block))
+            
+            ions_params = self.parameters.get('ions', None) or {}
+            for key, values in zip(('mz', 'intensity'), peaks):
+                parameter = ions_params.get(key, None)
+                if parameter is None:
+                    continue
+                path = parameter.get('path', None)
+                if path is None:
+                    continue
                 
-            path = parameter.get('path', None)
-            if path is not None:
-                convert = parameter.get('convert', None)
-                if callable(convert):
-                    value = convert(value)
+                dtype = parameter.get('dtype', None)
+                if dtype is not None:
+                    values = values.astype(dtype)
+                else:
+                    values = values.tolist()
                 
                 if isinstance(path, str):
-                    spectrum[path] = value
-                elif isinstance(path, list):
+                    spectrum[path] = values
+                else:
                     d = spectrum
-                    for i, field in enumerate(path): 
-                        if i == len(path) - 1:
-                            d[field] = value
-                            break
+                    for field in path[:-1]:
                         d = d.setdefault(field, {})
-                return
-            
-            func = parameter.get('function', None)
-            if callable(func):
-                func(spectrum, value)
+                    d[path[-1]] = values
+        
+        return self.convert_ions(spectrum)
             
+    
+    def _read_spectrum(self, file):
+        ions_params = self.parameters.get('ions', None)
+        
         def set_ions(spectrum, mz, intensity, charge=None, annotation=None):
             if ions_params is None:
                 return
@@ -99,7 +310,7 @@ class MgfReader():
         
         spectrum = None
         while True:
-            line = self.file.readline()
+            line = file.readline()
             if not line:
                 if spectrum is not None:
                     raise ValueError('unexpected EOF')
@@ -112,28 +323,28 @@ class MgfReader():
             
             if line == 'BEGIN IONS':
                 if spectrum is not None:
-                    raise ValueError('[Offset ' + str(self.file.tell()) + \
+                    raise ValueError('[Offset ' + str(file.tell()) + \
                         '] invalid format: ' + line)
                 spectrum = {}
                 continue
             
             if line == 'END IONS':
                 if spectrum is None:
-                    raise ValueError('[Offset ' + str(self.file.tell()) + \
+                    raise ValueError('[Offset ' + str(file.tell()) + \
                         '] invalid format: ' + line)
-                return spectrum
+                return self.convert_ions(spectrum)
             
             if spectrum is None:
                 continue
             
             s = line.split('=', 1)
             if len(s) == 2:                                
-                set_local_params(spectrum, key=s[0], value=s[1])
+                self.set_local_params(spectrum, key=s[0], value=s[1])
                 continue
                     
             s = line.split(' ', 4) 
             if len(s) < 2:
-                raise ValueError('[Offset ' + str(self.file.tell()) + \
+                raise ValueError('[Offset ' + str(file.tell()) + \
                     '] invalid format: ' + line)
             if len(s) >= 3:
                 charge = int(s[2].strip('+'))  
@@ -153,7 +364,7 @@ class MgfReader():
             )
             
                          
-def mgfreader_parameters():
+def mgfreader_parameters(array=False):
     def pepmass(spectrum, value):
         s = value.split(' ')
         if len(s) == 0 or len(s) > 3:
@@ -258,36 +469,153 @@ def mgfreader_parameters():
         }
     }
     
+    if array:
+        parameters['ions']['mz']['dtype'] = np.float64
+        parameters['ions']['intensity']['dtype'] = np.float32
+    
     return parameters
     
 
+
+def parse_peak_lines(lines):
+    text = ' '.join(lines)
+    try:
+        values = np.array(text.split(), dtype=np.float64)
+    except ValueError:
+        return None
     
-if __name__ == '__main__':
-    s = '''BEGIN IONS
-TITLE=Spectrum 1
-PEPMASS=896.05 25674.3
-SCANS=3
-RTINSECONDS=25
-CHARGE=3+
-TOL=3
-TOLU=Da
-SEQ=n-AC[DHK]
-COMP=2[H]0[M]3[DE]*[K]
-240.1 3
-242.1 12
-245.2 32
-1623.7 55
-1624.7 23
-END IONS
-'''
+    if len(values) != len(lines) * 2:
+        return None
     
-    from io import StringIO
-    with MgfReader(StringIO(s)) as mgf:
+    values = values.reshape(-1, 2)
+    return values[:, 0], values[:, 1]
+
+
+def iter_mgf_blocks(file, chunk_size=1 << 24):
+    if isinstance(file.read(0), bytes):
+        begin_marker, end_marker, newline = b'BEGIN IONS', b'END IONS', b'\n'
+        buffer = b''
+    else:
+        begin_marker, end_marker, newline = 'BEGIN IONS', 'END IONS', '\n'
+        buffer = ''
+    
+    offset = 0
+    eof = False
+    while not eof:
+        chunk = file.read(chunk_size)
+        eof = len(chunk) == 0
+        buffer += chunk
+        
+        pos = 0
         while True:
-            spec = mgf.read_spectrum()
-            if spec is not None:
-                print(spec)
-            else:
+            begin = buffer.find(begin_marker, pos)
+            if begin < 0:
+                pos = max(pos, len(buffer) - len(begin_marker))
+                break
+            end = buffer.find(end_marker, begin)
+            if end >= 0:
+                end = buffer.find(newline, end)
+                if end < 0 and eof:
+                    end = len(buffer) - 1
+            if end < 0:
+                if eof:
+                    raise ValueError('[Offset ' + str(offset + begin) + \
+                        '] unexpected EOF')
+                pos = begin
                 break
+            
+            yield offset + begin, buffer[begin:end + 1]
+            pos = end + 1
+        
+        offset += pos
+        buffer = buffer[pos:]
+        
+        
+def build_mgf_index(file, chunk_size=1 << 24):
+    # parameter lines are matched as the parsers read them: surrounding 
+    # whitespace is ignored, and spectra sharing a title are all kept
+    title_pattern = re.compile(b'^[ \t]*TITLE=(.*)$', re.M)
+    rt_pattern = re.compile(b'^[ \t]*RTINSECONDS=(.*)$', re.M)
+    pepmass_pattern = re.compile(b'^[ \t]*PEPMASS=[ \t]*([^ \t\r\n]*)', re.M)
+    
+    index = OrderedDict()
+    with open_file(file, 'rb') as f:
+        for offset, block in iter_mgf_blocks(f, chunk_size=chunk_size):
+            title = title_pattern.search(block)
+            if title is None:
+                continue
+            rt = rt_pattern.search(block)
+            precursor_mz = pepmass_pattern.search(block)
+            
+            index.setdefault(title.group(1).decode().rstrip(), []).append(
+                MgfIndexEntry(
+                    offset=offset,
+                    length=len(block),
+                    rt=float(rt.group(1)) if rt is not None else None,
+                    precursorMZ=float(precursor_mz.group(1)) \
+                        if precursor_mz is not None else None
+                )
+            )
+    
+    return index
+
+
+MGF_INDEX_VERSION = '2'
+
+def mgf_index_file(file, index_dir=None):
+    if index_dir is not None:
+        return os.path.join(index_dir, os.path.basename(file) + '.index.tsv')
+    return file + '.index.tsv'
+    
+    
+def save_mgf_index(index, index_file, source=None):
+    if source is not None:
+        stat = os.stat(source)
+        source_info = [str(stat.st_size), repr(stat.st_mtime)]
+    else:
+        source_info = ['', '']
+    
+    def to_str(x):
+        return '' if x is None else repr(x)
+    
+    with open(index_file, 'w') as f:
+        f.write('\t'.join(
+            ['#MgfIndex'] + source_info + [MGF_INDEX_VERSION]
+        ) + '\n')
+        f.write('title\toffset\tlength\trt\tprecursorMZ\n')
+        for title, entries in index.items():
+            for entry in entries:
+                f.write('\t'.join([
+                    title, str(entry.offset), str(entry.length), 
+                    to_str(entry.rt), to_str(entry.precursorMZ)
+                ]) + '\n')
+            
+
+def load_mgf_index(index_file, source=None):
+    def to_float(x):
+        return float(x) if x != '' else None
+    
+    with open(index_file, 'r') as f:
+        header = f.readline().rstrip('\n').split('\t')
+        if len(header) < 3 or header[0] != '#MgfIndex':
+            raise ValueError('invalid MGF index: ' + index_file)
+        if len(header) < 4 or header[3] != MGF_INDEX_VERSION:
+            return None
+        if source is not None:
+            stat = os.stat(source)
+            if header[1] != str(stat.st_size) or \
+                header[2] != repr(stat.st_mtime):
+                return None
+        
+        f.readline()
+        index = OrderedDict()
+        for line in f:
+            s = line.rstrip('\n').split('\t')
+            index.setdefault(s[0], []).append(MgfIndexEntry(
+                offset=int(s[1]), 
+                length=int(s[2]), 
+                rt=to_float(s[3]), 
+                precursorMZ=to_float(s[4])
+            ))
     
-    
\ No newline at end of file
+    return index
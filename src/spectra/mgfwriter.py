@@ -1,25 +1,62 @@
+import gzip
+import numpy as np
+
+
 class MgfWriter():
-    def __init__(self, file, parameters=None):
+    def __init__(self, file, parameters=None, compression=None, 
+                 buffer_size=1 << 20):
         if isinstance(file, str):
-            file = open(file, 'w')
+            if compression is None and file.endswith('.gz'):
+                compression = 'gzip'
+            if compression == 'gzip':
+                file = gzip.open(file, 'wt')
+            elif compression is None:
+                file = open(file, 'w')
+            else:
+                raise ValueError('invalid compression: ' + str(compression))
         self.file = file
         
         if parameters is None:
             parameters = mgfwriter_parameters()
         self.parameters = parameters
         
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffer_length = 0
+        
     
     def __enter__(self):
         return self        
         
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.file.close()
+        self.close()
         
     def close(self):
+        self.flush()
         self.file.close()
         
+    def flush(self):
+        if len(self.buffer) > 0:
+            self.file.write(''.join(self.buffer))
+            self.buffer = []
+            self.buffer_length = 0
+        
+    
+    def write_spectra(self, spectra):
+        for spectrum in spectra:
+            self.write_spectrum(spectrum)
+        self.flush()
+        
     
     def write_spectrum(self, spectrum):
+        text = self.format_spectrum(spectrum)
+        self.buffer.append(text)
+        self.buffer_length += len(text)
+        if self.buffer_length >= self.buffer_size:
+            self.flush()
+            
+    
+    def format_spectrum(self, spectrum):
         def convert_local_params(spectrum, param):
             value = None            
             path = param.get('path', None)
@@ -77,19 +114,32 @@ class MgfWriter():
             else:
                 annotation_array = None
                 
-            for i, mz in enumerate(mz_array):
-                line = str(mz) + ' ' + str(intensity_array[i])
-                if charge_array is not None:
-                    line += ' ' + str(charge_array[i]) + \
-                        ('+' if charge_array[i] >= 0 else '')
-                if annotation_array is not None:
-                    line += ' ' + annotation_array[i]
-                lines.append(line)
+            if charge_array is None and annotation_array is None:
+                lines.extend(map(
+                    ' '.join, 
+                    zip(format_values(mz_array), 
+                        format_values(intensity_array))
+                ))
+            else:
+                for i, mz in enumerate(mz_array):
+                    line = str(mz) + ' ' + str(intensity_array[i])
+                    if charge_array is not None:
+                        line += ' ' + str(charge_array[i]) + \
+                            ('+' if charge_array[i] >= 0 else '')
+                    if annotation_array is not None:
+                        line += ' ' + annotation_array[i]
+                    lines.append(line)
                 
         lines.append('END IONS')
         lines.append('')
         
-        self.file.writelines((x + '\n' for x in lines))
+        return '\n'.join(lines) + '\n'
+
+
+def format_values(values):
+    if isinstance(values, np.ndarray) and values.dtype == np.float64:
+        values = values.tolist()
+    return map(str, values)
 
 
 def mgfwriter_parameters():
@@ -213,6 +263,7 @@ if __name__ == '__main__':
     s = StringIO()
     with MgfWriter(s) as mgf:
         mgf.write_spectrum(spec)
+        mgf.flush()
         print(s.getvalue())
         
         
\ No newline at end of file
@@ -1,13 +1,47 @@
+import numpy as np
 from pymzml.run import Reader
 
+from util import open_file, get_compression
+
 class MzmlReader():
-    def __init__(self, file, parameters=None):
-        self.reader = Reader(file)
-        
+    def __init__(self, file, parameters=None, array=False,
+                 ms_level=None, rt_range=None, isolation_window_mz=None,
+                 use_cache=False, cache_dir=None, processes=None):
         if parameters is None:
-            parameters = mzml_reader_parameters()
+            parameters = mzml_reader_parameters(array=array)
         self.parameters = parameters
         
+        if isinstance(ms_level, int):
+            ms_level = {ms_level}
+        self.ms_level = ms_level
+        self.rt_range = rt_range
+        self.isolation_window_mz = isolation_window_mz
+        
+        self.reader = None
+        self.cache = None
+        if use_cache and isinstance(file, str):
+            from .spectrumcache import open_spectrum_cache
+            try:
+                self.cache = open_spectrum_cache(file, cache_dir=cache_dir)
+            except OSError as e:
+                from warnings import warn
+                warn('spectrum cache not available: ' + file + ': ' + str(e))
+        
+        if self.cache is not None:
+            self.cache_index = iter(self.cache.select(
+                ms_level=ms_level, 
+                rt_range=rt_range, 
+                isolation_window_mz=isolation_window_mz
+            ))
+        elif not isinstance(file, str):
+            self.reader = Reader(file_object=file)
+        elif get_compression(file) is not None:
+            self.reader = Reader(
+                file_object=open_file(file, 'rb', processes=processes)
+            )
+        else:
+            self.reader = Reader(file)
+        
         
     def __enter__(self):
         return self        
@@ -16,35 +50,110 @@ class MzmlReader():
         pass
         
     
+    def accept_spectrum(self, spec):
+        if self.ms_level is None and self.rt_range is None and \
+            self.isolation_window_mz is None:
+            return True
+        
+        ms_level = get_spectrum_value(spec, 'ms level', 'MS:1000511', int)
+        if ms_level is None:
+            if spec.get('MS1 spectrum', None) is not None or \
+                spec.ms.get('MS:1000579', None) is not None:
+                ms_level = 1
+        
+        if self.ms_level is not None and ms_level is not None and \
+            ms_level not in self.ms_level:
+            return False
+        
+        if self.rt_range is not None:
+            rt = get_spectrum_value(spec, 'scan start time', 'MS:1000016', float)
+            if rt is not None:
+                if self.rt_range[0] is not None and rt < self.rt_range[0]:
+                    return False
+                if self.rt_range[1] is not None and rt > self.rt_range[1]:
+                    return False
+        
+        if self.isolation_window_mz is not None and \
+            ms_level is not None and ms_level > 1:
+            target = get_spectrum_value(
+                spec, 'isolation window target m/z', 'MS:1000827', float
+            )
+            if target is not None:
+                lower = get_spectrum_value(
+                    spec, 'isolation window lower offset', 'MS:1000828', float
+                ) or 0.0
+                upper = get_spectrum_value(
+                    spec, 'isolation window upper offset', 'MS:1000829', float
+                ) or 0.0
+                if self.isolation_window_mz < target - lower or \
+                    self.isolation_window_mz > target + upper:
+                    return False
+        
+        return True
+        
+    
+    def read_cached_spectrum(self):
+        index = next(self.cache_index, None)
+        if index is None:
+            return None
+        
+        result = self.cache.get_metadata(index)
+        mz, intensity = self.cache.get_peaks(index)
+        
+        data_params = self.parameters.get('data', None)
+        if isinstance(data_params, dict):
+            if self.cache.header['ms1'][index]:
+                data_params = data_params.get('MS1', data_params)
+            else:
+                data_params = data_params.get('MSn', data_params)            
+        if isinstance(data_params, dict):
+            for key, values in (('mz', mz), ('intensity', intensity)):
+                param = data_params.get(key, None)
+                if param is None:
+                    continue
+                dtype = param.get('dtype', None)
+                if dtype is None:
+                    values = values.tolist()
+                else:
+                    values = np.array(values, dtype=dtype)
+                set_value(result, param.get('path', None), values)
+        
+        return result
+        
+    
     def read_spectrum(self):
-        spec = next(self.reader, None)
-        if spec is None:
-            return None               
+        if self.cache is not None:
+            return self.read_cached_spectrum()
         
-        def set_value(result, path, value):
-            if isinstance(path, str):
-                result[path] = value
-            elif isinstance(path, list):
-                d = result
-                for i, field in enumerate(path): 
-                    if i == len(path) - 1:
-                        d[field] = value
-                        break
-                    d = d.setdefault(field, {})
+        while True:
+            spec = next(self.reader, None)
+            if spec is None:
+                return None
+            
+            if spec.get('total ion current chromatogram', None) is not None or \
+                spec.get('MS:1000235', None) is not None:
+                continue
+            
+            if self.accept_spectrum(spec):
+                break
+        
+        def convert_data(values, param):
+            dtype = param.get('dtype', None)
+            if dtype is None:
+                return list(values)
+            else:
+                return np.asarray(values, dtype=dtype)
         
         def set_data(result, params, spec): 
-            mz = list(spec.mz)
-            intensity = list(spec.i)
-            
             param = params.get('mz', None)
             if param is not None:
                 path = param.get('path', None)
-                set_value(result, path, mz)
+                set_value(result, path, convert_data(spec.mz, param))
                 
             param = params.get('intensity', None)
             if param is not None:
                 path = param.get('path', None)
-                set_value(result, path, intensity)
+                set_value(result, path, convert_data(spec.i, param))
                 
         
         def set_params(result, params, spec):            
@@ -56,22 +165,12 @@ class MzmlReader():
                 if path is None:
                     continue
                 
-                value = None
-                name = parameter.get('name', None)
-                if name is not None:
-                     value = spec.get(name, None)
-                
-                if value is None:
-                    accession = parameter.get('accession', None)
-                    if accession is not None:
-                         cv = spec.ms.get(accession, None)
-                         if cv is not None:
-                             value = cv.get('value', None)
-                 
-                if value is not None:                       
-                    convert = parameter.get('convert', None)
-                    if callable(convert):
-                        value = convert(value)
+                value = get_spectrum_value(
+                    spec, 
+                    name=parameter.get('name', None),
+                    accession=parameter.get('accession', None),
+                    convert=parameter.get('convert', None)
+                )
                         
                 if value is None:
                     func = parameter.get('function', None)
@@ -81,10 +180,6 @@ class MzmlReader():
                 if value is not None:
                     set_value(result, path, value)
                     
-        if spec.get('total ion current chromatogram', None) is not None or \
-            spec.get('MS:1000235', None) is not None:
-            return self.read_spectrum()        
-        
         result = {}        
         ms1 = spec.get('MS1 spectrum', None) is not None or \
             spec.ms.get('MS:1000579', None) is not None
@@ -109,8 +204,35 @@ class MzmlReader():
                 
         return result
         
+
+def set_value(result, path, value):
+    if isinstance(path, str):
+        result[path] = value
+    elif isinstance(path, list):
+        d = result
+        for i, field in enumerate(path): 
+            if i == len(path) - 1:
+                d[field] = value
+                break
+            d = d.setdefault(field, {})
+            
+
+def get_spectrum_value(spec, name=None, accession=None, convert=None):
+    value = None
+    if name is not None:
+        value = spec.get(name, None)
+    
+    if value is None and accession is not None:
+        cv = spec.ms.get(accession, None)
+        if cv is not None:
+            value = cv.get('value', None)
     
-def mzml_reader_parameters():
+    if value is not None and callable(convert):
+        value = convert(value)
+    return value
+
+    
+def mzml_reader_parameters(array=False):
     def spectrum_ref(spec):
         precursor_element = spec.xmlTreeIterFree.find(
             'precursorList/precursor'
@@ -265,4 +387,9 @@ def mzml_reader_parameters():
         ]
     }
     
-    return parameters
\ No newline at end of file
+    if array:
+        for data_params in parameters['data'].values():
+            data_params['mz']['dtype'] = np.float64
+            data_params['intensity']['dtype'] = np.float32
+    
+    return parameters
@@ -1,14 +1,35 @@
+import gzip
 import psims.mzml
 import numpy as np
+from psims.mzml.binary_encoding import \
+    COMPRESSION_NONE, COMPRESSION_ZLIB, \
+    COMPRESSION_NUMPRESS_LINEAR_PREDICTION, \
+    COMPRESSION_NUMPRESS_SHORT_LOGGED_FLOAT
 
 class MzmlWriter:
-    def __init__(self, file, parameters=None):
-        self.writer = psims.mzml.MzMLWriter(file)
+    def __init__(self, file, parameters=None, 
+                 compression='zlib', numpress=False,
+                 gzip_output=None, buffer_size=1 << 20):
+        if isinstance(file, str):
+            if gzip_output is None:
+                gzip_output = file.endswith('.gz')
+            if gzip_output:
+                file = gzip.open(file, 'wb')
+            else:
+                file = open(file, 'wb', buffering=buffer_size)
+            self.writer = psims.mzml.MzMLWriter(file, close=True)
+        else:
+            self.writer = psims.mzml.MzMLWriter(file)
         
         if parameters is None:
             parameters = mzml_writer_parameters()
         self.parameters = parameters
         
+        self.compression = array_compression(
+            compression=compression, 
+            numpress=numpress
+        )
+        
         
     def __enter__(self):
         self.writer.__enter__()
@@ -133,7 +154,7 @@ class MzmlWriter:
                 
                 if key in {'mz', 'intensity', 'charge'}:
                     spec_args[key + '_array'] = \
-                        np.array(value)
+                        np.asarray(value)
                 
         if params is not None:
             for key, param in params.items():
@@ -193,11 +214,35 @@ class MzmlWriter:
                 .append({'total ion current': intensity_array.sum()})
                 
         spec_args.setdefault('id', self.spectrum_count)
+        spec_args.setdefault('compression', self.compression)
                 
         self.writer.write_spectrum(**spec_args)
         self.spectrum_count += 1
         
         
+    def write_spectra(self, spectra):
+        for spectrum in spectra:
+            self.write_spectrum(spectrum)
+        
+        
+def array_compression(compression='zlib', numpress=False):
+    if compression is None or compression == 'none':
+        compression = COMPRESSION_NONE
+    elif compression == 'zlib':
+        compression = COMPRESSION_ZLIB
+    else:
+        raise ValueError('invalid compression: ' + str(compression))
+    
+    if not numpress:
+        return compression
+    
+    return {
+        'm/z array': COMPRESSION_NUMPRESS_LINEAR_PREDICTION,
+        'intensity array': COMPRESSION_NUMPRESS_SHORT_LOGGED_FLOAT,
+        'charge array': compression
+    }
+        
+        
 def mzml_writer_parameters(): 
     parameters = {
         'data': {
@@ -0,0 +1,315 @@
+import os
+import io
+import re
+import csv
+import shutil
+
+from .mzmlreader import MzmlReader
+from util import get_compression
+
+
+TITLE_PATTERN = re.compile('^(.+)\\.([0-9]+)\\.[0-9]+\\.[0-9]*( |$)')
+SCAN_ID_PATTERN = re.compile('scan=([0-9]+)')
+INDEX_LIST_OFFSET_PATTERN = re.compile(
+    b'<indexListOffset>\\s*([0-9]+)\\s*</indexListOffset>'
+)
+SPECTRUM_INDEX_PATTERN = re.compile(
+    b'<index\\s+name="spectrum"\\s*>(.*?)</index>', re.DOTALL
+)
+OFFSET_PATTERN = re.compile(
+    b'<offset\\s[^>]*>\\s*([0-9]+)\\s*</offset>'
+)
+
+
+def get_value_from_dict(d, path):
+    value = None
+    for name in path:
+        if isinstance(d, dict):
+            value = d.get(name, None)
+            d = value
+        else:
+            return None
+    return value
+
+
+def get_info_from_spectrum(spec, name):
+    value = get_value_from_dict(spec, [name])
+    if value is None:
+        value = get_value_from_dict(spec, ['metadata', name])
+    if value is None:
+        name = name.split('.')
+        value = get_value_from_dict(spec, name)
+    if value is None:
+        value = get_value_from_dict(spec, ['metadata'] + name)
+
+    return value
+
+
+def get_file_and_scan(spec, mzml_file, scan):
+    file = spec['metadata'].get('file', None)
+    scan_number = spec['metadata'].get('scan', None)
+
+    if file is None or scan_number is None:
+        title = spec['metadata'].get('title', None)
+        mat = TITLE_PATTERN.search(title) if title is not None else None
+        if mat is not None:
+            if file is None:
+                file = mat.group(1)
+            if scan_number is None:
+                scan_number = mat.group(2)
+    if file is None:
+        file = os.path.splitext(mzml_file)[0]
+
+    if scan_number is None:
+        scan_id = spec['metadata'].get('id', None)
+        mat = SCAN_ID_PATTERN.search(scan_id) \
+            if scan_id is not None else None
+        if mat is not None:
+            scan_number = mat.group(1)
+    if scan_number is None:
+        scan_number = scan
+
+    return file, int(scan_number)
+
+
+def read_mzml_spectrum_offsets(file, tail_size=4096):
+    with open(file, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - tail_size))
+        mat = INDEX_LIST_OFFSET_PATTERN.search(f.read())
+        if mat is None:
+            return None
+
+        f.seek(int(mat.group(1)))
+        mat = SPECTRUM_INDEX_PATTERN.search(f.read())
+        if mat is None:
+            return None
+
+    return [int(x) for x in OFFSET_PATTERN.findall(mat.group(1))]
+
+
+def find_spectrum_list_end(file, offset, block_size=1 << 20):
+    tag = b'</spectrumList>'
+    with open(file, 'rb') as f:
+        f.seek(offset)
+        tail = b''
+        while True:
+            block = f.read(block_size)
+            if not block:
+                return None
+            data = tail + block
+            index = data.find(tag)
+            if index >= 0:
+                return offset - len(tail) + index
+            tail = data[-len(tag):]
+            offset += len(block)
+
+
+def split_scan_ranges(start_scan, end_scan, shards):
+    count = end_scan - start_scan + 1
+    if shards <= 1 or count <= 1:
+        return [(start_scan, end_scan)]
+
+    size = -(-count // shards)
+    return [
+        (i, min(i + size - 1, end_scan))
+        for i in range(start_scan, end_scan + 1, size)
+    ]
+
+
+def read_mzml_shard_header(f, header_end):
+    f.seek(0)
+    header = f.read(header_end)
+    declaration_end = header.find(b'?>')
+    mzml_start = header.find(b'<mzML')
+    if mzml_start < 0:
+        raise ValueError('invalid mzML file: ' + str(f.name))
+    if declaration_end >= 0 and declaration_end < mzml_start:
+        return header[:declaration_end + 2] + b'\n' + header[mzml_start:]
+    else:
+        return header[mzml_start:]
+
+
+class MzmlShardStream(io.RawIOBase):
+    # a readable view of an mzML file restricted to the spectra in
+    # [start, end), wrapped in the file header and closing tags, so that
+    # shards are parsed without being copied to disk
+    def __init__(self, file, header_end, start, end):
+        self.name = file
+        self.file = open(file, 'rb')
+        self.segments = [
+            read_mzml_shard_header(self.file, header_end),
+            (start, end),
+            b'\n</spectrumList>\n</run>\n</mzML>\n'
+        ]
+        self.segment_index = 0
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self.segment_index < len(self.segments):
+            segment = self.segments[self.segment_index]
+            if isinstance(segment, bytes):
+                n = min(len(b), len(segment) - self.position)
+                b[:n] = segment[self.position:self.position + n]
+            else:
+                start, end = segment
+                n = min(len(b), end - start - self.position)
+                if n > 0:
+                    self.file.seek(start + self.position)
+                    n = self.file.readinto(memoryview(b)[:n])
+            if n > 0:
+                self.position += n
+                return n
+            self.segment_index += 1
+            self.position = 0
+        return 0
+
+    def close(self):
+        if not self.closed:
+            self.file.close()
+        super(MzmlShardStream, self).close()
+
+
+def open_mzml_shard(file, header_end, start, end, buffer_size=1 << 20):
+    return io.BufferedReader(
+        MzmlShardStream(file, header_end, start, end),
+        buffer_size=buffer_size
+    )
+
+
+def write_scan_info(mzml_file, out_file, info_names,
+                    start_scan=None, end_scan=None,
+                    use_cache=False, cache_dir=None, header=True,
+                    byte_range=None, scan_offset=0):
+    info_names_1 = [
+        re.sub('=[^=]+$', '', x)
+        for x in info_names
+    ]
+    info_names_2 = [
+        re.sub('^[^=]+=', '', x)
+        for x in info_names
+    ]
+
+    if byte_range is not None:
+        shard = open_mzml_shard(mzml_file, *byte_range)
+    else:
+        shard = None
+    reader = MzmlReader(
+        shard if shard is not None else mzml_file,
+        use_cache=use_cache,
+        cache_dir=cache_dir
+    )
+
+    try:
+        return write_scan_info_rows(
+            reader, mzml_file, out_file, info_names_1, info_names_2,
+            start_scan=start_scan, end_scan=end_scan,
+            header=header, scan_offset=scan_offset
+        )
+    finally:
+        if shard is not None:
+            shard.close()
+
+
+def write_scan_info_rows(reader, mzml_file, out_file,
+                         info_names_1, info_names_2,
+                         start_scan=None, end_scan=None,
+                         header=True, scan_offset=0):
+    count = 0
+    with open(out_file, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        if header:
+            writer.writerow(['file', 'scan'] + info_names_1)
+
+        scan = scan_offset
+        while True:
+            spec = reader.read_spectrum()
+            if spec is None:
+                break
+
+            scan += 1
+            if start_scan is not None and scan < start_scan:
+                continue
+            elif end_scan is not None and scan > end_scan:
+                break
+
+            file, scan_number = get_file_and_scan(spec, mzml_file, scan)
+            writer.writerow([file, scan_number] + [
+                get_info_from_spectrum(spec, x)
+                for x in info_names_2
+            ])
+            count += 1
+
+    return count
+
+
+def _write_scan_info_task(task):
+    task = task.copy()
+    if task.get('byte_range', None) is not None:
+        task['scan_offset'] = task['start_scan'] - 1
+    return write_scan_info(**task)
+
+
+def get_scan_info_tasks(mzml_file, out_file, info_names,
+                        start_scan=None, end_scan=None,
+                        use_cache=False, cache_dir=None, shards=1):
+    task = {
+        'mzml_file': mzml_file,
+        'out_file': out_file,
+        'info_names': info_names,
+        'start_scan': start_scan,
+        'end_scan': end_scan,
+        'use_cache': use_cache,
+        'cache_dir': cache_dir
+    }
+
+    offsets = None
+    if not use_cache and shards > 1 and \
+        get_compression(mzml_file) is None:
+        offsets = read_mzml_spectrum_offsets(mzml_file)
+    if offsets is None or len(offsets) == 0:
+        return [task]
+
+    start_scan = max(start_scan or 1, 1)
+    end_scan = min(end_scan or len(offsets), len(offsets))
+    if start_scan > end_scan:
+        return [task]
+
+    ranges = split_scan_ranges(start_scan, end_scan, shards)
+    spectrum_list_end = None
+    if ranges[-1][1] == len(offsets):
+        spectrum_list_end = find_spectrum_list_end(mzml_file, offsets[-1])
+        if spectrum_list_end is None:
+            return [task]
+
+    tasks = []
+    for i, (start, end) in enumerate(ranges):
+        shard_task = task.copy()
+        shard_task.update({
+            'out_file': out_file + '.part' + str(i),
+            'start_scan': start,
+            'end_scan': end,
+            'header': i == 0,
+            'byte_range': (
+                offsets[0],
+                offsets[start - 1],
+                offsets[end] if end < len(offsets) else spectrum_list_end
+            )
+        })
+        tasks.append(shard_task)
+    return tasks
+
+
+def merge_scan_info(out_file, part_files):
+    if len(part_files) == 1 and part_files[0] == out_file:
+        return
+
+    with open(out_file, 'wb') as out:
+        for part_file in part_files:
+            with open(part_file, 'rb') as f:
+                shutil.copyfileobj(f, out)
+            os.remove(part_file)
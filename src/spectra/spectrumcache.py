@@ -0,0 +1,266 @@
+import os
+import json
+import numpy as np
+
+
+SPECTRUM_CACHE_VERSION = 2
+
+SPECTRUM_HEADER_DTYPE = np.dtype([
+    ('msLevel', np.int8),
+    ('ms1', np.bool_),
+    ('rt', np.float64),
+    ('isolationWindowLowerLimit', np.float64),
+    ('isolationWindowUpperLimit', np.float64),
+    ('precursorMZ', np.float64),
+    ('precursorCharge', np.float64),
+    ('window', np.int32)
+])
+
+
+class SpectrumCache():
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+        manifest_file = os.path.join(cache_dir, 'manifest.json')
+        with open(manifest_file, 'r') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('version', None) != SPECTRUM_CACHE_VERSION:
+            raise ValueError('invalid spectrum cache version: ' + \
+                             str(self.manifest.get('version', None)))
+
+        def load_column(name):
+            count = self.manifest['peakCount']
+            if count == 0:
+                return np.zeros(0, dtype=self.manifest['dtype'][name])
+            return np.memmap(
+                os.path.join(cache_dir, name + '.bin'),
+                dtype=self.manifest['dtype'][name],
+                mode='r', shape=(count,)
+            )
+
+        self.mz = load_column('mz')
+        self.intensity = load_column('intensity')
+        self.offsets = np.load(os.path.join(cache_dir, 'offsets.npy'))
+        self.header = np.load(os.path.join(cache_dir, 'header.npy'))
+        self.rt_index = np.load(os.path.join(cache_dir, 'rt_index.npy'))
+        self.windows = np.load(os.path.join(cache_dir, 'windows.npy'))
+
+        with open(os.path.join(cache_dir, 'metadata.jsonl'), 'r') as f:
+            self.metadata = f.read().splitlines()
+
+
+    def __len__(self):
+        return len(self.header)
+
+
+    def get_peaks(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.mz[start:end], self.intensity[start:end]
+
+
+    def get_metadata(self, index):
+        return json.loads(self.metadata[index])
+
+
+    def select(self, ms_level=None, rt_range=None, isolation_window_mz=None):
+        if rt_range is not None:
+            rt = self.header['rt'][self.rt_index]
+            start, end = 0, len(rt)
+            if rt_range[0] is not None:
+                start = np.searchsorted(rt, rt_range[0], side='left')
+            if rt_range[1] is not None:
+                end = np.searchsorted(rt, rt_range[1], side='right')
+            index = np.sort(self.rt_index[start:end])
+
+            unknown = np.where(np.isnan(self.header['rt']))[0]
+            if len(unknown) > 0:
+                index = np.union1d(index, unknown)
+        else:
+            index = np.arange(len(self.header))
+
+        header = self.header[index]
+        mask = np.ones(len(index), dtype=bool)
+
+        if ms_level is not None:
+            if isinstance(ms_level, int):
+                ms_level = {ms_level}
+            mask &= np.isin(header['msLevel'], list(ms_level)) | \
+                (header['msLevel'] == 0)
+
+        if isolation_window_mz is not None:
+            windows = np.where(
+                (self.windows[:, 0] <= isolation_window_mz) & \
+                (self.windows[:, 1] >= isolation_window_mz)
+            )[0]
+            mask &= (header['msLevel'] <= 1) | \
+                (header['window'] < 0) | \
+                np.isin(header['window'], windows)
+
+        return index[mask]
+
+
+def spectrum_cache_dir(file, cache_dir=None):
+    if cache_dir is not None:
+        return os.path.join(cache_dir, os.path.basename(file) + '.cache')
+    return file + '.cache'
+
+
+def get_source_info(source):
+    stat = os.stat(source)
+    return {
+        'size': stat.st_size,
+        'mtime': repr(stat.st_mtime)
+    }
+
+
+def load_spectrum_cache(file, cache_dir=None):
+    cache_dir = spectrum_cache_dir(file, cache_dir=cache_dir)
+
+    manifest_file = os.path.join(cache_dir, 'manifest.json')
+    if not os.path.exists(manifest_file):
+        return None
+
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('version', None) != SPECTRUM_CACHE_VERSION or \
+        manifest.get('source', None) != get_source_info(file):
+        return None
+
+    return SpectrumCache(cache_dir)
+
+
+def build_spectrum_cache(file, cache_dir=None):
+    from .mzmlreader import MzmlReader, mzml_reader_parameters
+
+    cache_dir = spectrum_cache_dir(file, cache_dir=cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    manifest_file = os.path.join(cache_dir, 'manifest.json')
+    if os.path.exists(manifest_file):
+        os.remove(manifest_file)
+
+    parameters = mzml_reader_parameters()
+    data_paths = {}
+    for ms, data_params in parameters['data'].items():
+        for key, param in data_params.items():
+            param['dtype'] = np.float64
+        data_paths[ms] = {
+            key: param['path']
+            for key, param in data_params.items()
+        }
+
+    def pop_value(d, path):
+        for field in path[:-1]:
+            d = d.get(field, None)
+            if not isinstance(d, dict):
+                return None
+        return d.pop(path[-1], None)
+
+    def get_value(d, path):
+        for field in path:
+            if not isinstance(d, dict):
+                return None
+            d = d.get(field, None)
+        return d
+
+    def to_float(x):
+        return float(x) if x is not None else np.nan
+
+    offsets = [0]
+    header = []
+    windows = {}
+
+    reader = MzmlReader(file, parameters=parameters)
+    with open(os.path.join(cache_dir, 'mz.bin'), 'wb') as mz_file, \
+        open(os.path.join(cache_dir, 'intensity.bin'), 'wb') as intensity_file, \
+        open(os.path.join(cache_dir, 'metadata.jsonl'), 'w') as metadata_file:
+        while True:
+            spec = reader.read_spectrum()
+            if spec is None:
+                break
+
+            ms_level = spec.get('msLevel', None)
+            ms1 = get_value(spec, data_paths['MS1']['mz']) is not None
+            if ms_level is None and ms1:
+                ms_level = 1
+            paths = data_paths['MS1' if ms1 else 'MSn']
+
+            mz = pop_value(spec, paths['mz'])
+            intensity = pop_value(spec, paths['intensity'])
+            if mz is None:
+                mz = np.zeros(0, dtype=np.float64)
+            if intensity is None:
+                intensity = np.zeros(0, dtype=np.float64)
+            mz_file.write(mz.tobytes())
+            intensity_file.write(intensity.tobytes())
+            offsets.append(offsets[-1] + len(mz))
+
+            target = get_value(spec, ['metadata', 'isolationWindowTargetMZ'])
+            if target is not None:
+                window = (
+                    target - (get_value(spec, ['metadata', 'isolationWindowLowerOffset']) or 0.0),
+                    target + (get_value(spec, ['metadata', 'isolationWindowUpperOffset']) or 0.0)
+                )
+                window_index = windows.setdefault(window, len(windows))
+            else:
+                window = (np.nan, np.nan)
+                window_index = -1
+
+            header.append((
+                ms_level or 0,
+                ms1,
+                to_float(spec.get('rt', None)),
+                window[0],
+                window[1],
+                to_float(spec.get('precursorMZ', None)),
+                to_float(spec.get('precursorCharge', None)),
+                window_index
+            ))
+            metadata_file.write(json.dumps(spec) + '\n')
+
+    header = np.array(header, dtype=SPECTRUM_HEADER_DTYPE)
+    np.save(os.path.join(cache_dir, 'header.npy'), header)
+    np.save(
+        os.path.join(cache_dir, 'offsets.npy'),
+        np.array(offsets, dtype=np.int64)
+    )
+    np.save(
+        os.path.join(cache_dir, 'rt_index.npy'),
+        np.argsort(header['rt'], kind='mergesort')
+    )
+    np.save(
+        os.path.join(cache_dir, 'windows.npy'),
+        np.array(
+            sorted(windows, key=windows.get),
+            dtype=np.float64
+        ).reshape(-1, 2)
+    )
+
+    with open(manifest_file, 'w') as f:
+        json.dump({
+            'version': SPECTRUM_CACHE_VERSION,
+            'source': get_source_info(file),
+            'spectrumCount': len(header),
+            'peakCount': offsets[-1],
+            'dtype': {
+                'mz': 'float64',
+                'intensity': 'float64'
+            },
+            'dataPaths': data_paths
+        }, f, indent=2)
+
+    return SpectrumCache(cache_dir)
+
+
+def open_spectrum_cache(file, cache_dir=None, rebuild=False):
+    cache = None
+    if not rebuild:
+        cache = load_spectrum_cache(file, cache_dir=cache_dir)
+    if cache is None:
+        cache = build_spectrum_cache(file, cache_dir=cache_dir)
+    return cache
+
+
+def build_spectrum_cache_task(task):
+    cache = open_spectrum_cache(**task)
+    return cache.cache_dir, len(cache), cache.manifest['peakCount']
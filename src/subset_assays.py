@@ -84,7 +84,8 @@ if globals().get('out_file', None) is None:
     out_file += '_subset.assay.pickle'
 
 # %%
-from util import save_pickle, load_pickle
+from util import save_pickle
+from assay import load_assays
 import numpy as np
 import pandas as pd
 
@@ -141,7 +142,7 @@ assays = []
 for assay_file in assay_files:
     logging.info('loading assays: ' + assay_file)
 
-    assay_data = load_pickle(assay_file)
+    assay_data = load_assays(assay_file)
     assays.extend(assay_data)
 
     logging.info('assays loaded: {0}, {1} spectra' \
@@ -49,11 +49,11 @@ logging.info('data loaded: {0} entries' \
 
 
 # %%
-from util import load_pickle
+from assay import load_assays
 
 logging.info('load ions: ' + assay_file)
 
-assays = load_pickle(assay_file)
+assays = load_assays(assay_file)
 
 logging.info('assays loaded: {0}, {1} entries' \
                 .format(assay_file, len(assays)))
@@ -65,12 +65,16 @@ from assay.values import assign_assays_values
 
 
 logging.info('assigning data')
-assign_assays_values(
+_, unmatched = assign_assays_values(
     assays, data=data,
     keys=[{'name': 'sequence', 'path': 'peptideSequence'}],
-    params=[{'name': 'protein', 'path': ['metadata', 'protein']}]
+    params=[{'name': 'protein', 'path': ['metadata', 'protein']}],
+    return_unmatched=True
 )
 
+logging.info('data assigned: {0} matched, {1} unmatched' \
+    .format(len(assays) - len(unmatched), len(unmatched)))
+
 
 
 # %%
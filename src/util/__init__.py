@@ -1 +1,3 @@
 from .io import *
+from .parallel import *
+from .dicts import *
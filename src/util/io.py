@@ -1,8 +1,16 @@
 import os
 import re
+import io
 import itertools
 import pickle
 import json
+import gzip
+import bz2
+import lzma
+import zlib
+import struct
+from collections import deque
+from multiprocessing.pool import ThreadPool
 
 def list_files(path='.', pattern=None, recursive=False, include_dirs=False):
     if recursive:
@@ -24,21 +32,187 @@ def list_files(path='.', pattern=None, recursive=False, include_dirs=False):
         ]
 
 
+COMPRESSION_EXTENSIONS = {
+    '.gz': 'gzip',
+    '.bz2': 'bz2',
+    '.xz': 'xz'
+}
+
+COMPRESSION_MAGIC = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz')
+]
+
+
+def get_compression(file, mode='r'):
+    if not isinstance(file, str):
+        return None
+    
+    compression = COMPRESSION_EXTENSIONS.get(
+        os.path.splitext(file)[1].lower(), None
+    )
+    if compression is not None or 'r' not in mode or \
+        not os.path.isfile(file):
+        return compression
+    
+    with open(file, 'rb') as f:
+        head = f.read(6)
+    for magic, compression in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def open_file(file, mode='r', compression='infer', processes=None, 
+              **kwargs):
+    if compression == 'infer':
+        compression = get_compression(file, mode=mode)
+        
+    if compression is None or compression == 'none':
+        return open(file, mode, **kwargs)
+    
+    if 'b' not in mode and 't' not in mode:
+        mode += 't'
+    
+    if compression == 'gzip':
+        if 'r' in mode and processes is not None and processes > 1 and \
+            is_bgzf(file):
+            f = io.BufferedReader(
+                ParallelGzipReader(file, processes=processes),
+                buffer_size=1 << 20
+            )
+            if 'b' not in mode:
+                f = io.TextIOWrapper(f, **kwargs)
+            return f
+        return gzip.open(file, mode, **kwargs)
+    elif compression == 'bz2':
+        return bz2.open(file, mode, **kwargs)
+    elif compression == 'xz':
+        return lzma.open(file, mode, **kwargs)
+    else:
+        raise ValueError('invalid compression: ' + str(compression))
+
+
+def read_gzip_member_size(f):
+    header = f.read(12)
+    if len(header) == 0:
+        return 0
+    if len(header) < 12 or header[:2] != b'\x1f\x8b' or \
+        not header[3] & 4:
+        return None
+    
+    xlen = struct.unpack('<H', header[10:12])[0]
+    extra = f.read(xlen)
+    i = 0
+    while i + 4 <= len(extra):
+        slen = struct.unpack('<H', extra[i + 2:i + 4])[0]
+        if extra[i:i + 2] == b'BC' and slen == 2:
+            return struct.unpack('<H', extra[i + 4:i + 6])[0] + 1
+        i += 4 + slen
+    return None
+
+
+def is_bgzf(file):
+    with open(file, 'rb') as f:
+        size = read_gzip_member_size(f)
+    return size is not None and size > 0
+
+
+def iter_gzip_members(file, batch_size=1 << 22):
+    with open(file, 'rb') as f:
+        batch = []
+        batch_bytes = 0
+        while True:
+            offset = f.tell()
+            size = read_gzip_member_size(f)
+            if size == 0:
+                break
+            if size is None:
+                raise ValueError('invalid BGZF member at offset ' + \
+                                 str(offset) + ': ' + str(file))
+            
+            f.seek(offset)
+            member = f.read(size)
+            batch.append(member)
+            batch_bytes += len(member)
+            if batch_bytes >= batch_size:
+                yield batch
+                batch = []
+                batch_bytes = 0
+                
+        if len(batch) > 0:
+            yield batch
+
+
+def decompress_gzip_members(members):
+    return b''.join(zlib.decompress(m, 31) for m in members)
+
+
+class ParallelGzipReader(io.RawIOBase):
+    def __init__(self, file, processes=None, batch_size=1 << 22):
+        if processes is None:
+            processes = os.cpu_count() or 1
+        self.name = file
+        self.pool = ThreadPool(processes=processes)
+        self.members = iter_gzip_members(file, batch_size=batch_size)
+        # at most 2 batches per thread are read and decompressed ahead of
+        # the consumer, so that memory use does not grow with the file
+        self.max_pending = 2 * processes
+        self.pending = deque()
+        self.fill()
+        self.buffer = memoryview(b'')
+        self.position = 0
+        
+    def fill(self):
+        while len(self.pending) < self.max_pending:
+            batch = next(self.members, None)
+            if batch is None:
+                break
+            self.pending.append(self.pool.apply_async(
+                decompress_gzip_members, (batch,)
+            ))
+
+    def readable(self):
+        return True
+    
+    def readinto(self, b):
+        while self.position >= len(self.buffer):
+            if len(self.pending) == 0:
+                return 0
+            chunk = self.pending.popleft().get()
+            self.fill()
+            self.buffer = memoryview(chunk)
+            self.position = 0
+        
+        n = min(len(b), len(self.buffer) - self.position)
+        b[:n] = self.buffer[self.position:self.position + n]
+        self.position += n
+        return n
+    
+    def close(self):
+        if not self.closed:
+            self.pool.terminate()
+            self.pool.join()
+            self.pending.clear()
+            self.members.close()
+        super(ParallelGzipReader, self).close()
+    
+
 def save_json(data, file, **kwargs):
-    with open(file, 'w') as f:
+    with open_file(file, 'w') as f:
         json.dump(data, f, **kwargs)        
 
 def load_json(file, **kwargs):
-    with open(file, 'r') as f:
+    with open_file(file, 'r') as f:
         return json.load(f, **kwargs)
     
 
 def save_pickle(data, file, **kwargs):
-    with open(file, 'wb') as f:
+    with open_file(file, 'wb') as f:
         pickle.dump(data, f, **kwargs)
         
-def load_pickle(file, **kwargs):
-    with open(file, 'rb') as f:
+def load_pickle(file, processes=None, **kwargs):
+    with open_file(file, 'rb', processes=processes) as f:
         return pickle.load(f, **kwargs)
     
-    
\ No newline at end of file
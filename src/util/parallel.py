@@ -0,0 +1,31 @@
+import multiprocessing
+
+
+def parallel_map(func, iterable, processes=None, chunksize=1):
+    if processes is None or processes <= 1:
+        for result in map(func, iterable):
+            yield result
+        return
+    
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        for result in pool.imap(func, iterable, chunksize=chunksize):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        
+        
+def split_chunks(sequence, chunks):
+    if chunks <= 1 or len(sequence) == 0:
+        return [sequence]
+    
+    size = -(-len(sequence) // chunks)
+    return [
+        sequence[i:i + size]
+        for i in range(0, len(sequence), size)
+    ]
+    
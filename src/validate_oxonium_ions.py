@@ -12,15 +12,18 @@ import click
 @click.option('--remove_background/--no-remove_background', 'background_estimator', default=True, show_default=True, help='Remove background signals.')
 @click.option('--absolute_intensity', default=10, show_default=True, type=float, help='Minimum absolute intensity to consider a peak.')
 @click.option('--relative_intensity', default=0.05, show_default=True, type=float, help='Minimum relative intensity to consider a peak.')
+@click.option('--cache/--no-cache', 'use_cache', default=False, show_default=True, help='Read spectra from memory-mapped spectrum caches, building them if needed.')
 def oxonium(report_file, mzml_files, out_file,
             mz_tolerance, mz_tolerance_unit,
-            background_estimator, absolute_intensity, relative_intensity):    
+            background_estimator, absolute_intensity, relative_intensity,
+            use_cache):    
     validate_oxonium_ions(
         report_file, mzml_files, out_file, 
         mz_tolerance=mz_tolerance, mz_tolerance_unit=mz_tolerance_unit,
         background_estimator=background_estimator,
         absolute_intensity=absolute_intensity,
-        relative_intensity=relative_intensity
+        relative_intensity=relative_intensity,
+        use_cache=use_cache
     )
     
 